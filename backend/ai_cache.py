@@ -0,0 +1,150 @@
+"""
+Cache for AI chatbot responses
+
+Patients ask the same general questions again and again, so successful AI
+replies are cached under the normalized message, the user's role and the
+model. Entries expire after a TTL; the in-process backend also evicts the
+least recently used entry once it is full. A Redis backend can be used to
+share the cache between workers.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_message(message):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    message = _PUNCTUATION.sub(' ', message.lower())
+    return _WHITESPACE.sub(' ', message).strip()
+
+class MemoryCacheBackend:
+    """In-process TTL cache with LRU eviction"""
+
+    def __init__(self, max_entries=1000, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class RedisCacheBackend:
+    """Shared cache in Redis
+
+    Expiry uses Redis TTLs; configure ``maxmemory-policy allkeys-lru`` on the
+    server for size-bounded LRU eviction.
+    """
+
+    def __init__(self, url, prefix='nutripulse:ai:', setting='AI_CACHE_BACKEND'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(f'{setting}=redis requires the redis package') from e
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self._redis.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._redis.set(self.prefix + key, value.encode('utf-8'), ex=int(ttl))
+
+    def clear(self):
+        for key in self._redis.scan_iter(match=self.prefix + '*'):
+            self._redis.delete(key)
+
+class ResponseCache:
+    """AI response cache with hit and miss counters"""
+
+    def __init__(self, backend, ttl=86400):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def key(message, user_role, model):
+        raw = f"{model}|{user_role}|{normalize_message(message)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+def init_app(app):
+    """Create the AI response cache for this app, or None if disabled"""
+    backend_name = app.config.get('AI_CACHE_BACKEND', 'memory')
+
+    if backend_name == 'memory':
+        backend = MemoryCacheBackend(max_entries=app.config.get('AI_CACHE_MAX_ENTRIES', 1000))
+    elif backend_name == 'redis':
+        backend = RedisCacheBackend(app.config['AI_CACHE_REDIS_URL'])
+    elif backend_name == 'none':
+        app.extensions['ai_cache'] = None
+        return
+    else:
+        raise ValueError(f'Unknown AI_CACHE_BACKEND: {backend_name}')
+
+    app.extensions['ai_cache'] = ResponseCache(backend, ttl=app.config.get('AI_CACHE_TTL', 86400))
+
+def get_ai_cache():
+    """The AI response cache of the current app, or None if caching is disabled"""
+    return current_app.extensions.get('ai_cache')
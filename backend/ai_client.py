@@ -0,0 +1,251 @@
+"""
+HTTP client for the AI provider
+
+One client is created per app and shared by every request, so connections
+(and their TLS sessions) are pooled and kept alive between chat messages.
+Connection failures and retryable statuses are retried a bounded number of
+times with jittered backoff (a completion POST that timed out reading is
+not, as the provider may already be answering it), and a circuit breaker makes callers fail fast while the provider is down.
+"""
+
+import json
+import random
+import threading
+import time
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+# Statuses worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+class AIProviderError(Exception):
+    """The AI provider could not produce a response"""
+
+class AIProviderUnavailable(AIProviderError):
+    """The circuit breaker is open, so the provider was not called"""
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure circuit breaker
+
+    Closed: calls go through. After ``failure_threshold`` consecutive failures
+    the breaker opens and rejects calls for ``reset_timeout`` seconds. It then
+    lets a single trial call through (half-open); success closes it again,
+    failure re-opens it, and a call abandoned by its caller releases the
+    trial for the next one.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow_request(self):
+        """Return True if a call may be made now"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Free the half-open trial slot of a call that ended without an outcome
+
+        For calls abandoned by the caller, such as a stream closed when the
+        client disconnects: the breaker stays half-open and the next call
+        becomes the trial.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+class AIClient:
+    """Pooled, retrying client for an OpenAI-style chat completions API"""
+
+    def __init__(self, api_key, api_url, model, pool_size=10, connect_timeout=3.05,
+                 read_timeout=30.0, max_retries=2, backoff=0.5, backoff_max=4.0,
+                 breaker=None):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        # Called with (seconds, outcome) after every attempt; set by metrics.init_app
+        self.latency_observer = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            api_key=config.get('AI_API_KEY'),
+            api_url=config.get('AI_API_URL'),
+            model=config.get('AI_MODEL'),
+            pool_size=config.get('AI_POOL_SIZE', 10),
+            connect_timeout=config.get('AI_CONNECT_TIMEOUT', 3.05),
+            read_timeout=config.get('AI_READ_TIMEOUT', 30.0),
+            max_retries=config.get('AI_MAX_RETRIES', 2),
+            backoff=config.get('AI_RETRY_BACKOFF', 0.5),
+            backoff_max=config.get('AI_RETRY_BACKOFF_MAX', 4.0),
+            breaker=CircuitBreaker(
+                failure_threshold=config.get('AI_CIRCUIT_FAILURE_THRESHOLD', 5),
+                reset_timeout=config.get('AI_CIRCUIT_RESET_TIMEOUT', 30.0)
+            )
+        )
+
+    @property
+    def configured(self):
+        return bool(self.api_key and self.api_url)
+
+    def _sleep_before_retry(self, attempt):
+        """Exponential backoff with full jitter"""
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt))))
+
+    def _observe(self, started, outcome):
+        if self.latency_observer is not None:
+            self.latency_observer(time.perf_counter() - started, outcome)
+
+    def _post(self, payload, stream=False):
+        """POST to the provider with retries, returning a 200 response
+
+        Raises AIProviderUnavailable when the breaker is open and
+        AIProviderError once retries are exhausted.
+        """
+        if not self.breaker.allow_request():
+            raise AIProviderUnavailable('AI provider circuit is open')
+
+        last_error = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    self._sleep_before_retry(attempt - 1)
+                started = time.perf_counter()
+                try:
+                    response = self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=stream)
+                except requests.exceptions.ConnectionError as e:
+                    # Includes ConnectTimeout: the request may not have reached the provider
+                    self._observe(started, 'error')
+                    last_error = e
+                    continue
+                except requests.exceptions.RequestException as e:
+                    # A read timeout may mean the provider is still working on (and
+                    # billing) the prompt; resending it would only hold the worker longer
+                    self._observe(started, 'error')
+                    last_error = e
+                    break
+                self._observe(started, str(response.status_code))
+
+                if response.status_code == 200:
+                    return response
+
+                last_error = AIProviderError(f'AI provider returned {response.status_code}')
+                response.close()
+                if response.status_code not in RETRYABLE_STATUSES:
+                    break
+        except BaseException:
+            # Every call must end with an outcome, or a half-open trial never finishes
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_failure()
+        if isinstance(last_error, AIProviderError):
+            raise last_error
+        raise AIProviderError('AI provider request failed') from last_error
+
+    def _payload(self, messages, **options):
+        payload = {'model': self.model, 'messages': messages}
+        payload.update(options)
+        return payload
+
+    def complete(self, messages, **options):
+        """Return the assistant message content for a chat completion"""
+        response = self._post(self._payload(messages, **options))
+        try:
+            content = response.json()['choices'][0]['message']['content']
+        except (ValueError, LookupError, TypeError, AttributeError) as e:
+            self.breaker.record_failure()
+            raise AIProviderError('Malformed AI provider response') from e
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return content
+
+    def stream(self, messages, **options):
+        """Yield content chunks of a streamed chat completion"""
+        response = self._post(self._payload(messages, stream=True, **options), stream=True)
+        try:
+            # OpenAI-style event stream: "data: {json}" lines ending with "data: [DONE]"
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                content = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                if content:
+                    yield content
+        except GeneratorExit:
+            # Closed before the end, e.g. the SSE client disconnected: says
+            # nothing about the provider, but must not keep the trial slot
+            self.breaker.release_trial()
+            raise
+        except (requests.exceptions.RequestException, ValueError, LookupError, TypeError, AttributeError) as e:
+            self.breaker.record_failure()
+            raise AIProviderError('AI provider stream failed') from e
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+        finally:
+            response.close()
+        self.breaker.record_success()
+
+def init_app(app):
+    """Create the shared AI client for this app"""
+    app.extensions['ai_client'] = AIClient.from_config(app.config)
+
+def get_ai_client():
+    """The AI client of the current app"""
+    return current_app.extensions['ai_client']
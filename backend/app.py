@@ -1,9 +1,18 @@
-from flask import Flask, jsonify
-from flask_jwt_extended import JWTManager
+from flask import Flask, jsonify, request
+from flask_jwt_extended import JWTManager, jwt_required
 from flask_migrate import Migrate
 from flask_cors import CORS
 from models import db
 from config import config
+import ai_client
+import ai_cache
+import topics
+import db_pool
+import db_routing
+import metrics
+import sql_profiler
+import health
+import json_provider
 import os
 
 # Import route blueprints
@@ -11,6 +20,9 @@ from routes.auth import auth_bp
 from routes.patients import patients_bp
 from routes.chatbot import chatbot_bp
 from routes.reports import reports_bp
+from routes.exports import exports_bp
+from routes.internal import internal_bp
+from routes.decorators import nurse_required, reset_current_user
 
 def create_app(config_name='default'):
     """Application factory pattern"""
@@ -19,17 +31,37 @@ def create_app(config_name='default'):
     # Load configuration
     app.config.from_object(config[config_name])
     
-    # Initialize extensions
+    # Responses are encoded with orjson when available
+    json_provider.init_app(app)
+    
+    # Initialize extensions (pool instrumentation must precede the engines)
+    db_pool.init_app(app)
     db.init_app(app)
     jwt = JWTManager(app)
     migrate = Migrate(app, db)
     CORS(app, resources={r"/*": {"origins": "*"}})
+    ai_client.init_app(app)
+    ai_cache.init_app(app)
+    topics.init_app(app)
+    health.init_app(app)
+    
+    # Request metrics come first so their timing covers the other hooks
+    metrics.init_app(app)
+    sql_profiler.init_app(app)
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(patients_bp, url_prefix='/patients')
     app.register_blueprint(chatbot_bp, url_prefix='/chatbot')
     app.register_blueprint(reports_bp, url_prefix='/reports')
+    app.register_blueprint(exports_bp, url_prefix='/exports')
+    app.register_blueprint(internal_bp, url_prefix='/internal')
+    
+    # The current user is cached on flask.g per request
+    app.before_request(reset_current_user)
+    
+    # Read-only requests read from a replica when replicas are configured
+    db_routing.init_app(app)
     
     # Error handlers
     @app.errorhandler(400)
@@ -60,12 +92,42 @@ def create_app(config_name='default'):
     # Health check endpoint
     @app.route('/health', methods=['GET'])
     def health_check():
-        """Health check endpoint for monitoring"""
-        return jsonify({
+        """Health check endpoint for monitoring
+        
+        With ?deep=1 the databases are checked too (cached for
+        HEALTH_CHECK_CACHE_SECONDS), and 503 is returned if one is unreachable.
+        """
+        body = {
             'status': 'healthy',
             'message': 'NutriPulse Health & Nutrition System is running',
             'version': '1.0.0'
-        }), 200
+        }
+        if request.args.get('deep') not in (None, '', '0', 'false'):
+            healthy, databases, age = health.database_check().result()
+            body.update(databases=databases, checked_seconds_ago=age)
+            if not healthy:
+                body.update(status='unhealthy', message='A database is unreachable')
+                return jsonify(body), 503
+        return jsonify(body), 200
+    
+    # Prometheus scrape endpoint
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Request, database and AI provider metrics in Prometheus text format"""
+        if not app.config.get('METRICS_ENABLED', True):
+            return jsonify({'error': 'Not found', 'message': 'Resource not found'}), 404
+        def render():
+            return metrics.metrics_response(db_pool.pool_stats())
+        
+        token = app.config.get('METRICS_TOKEN')
+        if token:
+            if request.headers.get('Authorization') != f'Bearer {token}':
+                return jsonify({'error': 'Unauthorized', 'message': 'Authentication required'}), 401
+            return render()
+        if app.config.get('METRICS_PUBLIC', False):
+            return render()
+        # Fail closed: without a token only nurses may read metrics
+        return jwt_required()(nurse_required(render))()
     
     # Root endpoint
     @app.route('/', methods=['GET'])
@@ -82,21 +144,35 @@ def create_app(config_name='default'):
                     'profile': 'GET /auth/profile'
                 },
                 'patients': {
+                    'list_patients': 'GET /patients',
                     'get_patient': 'GET /patients/<id>',
                     'get_records': 'GET /patients/<id>/records',
                     'add_record': 'POST /patients/<id>/records',
                     'get_nutrition': 'GET /patients/<id>/nutrition',
                     'add_nutrition': 'POST /patients/<id>/nutrition',
+                    'add_batch': 'POST /patients/records:batch',
                     'update_patient': 'PUT /patients/<id>/update'
                 },
                 'chatbot': {
                     'chat': 'POST /chatbot/chat',
+                    'chat_stream': 'POST /chatbot/chat/stream',
                     'history': 'GET /chatbot/history',
-                    'clear_history': 'DELETE /chatbot/clear-history'
+                    'clear_history': 'DELETE /chatbot/clear-history',
+                    'cache_stats': 'GET /chatbot/cache-stats'
                 },
                 'reports': {
                     'generate_report': 'GET /reports/<id>',
                     'get_summary': 'GET /reports/<id>/summary'
+                },
+                'internal': {
+                    'pool_stats': 'GET /internal/pool-stats'
+                },
+                'monitoring': {
+                    'health': 'GET /health?deep=1',
+                    'metrics': 'GET /metrics'
+                },
+                'exports': {
+                    'export_table': 'GET /exports/<health_records|nutrition_plans|chat_history>?format=ndjson|csv&since=<watermark>'
                 }
             },
             'sdg_support': {
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark of every auth, patients, reports and chatbot route
+
+Builds the app with create_app('testing') on a file-backed SQLite database
+(and on MySQL too when BENCH_MYSQL_URL is set or --database-url points there),
+seeds synthetic patients, records, plans and chats, then calls each route in
+process through the Flask test client. The AI provider is replaced by an
+instant stub. Prints p50/p95/p99 latency and SQL statements per request, and
+compares them with a saved baseline.
+
+    python -m benchmarks.bench_endpoints
+    python -m benchmarks.bench_endpoints --patients 2000 --records-per-patient 100 --iterations 300
+    python -m benchmarks.bench_endpoints --save-baseline benchmarks/endpoints_baseline.json
+    python -m benchmarks.bench_endpoints --baseline benchmarks/endpoints_baseline.json
+    BENCH_MYSQL_URL=mysql+pymysql://user:pw@localhost/bench python -m benchmarks.bench_endpoints
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy.engine import make_url
+
+import sql_profiler
+from app import create_app
+from benchmarks.loadgen import percentile
+from config import config, TestingConfig
+from models import db
+from seed import seed, HOSPITALS, QUESTIONS
+
+PASSWORD = 'benchmark-password'
+EMAIL_DOMAIN = 'bench.local'
+# Arguments that must match for results to be comparable with a baseline
+SETTINGS = ('nurses', 'patients', 'records_per_patient', 'plans_per_patient', 'chats_per_patient',
+            'iterations', 'ai_latency_ms', 'seed')
+STUB_REPLY = 'Eat a balanced diet with plenty of vegetables, and ask your nurse before changing medication.'
+
+class StubAIClient:
+    """Stands in for the AI provider and answers after a fixed delay"""
+
+    model = 'benchmark-stub'
+    configured = True
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def complete(self, messages, **options):
+        time.sleep(self.latency)
+        return STUB_REPLY
+
+    def stream(self, messages, **options):
+        time.sleep(self.latency)
+        for word in STUB_REPLY.split(' '):
+            yield word + ' '
+
+def make_app(database_url, ai_latency):
+    class BenchmarkConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = database_url
+
+    config['benchmark'] = BenchmarkConfig
+    app = create_app('benchmark')
+    app.extensions['ai_client'] = StubAIClient(ai_latency)
+    # The profiler counts queries here; its N+1 warnings would drown the results
+    app.logger.setLevel(logging.ERROR)
+    return app
+
+def seed_data(args):
+    """Recreate the schema and bulk insert the synthetic data set"""
+    db.drop_all()
+    db.create_all()
+    counts = seed(args.patients, nurses=args.nurses, records_per_patient=args.records_per_patient,
+                  plans_per_patient=args.plans_per_patient, chats_per_patient=args.chats_per_patient,
+                  seed=args.seed, chunk_size=args.chunk_size, password=PASSWORD, email_domain=EMAIL_DOMAIN)
+    seconds = counts.pop('seconds')
+    print(f"Seeded {sum(counts.values()):,} rows ({args.nurses} nurses, {args.patients} patients) in {seconds}s")
+
+def endpoints(args):
+    """(name, request builder) pairs; each builder returns (method, url, options) for a random target"""
+    nurse_headers = {'Authorization': f'Bearer {create_access_token(identity=1)}'}
+    patient_ids = list(range(1, args.patients + 1))
+    # A sample of patients to act as, each with a token
+    acting = {patient_id: {'Authorization': f'Bearer {create_access_token(identity=args.nurses + patient_id)}'}
+              for patient_id in patient_ids[:50]}
+    registrations = itertools.count()
+
+    def as_nurse(method, path, **options):
+        return lambda rng: (method, path.format(id=rng.choice(patient_ids)), dict(headers=nurse_headers, **options))
+
+    def as_patient(method, path, **options):
+        def build(rng):
+            patient_id = rng.choice(list(acting))
+            body = {'message': rng.choice(QUESTIONS), 'use_cache': False} if method == 'POST' else None
+            return method, path.format(id=patient_id), dict(headers=acting[patient_id], json=body, **options)
+        return build
+
+    def register(rng):
+        body = {'name': 'New Patient', 'email': f'new{next(registrations)}@{EMAIL_DOMAIN}', 'password': PASSWORD,
+                'role': 'patient', 'age': 30, 'gender': 'other'}
+        return 'POST', '/auth/register', {'json': body}
+
+    def login(rng):
+        user_id = rng.randint(1, args.nurses + args.patients)
+        email = f"{'nurse' if user_id <= args.nurses else 'patient'}{user_id}@{EMAIL_DOMAIN}"
+        return 'POST', '/auth/login', {'json': {'email': email, 'password': PASSWORD}}
+
+    def batch(rng):
+        items = [
+            {'type': 'health_record', 'patient_id': rng.choice(patient_ids), 'checkup_notes': 'Batch checkup'}
+            if i % 2 else
+            {'type': 'nutrition_plan', 'patient_id': rng.choice(patient_ids), 'diet_plan': 'Batch plan'}
+            for i in range(20)
+        ]
+        return 'POST', '/patients/records:batch', {'headers': nurse_headers, 'json': {'items': items}}
+
+    return [
+        ('POST /auth/register', register),
+        ('POST /auth/login', login),
+        ('GET /auth/profile', as_nurse('GET', '/auth/profile')),
+        ('GET /patients', as_nurse('GET', '/patients?limit=50')),
+        ('GET /patients?hospital&stale_days', as_nurse('GET', f'/patients?hospital={HOSPITALS[0]}&stale_days=30')),
+        ('GET /patients/<id>', as_nurse('GET', '/patients/{id}')),
+        ('GET /patients/<id>/records', as_nurse('GET', '/patients/{id}/records')),
+        ('GET /patients/<id>/nutrition', as_nurse('GET', '/patients/{id}/nutrition')),
+        ('POST /patients/<id>/records', as_nurse('POST', '/patients/{id}/records',
+                                                  json={'checkup_notes': 'Follow-up', 'prescriptions': 'Iron'})),
+        ('POST /patients/<id>/nutrition', as_nurse('POST', '/patients/{id}/nutrition',
+                                                    json={'diet_plan': 'More leafy greens'})),
+        ('POST /patients/records:batch (20)', batch),
+        ('PUT /patients/<id>/update', as_nurse('PUT', '/patients/{id}/update', json={'nutrition_needs': 'Low salt'})),
+        ('GET /reports/<id>', as_nurse('GET', '/reports/{id}')),
+        ('GET /reports/<id>/summary', as_nurse('GET', '/reports/{id}/summary')),
+        ('POST /chatbot/chat', as_patient('POST', '/chatbot/chat')),
+        ('POST /chatbot/chat/stream', as_patient('POST', '/chatbot/chat/stream')),
+        ('GET /chatbot/history', as_patient('GET', '/chatbot/history')),
+        ('GET /chatbot/cache-stats', as_nurse('GET', '/chatbot/cache-stats')),
+        # Last, as it empties the histories the routes above read
+        ('DELETE /chatbot/clear-history', as_patient('DELETE', '/chatbot/clear-history')),
+    ]
+
+def run_endpoint(app, client, build, iterations, warmup, rng):
+    timings, queries, errors = [], [], 0
+    with sql_profiler.capture(app) as profiles:
+        for i in range(warmup + iterations):
+            method, url, options = build(rng)
+            started = time.perf_counter()
+            response = client.open(url, method=method, **options)
+            response.get_data()
+            response.close()
+            elapsed = (time.perf_counter() - started) * 1000
+            if i < warmup:
+                continue
+            timings.append(elapsed)
+            queries.append(profiles[-1].count)
+            if response.status_code >= 400:
+                errors += 1
+
+    timings.sort()
+    return {
+        'p50': round(percentile(timings, 50), 3),
+        'p95': round(percentile(timings, 95), 3),
+        'p99': round(percentile(timings, 99), 3),
+        'queries': round(statistics.mean(queries), 2),
+        'max_queries': max(queries),
+        'errors': errors,
+    }
+
+def run_suite(database_url, args):
+    app = make_app(database_url, args.ai_latency_ms / 1000)
+    rng = random.Random(args.seed)
+    results = {}
+    with app.app_context():
+        seed_data(args)
+        client = app.test_client()
+        for name, build in endpoints(args):
+            results[name] = run_endpoint(app, client, build, args.iterations, args.warmup, rng)
+        db.session.remove()
+        db.engine.dispose()
+    return results
+
+def print_results(label, results):
+    print(f"\n{label}")
+    print(f"{'endpoint':<38}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:<38}{result['p50']:>9.2f}{result['p95']:>9.2f}{result['p99']:>9.2f}"
+              f"{result['queries']:>9.1f}{result['errors']:>8}")
+
+def compare(label, results, baseline, tolerance):
+    """Print changes against the baseline and return the regressed endpoints"""
+    regressions = []
+    print(f"\n{label} vs baseline (p95 tolerance {tolerance:.0%})")
+    print(f"{'endpoint':<38}{'p95 before':>11}{'p95 now':>9}{'change':>9}{'queries':>12}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<38}{'new':>11}")
+            continue
+        change = result['p95'] / before['p95'] - 1 if before['p95'] else 0.0
+        # Sub-millisecond moves are noise, whatever the percentage
+        slower = change > tolerance and result['p95'] - before['p95'] > 1.0
+        more_queries = result['queries'] > before['queries'] + 0.5
+        flag = '  REGRESSION' if slower or more_queries else ''
+        print(f"{name:<38}{before['p95']:>11.2f}{result['p95']:>9.2f}{change:>+9.0%}"
+              f"{before['queries']:>6.1f} -> {result['queries']:<4.1f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', action='append',
+                        help='database to benchmark against (it will be wiped); repeatable '
+                             '(default: a SQLite file, plus BENCH_MYSQL_URL when set)')
+    parser.add_argument('--nurses', type=int, default=20)
+    parser.add_argument('--patients', type=int, default=500)
+    parser.add_argument('--records-per-patient', type=int, default=50)
+    parser.add_argument('--plans-per-patient', type=int, default=10)
+    parser.add_argument('--chats-per-patient', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=200, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests per endpoint')
+    parser.add_argument('--ai-latency-ms', type=float, default=0.0, help='delay of the stubbed AI provider')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', help='baseline JSON to compare with; exits 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown against the baseline')
+    parser.add_argument('--save-baseline', help='write these results as a baseline JSON')
+    args = parser.parse_args()
+
+    urls = args.database_url or ['sqlite:////tmp/nutripulse_bench_endpoints.db'] + \
+        ([os.environ['BENCH_MYSQL_URL']] if os.environ.get('BENCH_MYSQL_URL') else [])
+
+    all_results = {}
+    for url in urls:
+        label = make_url(url).get_backend_name()
+        try:
+            all_results[label] = run_suite(url, args)
+        except Exception as e:
+            if label == 'sqlite':
+                raise
+            print(f"\nSkipping {label}: {e}")
+            continue
+        print_results(label, all_results[label])
+
+    settings = {name: getattr(args, name) for name in SETTINGS}
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({
+                'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+                'settings': settings,
+                'results': all_results,
+            }, f, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings:
+            print(f"\nWarning: the baseline was run with different settings: {baseline['settings']}")
+        regressions = []
+        for label, results in all_results.items():
+            if label in baseline['results']:
+                regressions += compare(label, results, baseline['results'][label], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} endpoint(s) regressed")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
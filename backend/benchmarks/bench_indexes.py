@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the composite (patient_id, created_at) / (user_id, created_at) indexes
+
+Seeds a synthetic database, then runs the hot per-patient and per-user queries
+used by the patients, reports and chatbot routes twice: once without the
+composite indexes and once with them. Prints the query plan and latency of
+each query for both runs.
+
+    python -m benchmarks.bench_indexes --rows 2000000
+    python -m benchmarks.bench_indexes --database-url mysql+pymysql://user:pw@localhost/bench
+"""
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from models import db
+from seed import insert_chunked
+
+INDEXED_TABLES = ['health_records', 'nutrition_plans', 'chat_history']
+
+QUERIES = {
+    'records page': (
+        "SELECT id, checkup_notes, created_at FROM health_records "
+        "WHERE patient_id = :patient_id ORDER BY created_at DESC, id DESC LIMIT 51"
+    ),
+    'records in report window': (
+        "SELECT count(*) FROM health_records "
+        "WHERE patient_id = :patient_id AND created_at >= :since"
+    ),
+    'latest nutrition plan': (
+        "SELECT id, created_at FROM nutrition_plans "
+        "WHERE patient_id = :patient_id ORDER BY created_at DESC LIMIT 1"
+    ),
+    'chats this week': (
+        "SELECT count(*) FROM chat_history "
+        "WHERE user_id = :user_id AND created_at >= :since"
+    ),
+}
+
+def composite_indexes():
+    """The composite indexes declared on the models"""
+    return [
+        index
+        for name in INDEXED_TABLES
+        for index in db.metadata.tables[name].indexes
+        if len(index.columns) > 1
+    ]
+
+def seed(engine, rows, patients, chunk_size, rng):
+    """Create the schema without composite indexes and fill it with synthetic rows"""
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for index in composite_indexes():
+            index.drop(bind=conn)
+
+    tables = db.metadata.tables
+    now = datetime.utcnow()
+    two_years = 2 * 365 * 24 * 3600
+
+    def random_time():
+        return now - timedelta(seconds=rng.randrange(two_years))
+
+    # insert_chunked commits each chunk itself
+    with engine.connect() as conn:
+        insert_chunked(conn, tables['users'], (
+            {'id': i, 'name': f'User {i}', 'email': f'user{i}@bench.local',
+             'password_hash': 'x', 'role': 'patient' if i <= patients else 'nurse',
+             'created_at': now}
+            for i in range(1, patients + 2)
+        ), chunk_size)
+        insert_chunked(conn, tables['nurses'], [
+            {'id': 1, 'user_id': patients + 1, 'specialization': 'General', 'hospital': 'Bench General'}
+        ], chunk_size)
+        insert_chunked(conn, tables['patients'], (
+            {'id': i, 'user_id': i, 'age': 30 + i % 50, 'gender': 'other'}
+            for i in range(1, patients + 1)
+        ), chunk_size)
+
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        insert_chunked(conn, tables['health_records'], (
+            {'patient_id': rng.randint(1, patients), 'nurse_id': 1,
+             'checkup_notes': 'Routine checkup', 'created_at': random_time()}
+            for _ in range(rows)
+        ), chunk_size)
+        insert_chunked(conn, tables['nutrition_plans'], (
+            {'patient_id': rng.randint(1, patients), 'nurse_id': 1,
+             'diet_plan': 'Balanced diet', 'created_at': random_time()}
+            for _ in range(rows // 2)
+        ), chunk_size)
+        insert_chunked(conn, tables['chat_history'], (
+            {'user_id': rng.randint(1, patients), 'role': 'user',
+             'message': 'How much protein should I eat?', 'created_at': random_time()}
+            for _ in range(rows)
+        ), chunk_size)
+    print(f"Seeded {rows + rows // 2 + rows:,} rows in {time.perf_counter() - started:.1f}s")
+
+def explain(conn, sql, params):
+    """Return the query plan as printable lines"""
+    if conn.dialect.name == 'sqlite':
+        plan = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+        return [row[-1] for row in plan]
+    plan = conn.execute(text(f"EXPLAIN {sql}"), params)
+    columns = list(plan.keys())
+    return [', '.join(f'{col}={val}' for col, val in zip(columns, row)) for row in plan]
+
+def run_queries(engine, patients, iterations, rng):
+    """Time each hot query against random patients"""
+    results = {}
+    since_week = datetime.utcnow() - timedelta(days=7)
+    since_report = datetime.utcnow() - timedelta(days=180)
+
+    with engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.execute(text('ANALYZE'))
+        else:
+            for name in INDEXED_TABLES:
+                conn.execute(text(f'ANALYZE TABLE {name}'))
+
+        for label, sql in QUERIES.items():
+            timings = []
+            for _ in range(iterations):
+                patient_id = rng.randint(1, patients)
+                params = {'patient_id': patient_id, 'user_id': patient_id,
+                          'since': since_week if 'week' in label else since_report}
+                started = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+
+            timings.sort()
+            results[label] = {
+                'plan': explain(conn, sql, params),
+                'p50': statistics.median(timings),
+                'p95': timings[int(len(timings) * 0.95) - 1],
+            }
+    return results
+
+def print_results(title, results):
+    print(f"\n{'='*70}")
+    print(f"{title}")
+    print(f"{'='*70}")
+    for label, result in results.items():
+        print(f"\n{label}: p50 {result['p50']:.3f} ms, p95 {result['p95']:.3f} ms")
+        for line in result['plan']:
+            print(f"    {line}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default='sqlite:////tmp/nutripulse_bench_indexes.db',
+                        help='database to benchmark against (it will be wiped)')
+    parser.add_argument('--rows', type=int, default=2000000,
+                        help='health records and chat messages to seed (plans get half)')
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engine = create_engine(args.database_url)
+
+    seed(engine, args.rows, args.patients, args.chunk_size, rng)
+
+    before = run_queries(engine, args.patients, args.iterations, random.Random(args.seed))
+    print_results('Without composite indexes', before)
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for index in composite_indexes():
+            index.create(bind=conn)
+    print(f"\nBuilt composite indexes in {time.perf_counter() - started:.1f}s")
+
+    after = run_queries(engine, args.patients, args.iterations, random.Random(args.seed))
+    print_results('With composite indexes', after)
+
+    print(f"\n{'='*70}")
+    print(f"{'query':<28}{'p50 before':>12}{'p50 after':>12}{'speedup':>10}")
+    for label in QUERIES:
+        speedup = before[label]['p50'] / after[label]['p50'] if after[label]['p50'] else float('inf')
+        print(f"{label:<28}{before[label]['p50']:>10.3f}ms{after[label]['p50']:>10.3f}ms{speedup:>9.1f}x")
+
+if __name__ == '__main__':
+    main()
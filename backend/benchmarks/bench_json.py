@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for JSON responses of model payloads
+
+Builds and encodes the payloads of the heaviest responses (a patient report,
+a page of health records with their nurses, a page of chat history) the way
+the routes used to, with to_dict() and Flask's stdlib provider, and the way
+they do now, with serialize() and the orjson provider, plus the two mixed
+combinations. Rows are transient model objects, so no database is involved.
+
+    python -m benchmarks.bench_json
+    python -m benchmarks.bench_json --iterations 5000 --page-size 100
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+from models import User, Patient, Nurse, HealthRecord, NutritionPlan, ChatHistory
+from seed import CHECKUP_NOTES, DIET_PLANS, HOSPITALS, PRESCRIPTIONS, QUESTIONS, REPLIES, SPECIALIZATIONS
+
+def make_rows(page_size, rng):
+    """A patient with page_size records, plans and chat messages from a few nurses"""
+    now = datetime.utcnow()
+
+    def moment():
+        return now - timedelta(seconds=rng.randrange(180 * 86400), microseconds=rng.randrange(1000000))
+
+    nurses = [Nurse(id=i, user_id=100 + i, specialization=rng.choice(SPECIALIZATIONS), hospital=rng.choice(HOSPITALS),
+                    user=User(id=100 + i, name=f'Nurse {i}', email=f'nurse{i}@hospital.com', role='nurse',
+                              created_at=moment()))
+              for i in range(1, 6)]
+    patient = Patient(id=1, user_id=1, age=42, gender='female', medical_history='Hypertension',
+                      nutrition_needs='Low salt',
+                      user=User(id=1, name='Pat Doe', email='pat@email.com', role='patient', created_at=moment()))
+    records = [HealthRecord(id=i, patient_id=1, nurse_id=nurse.id, nurse=nurse, checkup_notes=rng.choice(CHECKUP_NOTES),
+                            prescriptions=rng.choice(PRESCRIPTIONS), created_at=moment())
+               for i, nurse in enumerate(rng.choices(nurses, k=page_size), 1)]
+    plans = [NutritionPlan(id=i, patient_id=1, nurse_id=nurse.id, nurse=nurse, diet_plan=rng.choice(DIET_PLANS),
+                           created_at=moment())
+             for i, nurse in enumerate(rng.choices(nurses, k=page_size), 1)]
+    chats = [ChatHistory(id=i, user_id=1, role='user' if i % 2 else 'assistant',
+                         message=rng.choice(QUESTIONS if i % 2 else REPLIES), turn_id=f'turn-{(i + 1) // 2}',
+                         created_at=moment())
+             for i in range(1, page_size + 1)]
+    return patient, records, plans, chats
+
+def payloads(patient, records, plans, chats):
+    """{name: function(method name) -> response payload}, mirroring the routes"""
+    def report(method):
+        return {
+            'patient_info': {'id': patient.id, 'name': patient.user.name, 'age': patient.age,
+                             'gender': patient.gender, 'medical_history': patient.medical_history,
+                             'nutrition_needs': patient.nutrition_needs},
+            'report_generated_at': datetime.utcnow().isoformat(),
+            'latest_health_record': getattr(records[0], method)(),
+            'latest_nutrition_plan': getattr(plans[0], method)(),
+            'recent_health_records': [getattr(record, method)() for record in records[:5]],
+            'recent_nutrition_plans': [getattr(plan, method)() for plan in plans[:5]],
+        }
+
+    def records_page(method):
+        return {'patient_id': patient.id, 'records': [getattr(record, method)() for record in records],
+                'limit': len(records), 'next_cursor': None}
+
+    def chat_page(method):
+        return {'user_id': patient.user_id, 'conversations': [[getattr(chat, method)()] for chat in chats],
+                'limit': len(chats), 'next_cursor': None}
+
+    return {'report': report, 'records page': records_page, 'chat history': chat_page}
+
+def timed(provider, build, method, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        response = provider.response(build(method))
+    elapsed = time.perf_counter() - started
+    return elapsed / iterations, len(response.get_data())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--page-size', type=int, default=50, help='records, plans and chat messages per payload')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    if json_provider.orjson is None:
+        parser.error('orjson is not installed; nothing to compare the stdlib with')
+    variants = [
+        ('to_dict + stdlib (before)', DefaultJSONProvider(app), 'to_dict'),
+        ('to_dict + orjson', json_provider.OrjsonProvider(app), 'to_dict'),
+        ('serialize + stdlib', json_provider.StdlibJSONProvider(app), 'serialize'),
+        ('serialize + orjson (after)', json_provider.OrjsonProvider(app), 'serialize'),
+    ]
+
+    rows = make_rows(args.page_size, random.Random(args.seed))
+    with app.app_context():
+        for name, build in payloads(*rows).items():
+            print(f"\n{name}, {args.iterations:,} responses")
+            baseline = None
+            for label, provider, method in variants:
+                build(method)  # Warm up the per-class column readers
+                seconds, size = timed(provider, build, method, args.iterations)
+                baseline = baseline or seconds
+                print(f"  {label:<28}{seconds * 1e6:>10.1f} us/response  {size:>8,} bytes  "
+                      f"speedup {baseline / seconds:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for chat topic classification
+
+Classifies a batch of synthetic chat messages (100k by default) with the
+original per-keyword substring loop and with topics.TopicClassifier, for
+growing keyword vocabularies.
+
+    python -m benchmarks.bench_topics
+    python -m benchmarks.bench_topics --messages 100000 --vocabulary-sizes 12,120,1200
+"""
+
+import argparse
+import random
+import time
+
+from topics import TOPIC_KEYWORDS, TopicClassifier
+
+FILLER = ('how', 'much', 'should', 'i', 'take', 'every', 'day', 'is', 'it', 'safe', 'to',
+          'after', 'my', 'morning', 'walk', 'with', 'water', 'tired', 'sleep', 'better')
+
+def synthetic_keyword(rng):
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(5, 10)))
+
+def vocabulary(size, rng):
+    """The built-in topics padded with synthetic keywords up to size keywords in total"""
+    topic_keywords = {topic: list(keywords) for topic, keywords in TOPIC_KEYWORDS.items()}
+    topics = list(topic_keywords)
+    total = sum(len(keywords) for keywords in topic_keywords.values())
+    for i in range(max(0, size - total)):
+        topic_keywords[topics[i % len(topics)]].append(synthetic_keyword(rng))
+    return topic_keywords
+
+def messages(count, topic_keywords, rng):
+    keywords = [keyword for words in topic_keywords.values() for keyword in words]
+    result = []
+    for _ in range(count):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(6, 20))]
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        result.append(' '.join(words).capitalize() + '?')
+    return result
+
+def naive_classify(message, topic_keywords):
+    """The loop reports used before: substring search per keyword per topic"""
+    message_lower = message.lower()
+    return {
+        topic
+        for topic, keywords in topic_keywords.items()
+        if any(keyword in message_lower for keyword in keywords)
+    }
+
+def timed(label, function, batch):
+    started = time.perf_counter()
+    for message in batch:
+        function(message)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<22}{elapsed * 1000:>10.1f} ms  {len(batch) / elapsed:>12,.0f} msg/s")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--vocabulary-sizes', default='12,120,1200',
+                        help='comma separated total keyword counts to benchmark')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    for size in (int(value) for value in args.vocabulary_sizes.split(',')):
+        rng = random.Random(args.seed)
+        topic_keywords = vocabulary(size, rng)
+        batch = messages(args.messages, topic_keywords, rng)
+
+        started = time.perf_counter()
+        classifier = TopicClassifier(topic_keywords)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        print(f"\n{size} keywords, {len(batch):,} messages (compiled in {compile_ms:.1f} ms)")
+        naive = timed('substring loop', lambda message: naive_classify(message, topic_keywords), batch)
+        compiled = timed('TopicClassifier', classifier.classify, batch)
+        print(f"  speedup {naive / compiled:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Concurrent load generator
+
+Runs --users virtual users in threads, each logged in as a nurse or patient,
+replaying a weighted mix of traffic until the test ends:
+
+    login   log in again (a login storm also happens as users arrive)
+    poll    dashboard polling with ETags: a patient's profile and summary,
+            or a nurse's worklist and one patient
+    chat    a patient sends a burst of one to four chat messages, then
+            reloads the chat history
+    write   a nurse adds a health record, sometimes a nutrition plan too
+
+Users start evenly spread over --ramp-up seconds, then all of them run for
+--duration seconds of steady state. Latency percentiles, throughput and
+error rates are reported per request for both phases, with a latency
+histogram of the steady state.
+
+The target is a running server (--url), whose database was filled with
+manage.py seed, or the WSGI app driven in process (--in-process): that
+seeds a SQLite file (or --database-url) and stubs the AI provider, so no
+server or network is needed.
+
+    python manage.py seed --patients 5000
+    python -m benchmarks.loadgen --url http://localhost:5000 --users 50 --ramp-up 10 --duration 60
+    python -m benchmarks.loadgen --in-process --users 20 --duration 30 --mix login:1,poll:6,chat:2,write:1
+"""
+
+import argparse
+import math
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import requests
+
+Reply = namedtuple('Reply', 'status headers json')
+
+# Histogram bucket upper bounds in milliseconds
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+CHAT_MESSAGES = [
+    'How much protein should I eat every day?',
+    'Is it safe to exercise after my morning medication?',
+    'What vitamins help with tiredness?',
+    'Which snacks are good for my blood sugar?',
+]
+
+class HTTPTarget:
+    """A running server, with one keep-alive session per thread"""
+
+    def __init__(self, base_url, timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None, json=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.request(method, self.base_url + path, headers=headers, json=json, timeout=self.timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return Reply(response.status_code, response.headers, body)
+
+class WSGITarget:
+    """The Flask app called in process, with one test client per thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None, json=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, headers=headers, json=json)
+        body = response.get_json(silent=True)
+        response.close()
+        return Reply(response.status_code, response.headers, body)
+
+class VirtualUser:
+    """One logged-in client issuing requests and recording how they went"""
+
+    def __init__(self, target, account, patient_ids, rng, steady_at):
+        self.target = target
+        self.role, self.email, self.password, self.patient_id = account
+        self.patient_ids = patient_ids
+        self.rng = rng
+        self.steady_at = steady_at
+        self.token = None
+        self.etags = {}
+        self.samples = []  # (phase, request name, seconds, ok)
+
+    def call(self, name, method, path, json=None, expect=(200,), etag=False):
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        if etag and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+            expect = expect + (304,)
+        started = time.perf_counter()
+        try:
+            reply = self.target.request(method, path, headers=headers, json=json)
+            ok = reply.status in expect
+        except Exception:
+            reply, ok = None, False
+        phase = 'steady' if time.monotonic() >= self.steady_at else 'ramp-up'
+        self.samples.append((phase, name, time.perf_counter() - started, ok))
+        if ok and etag and reply.headers.get('ETag'):
+            self.etags[path] = reply.headers['ETag']
+        return reply if ok else None
+
+def login(user):
+    reply = user.call('POST /auth/login', 'POST', '/auth/login', json={'email': user.email, 'password': user.password})
+    if reply is not None:
+        user.token = reply.json['access_token']
+
+def poll(user):
+    if user.role == 'patient':
+        user.call('GET /patients/<id>', 'GET', f'/patients/{user.patient_id}', etag=True)
+        user.call('GET /reports/<id>/summary', 'GET', f'/reports/{user.patient_id}/summary', etag=True)
+    else:
+        user.call('GET /patients', 'GET', '/patients?limit=50')
+        user.call('GET /patients/<id>', 'GET', f'/patients/{user.rng.choice(user.patient_ids)}', etag=True)
+
+def chat(user):
+    for _ in range(user.rng.randint(1, 4)):
+        user.call('POST /chatbot/chat', 'POST', '/chatbot/chat', json={'message': user.rng.choice(CHAT_MESSAGES)})
+    user.call('GET /chatbot/history', 'GET', '/chatbot/history?limit=20')
+
+def write(user):
+    patient_id = user.rng.choice(user.patient_ids)
+    user.call('POST /patients/<id>/records', 'POST', f'/patients/{patient_id}/records',
+              json={'checkup_notes': 'Load test checkup', 'prescriptions': 'None'}, expect=(201,))
+    if user.rng.random() < 0.3:
+        user.call('POST /patients/<id>/nutrition', 'POST', f'/patients/{patient_id}/nutrition',
+                  json={'diet_plan': 'Load test plan'}, expect=(201,))
+
+# Scenario name -> (function, roles that run it)
+SCENARIOS = {
+    'login': (login, ('nurse', 'patient')),
+    'poll': (poll, ('nurse', 'patient')),
+    'chat': (chat, ('patient',)),
+    'write': (write, ('nurse',)),
+}
+
+def parse_mix(value):
+    """'login:1,poll:6' -> {'login': 1.0, 'poll': 6.0}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition(':')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def discover_accounts(target, nurse_emails, password, patients_wanted):
+    """[(role, email, password, patient_id)] for the nurses and up to patients_wanted patients
+
+    Patients are found through the nurse worklist, before the test starts.
+    """
+    reply = target.request('POST', '/auth/login', json={'email': nurse_emails[0], 'password': password})
+    if reply.status != 200:
+        raise RuntimeError(f'Cannot log in as {nurse_emails[0]} ({reply.status}); seed the database first')
+    headers = {'Authorization': f"Bearer {reply.json['access_token']}"}
+
+    patients, cursor = [], None
+    while len(patients) < patients_wanted:
+        reply = target.request('GET', '/patients?limit=200' + (f'&cursor={cursor}' if cursor else ''), headers=headers)
+        patients += [patient['id'] for patient in reply.json['patients']]
+        cursor = reply.json['next_cursor']
+        if cursor is None:
+            break
+    if not patients:
+        raise RuntimeError('No patients found; seed the database first')
+
+    accounts = [('nurse', email, password, None) for email in nurse_emails]
+    for patient_id in patients[:patients_wanted]:
+        user = target.request('GET', f'/patients/{patient_id}', headers=headers).json['user']
+        accounts.append(('patient', user['email'], password, patient_id))
+    return accounts, patients
+
+def run(target, accounts, patient_ids, args):
+    """Run the virtual users and return their samples"""
+    mix = args.mix
+    nurses = [account for account in accounts if account[0] == 'nurse']
+    patients = [account for account in accounts if account[0] == 'patient']
+    nurse_users = round(args.users * args.nurse_ratio) if patients else args.users
+
+    started = time.monotonic()
+    steady_at = started + args.ramp_up
+    stop_at = steady_at + args.duration
+    users = []
+    for i in range(args.users):
+        account = nurses[i % len(nurses)] if i < nurse_users else patients[i % len(patients)]
+        users.append(VirtualUser(target, account, patient_ids, random.Random(args.seed + i), steady_at))
+
+    def live(user, delay):
+        time.sleep(delay)
+        login(user)
+        scenarios = [(name, weight) for name, weight in mix.items() if user.role in SCENARIOS[name][1]]
+        names, weights = [name for name, _ in scenarios], [weight for _, weight in scenarios]
+        while time.monotonic() < stop_at:
+            if user.token is None:
+                login(user)
+            else:
+                SCENARIOS[user.rng.choices(names, weights)[0]][0](user)
+            if args.think_ms:
+                time.sleep(user.rng.expovariate(1000 / args.think_ms))
+
+    threads = [threading.Thread(target=live, args=(user, args.ramp_up * i / args.users), daemon=True)
+               for i, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [sample for user in users for sample in user.samples]
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def report(samples, args):
+    """Print per-request statistics per phase and a histogram; return the steady-state error rate"""
+    seconds = {'ramp-up': args.ramp_up, 'steady': args.duration}
+    for phase in ('ramp-up', 'steady'):
+        phase_samples = [sample for sample in samples if sample[0] == phase]
+        if not phase_samples:
+            continue
+        print(f"\n{phase} ({seconds[phase]:g}s)")
+        print(f"{'request':<32}{'count':>8}{'req/s':>9}{'errors':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        names = sorted({sample[1] for sample in phase_samples})
+        for name in names + ['all']:
+            rows = [sample for sample in phase_samples if name in ('all', sample[1])]
+            timings = sorted(sample[2] * 1000 for sample in rows)
+            errors = sum(1 for sample in rows if not sample[3])
+            print(f"{name:<32}{len(rows):>8}{len(rows) / max(seconds[phase], 1e-9):>9.1f}{errors / len(rows):>9.1%}"
+                  f"{percentile(timings, 50):>9.1f}{percentile(timings, 95):>9.1f}{percentile(timings, 99):>9.1f}"
+                  f"{timings[-1]:>9.1f}")
+
+    steady = [sample for sample in samples if sample[0] == 'steady']
+    if not steady:
+        return 0.0
+    counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for sample in steady:
+        milliseconds = sample[2] * 1000
+        counts[next((i for i, bound in enumerate(HISTOGRAM_BOUNDS) if milliseconds <= bound), -1)] += 1
+    print('\nsteady-state latency')
+    widest = max(counts)
+    for i, count in enumerate(counts):
+        label = f'<= {HISTOGRAM_BOUNDS[i]} ms' if i < len(HISTOGRAM_BOUNDS) else f'> {HISTOGRAM_BOUNDS[-1]} ms'
+        print(f"{label:>12} {count:>8}  {'#' * round(40 * count / widest)}")
+    return sum(1 for sample in steady if not sample[3]) / len(steady)
+
+def in_process_target(args):
+    """Build the app on a freshly seeded database; returns the target and its nurse emails"""
+    from benchmarks.bench_endpoints import make_app
+    from models import db
+    from seed import seed
+
+    app = make_app(args.database_url, args.ai_latency_ms / 1000)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        nurses = max(1, args.patients // 50)
+        counts = seed(args.patients, nurses=nurses, records_per_patient=10, plans_per_patient=3,
+                      chats_per_patient=20, password=args.password)
+        print(f"Seeded {counts['patients']} patients and {counts['nurses']} nurses in {counts['seconds']}s")
+    # The seeded database starts empty, so nurse user ids run from 1
+    return WSGITarget(app), [f'nurse{user_id}@seed.local' for user_id in range(1, min(nurses, 10) + 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target_group = parser.add_mutually_exclusive_group()
+    target_group.add_argument('--url', default='http://localhost:5000', help='server to load')
+    target_group.add_argument('--in-process', action='store_true', help='drive the WSGI app in this process')
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users (threads)')
+    parser.add_argument('--ramp-up', type=float, default=10.0, help='seconds over which users start')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of steady state')
+    parser.add_argument('--think-ms', type=float, default=500.0, help='mean pause between scenarios per user')
+    parser.add_argument('--mix', type=parse_mix, default='login:1,poll:6,chat:2,write:1',
+                        help='scenario weights, e.g. login:1,poll:6,chat:2,write:1')
+    parser.add_argument('--nurse-ratio', type=float, default=0.2, help='share of users that are nurses')
+    parser.add_argument('--nurse-email', action='append',
+                        help='nurse account(s) to use; repeatable (default: nurse1@seed.local)')
+    parser.add_argument('--password', default='password123', help='password of the seeded accounts')
+    parser.add_argument('--max-error-rate', type=float, default=None,
+                        help='exit 1 when the steady-state error rate is above this fraction')
+    parser.add_argument('--seed', type=int, default=42)
+    in_process = parser.add_argument_group('in-process mode')
+    in_process.add_argument('--database-url', default='sqlite:////tmp/nutripulse_loadgen.db',
+                            help='database to seed and serve from (it will be wiped)')
+    in_process.add_argument('--patients', type=int, default=1000, help='patients to seed')
+    in_process.add_argument('--ai-latency-ms', type=float, default=0.0, help='delay of the stubbed AI provider')
+    args = parser.parse_args()
+    if isinstance(args.mix, str):
+        args.mix = parse_mix(args.mix)
+
+    if args.in_process:
+        target, nurse_emails = in_process_target(args)
+    else:
+        target, nurse_emails = HTTPTarget(args.url), ['nurse1@seed.local']
+    nurse_emails = args.nurse_email or nurse_emails
+
+    accounts, patient_ids = discover_accounts(target, nurse_emails, args.password, args.users)
+    print(f"Running {args.users} users: {args.ramp_up:g}s ramp-up, {args.duration:g}s steady state, "
+          f"mix {args.mix}")
+    samples = run(target, accounts, patient_ids, args)
+    error_rate = report(samples, args)
+
+    if args.max_error_rate is not None and error_rate > args.max_error_rate:
+        print(f"\nError rate {error_rate:.1%} is above {args.max_error_rate:.1%}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Conditional GET support for polled patient resources
+
+Every write that changes what a patient's endpoints return bumps that
+patient's patient_stats row (version and updated_at). Handlers load the row
+along with the patient and turn it into a weak ETag and Last-Modified, so a
+poll for an unchanged resource is answered with 304 Not Modified before the
+resource is queried or serialized.
+"""
+
+from datetime import timezone
+
+from flask import Response, request
+
+def patient_state(patient):
+    """(version, updated_at) of a patient, from its stats row"""
+    stats = patient.stats
+    return (stats.version, stats.updated_at) if stats else (0, None)
+
+def make_etag(resource, patient_id, version, updated_at, *extra):
+    """Opaque ETag value for a patient resource in the given state"""
+    stamp = updated_at.strftime('%Y%m%d%H%M%S%f') if updated_at else '0'
+    return '-'.join(str(part) for part in (resource, patient_id, version or 0, stamp, *extra))
+
+def is_not_modified(etag, last_modified=None):
+    """True if the client's cached copy is current
+
+    If-None-Match wins over If-Modified-Since, as RFC 9110 requires.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+    return False
+
+def add_validators(response, etag, last_modified=None):
+    """Attach the weak ETag and Last-Modified and ask clients to revalidate"""
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag, last_modified=None):
+    """An empty 304 response carrying the same validators"""
+    return add_validators(Response(status=304), etag, last_modified)
@@ -4,6 +4,10 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def env_bool(name, default):
+    """Read a true/false environment variable"""
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
 class Config:
     """Base configuration class"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
@@ -15,21 +19,101 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool: pre-ping and recycle connections before MySQL's
+    # wait_timeout drops them, and bound how long a burst waits for one
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': env_bool('DB_POOL_PRE_PING', True),
+    }
+    
+    # Read replicas, as comma separated URLs. GET requests read from one of
+    # them; writes, and a client's reads for a few seconds after it wrote,
+    # use the primary. Without replicas everything uses the primary.
+    SQLALCHEMY_BINDS = {
+        f'replica_{i}': {'url': url.strip(), **SQLALCHEMY_ENGINE_OPTIONS}
+        for i, url in enumerate(filter(None, os.environ.get('DB_REPLICA_URLS', '').split(',')))
+    }
+    SQLALCHEMY_READ_REPLICAS = list(SQLALCHEMY_BINDS)
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    # Where users who just wrote are remembered: 'memory' (per process) or
+    # 'redis' (shared by every worker)
+    REPLICA_STICKY_BACKEND = os.environ.get('REPLICA_STICKY_BACKEND', 'memory')
+    REPLICA_STICKY_REDIS_URL = os.environ.get('REPLICA_STICKY_REDIS_URL',
+                                              os.environ.get('AI_CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+    
     # JWT Configuration
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-change-in-production'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(
         seconds=int(os.environ.get('JWT_ACCESS_TOKEN_EXPIRES', 3600))
     )
     
+    # Largest number of items accepted by POST /patients/records:batch
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 500))
+    
     # AI API Configuration
     AI_API_KEY = os.environ.get('AI_API_KEY')
     AI_API_URL = os.environ.get('AI_API_URL', 'https://api.openai.com/v1/chat/completions')
     AI_MODEL = os.environ.get('AI_MODEL', 'gpt-3.5-turbo')
+    
+    # AI HTTP client: connection pool, timeouts, retries and circuit breaker
+    AI_POOL_SIZE = int(os.environ.get('AI_POOL_SIZE', 10))
+    AI_CONNECT_TIMEOUT = float(os.environ.get('AI_CONNECT_TIMEOUT', 3.05))
+    AI_READ_TIMEOUT = float(os.environ.get('AI_READ_TIMEOUT', 30))
+    AI_MAX_RETRIES = int(os.environ.get('AI_MAX_RETRIES', 2))
+    AI_RETRY_BACKOFF = float(os.environ.get('AI_RETRY_BACKOFF', 0.5))
+    AI_RETRY_BACKOFF_MAX = float(os.environ.get('AI_RETRY_BACKOFF_MAX', 4))
+    AI_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('AI_CIRCUIT_FAILURE_THRESHOLD', 5))
+    AI_CIRCUIT_RESET_TIMEOUT = float(os.environ.get('AI_CIRCUIT_RESET_TIMEOUT', 30))
+    
+    # AI response cache: 'memory' (per process), 'redis' (shared) or 'none'
+    AI_CACHE_BACKEND = os.environ.get('AI_CACHE_BACKEND', 'memory')
+    AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', 86400))
+    AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 1000))
+    AI_CACHE_REDIS_URL = os.environ.get('AI_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    
+    # Chat retention: messages older than this many days are moved to the
+    # archive by 'manage.py archive-chats'; reports look back 30 days at most
+    CHAT_RETENTION_DAYS = int(os.environ.get('CHAT_RETENTION_DAYS', 90))
+    # Rows per transaction when clearing a user's chat history
+    CHAT_DELETE_BATCH_SIZE = int(os.environ.get('CHAT_DELETE_BATCH_SIZE', 500))
+    
+    # Extra chat topics for reports, as "topic:keyword,keyword;topic:keyword"
+    CHAT_TOPICS_EXTRA = os.environ.get('CHAT_TOPICS_EXTRA', '')
+    
+    # Exports end this many seconds before they start, so rows stamped just
+    # before an export but committed after it land in the next one
+    EXPORT_SAFETY_LAG_SECONDS = int(os.environ.get('EXPORT_SAFETY_LAG_SECONDS', 300))
+    
+    # Request metrics served on /metrics; when METRICS_TOKEN is set scrapers
+    # must send it as a bearer token, otherwise a nurse's JWT is required
+    # unless METRICS_PUBLIC (the default in development only)
+    METRICS_ENABLED = env_bool('METRICS_ENABLED', True)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_PUBLIC = env_bool('METRICS_PUBLIC', False)
+    # Seconds a /health?deep=1 database check result is reused
+    HEALTH_CHECK_CACHE_SECONDS = float(os.environ.get('HEALTH_CHECK_CACHE_SECONDS', 10))
+    
+    # SQL profiling: every request, or requests sending an X-SQL-Profile header
+    SQL_PROFILING = env_bool('SQL_PROFILING', False)
+    SQL_PROFILING_HEADER = env_bool('SQL_PROFILING_HEADER', False)
+    # Profiled statements slower than this are logged
+    SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 200))
+    # Profiled requests running one statement this many times are logged as N+1
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 3))
+    
+    # JSON encoder for responses: 'orjson', 'stdlib', or 'auto' (orjson when
+    # it is installed)
+    JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     FLASK_ENV = 'development'
+    SQL_PROFILING_HEADER = env_bool('SQL_PROFILING_HEADER', True)
+    METRICS_PUBLIC = env_bool('METRICS_PUBLIC', True)
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -40,6 +124,9 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_BINDS = {}
+    SQLALCHEMY_READ_REPLICAS = []
 
 config = {
     'development': DevelopmentConfig,
@@ -0,0 +1,41 @@
+"""
+Statement timing shared by the request metrics and the SQL profiler
+
+One set of cursor listeners per engine times every statement and passes
+its SQL and duration in seconds to each consumer subscribed to that
+engine, so the features that need statement timings share one start-time
+stack on the connection instead of keeping one each.
+"""
+
+import time
+import weakref
+
+from sqlalchemy import event
+
+# {engine: [consumer(statement, seconds), ...]}
+_consumers = weakref.WeakKeyDictionary()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    for consumer in _consumers.get(conn.engine, ()):
+        consumer(statement, seconds)
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
+
+def on_statement(engine, consumer):
+    """Call consumer(statement, seconds) after every statement the engine runs"""
+    consumers = _consumers.get(engine)
+    if consumers is None:
+        consumers = _consumers[engine] = []
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+    if consumer not in consumers:
+        consumers.append(consumer)
@@ -0,0 +1,135 @@
+"""
+Database connection pool instrumentation
+
+Each engine that uses a queue pool gets an instrumented subclass of
+QueuePool that records checkouts, time spent waiting for a connection,
+checkout timeouts, overflow, new connections and invalidations (for example
+connections dropped by pool_pre_ping after "MySQL server has gone away").
+Pool sizing itself comes from SQLALCHEMY_ENGINE_OPTIONS in config.py.
+"""
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from models import db
+
+class PoolMetrics:
+    """Thread-safe counters for one connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_peak = 0
+
+    def record_checkout(self, wait, overflow):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.overflow_peak = max(self.overflow_peak, overflow)
+
+    def record_timeout(self, wait):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self, pool=None):
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            stats = {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'soft_invalidations': self.soft_invalidations,
+                'timeouts': self.timeouts,
+                'wait_ms_avg': round(self.wait_total / waits * 1000, 3) if waits else 0.0,
+                'wait_ms_max': round(self.wait_max * 1000, 3),
+                'overflow_peak': self.overflow_peak
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow()
+            })
+        return stats
+
+def instrumented_pool_class(metrics):
+    """A QueuePool subclass reporting to metrics"""
+
+    class InstrumentedQueuePool(QueuePool):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.record_timeout(time.perf_counter() - started)
+                raise
+            metrics.record_checkout(time.perf_counter() - started, self.overflow())
+            return connection
+
+    InstrumentedQueuePool.metrics = metrics
+    event.listen(InstrumentedQueuePool, 'checkin', lambda *args: metrics.increment('checkins'))
+    event.listen(InstrumentedQueuePool, 'connect', lambda *args: metrics.increment('connects'))
+    event.listen(InstrumentedQueuePool, 'invalidate', lambda *args: metrics.increment('invalidations'))
+    event.listen(InstrumentedQueuePool, 'soft_invalidate', lambda *args: metrics.increment('soft_invalidations'))
+    return InstrumentedQueuePool
+
+def _uses_queue_pool(url, options):
+    if 'poolclass' in options:
+        return False
+    url = make_url(url)
+    # Flask-SQLAlchemy gives in-memory SQLite a StaticPool
+    return not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'))
+
+def init_app(app):
+    """Install instrumented pools for the database and its binds; call before db.init_app(app)
+
+    Leaves engines alone that configure their own poolclass.
+    """
+    registry = {}
+
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if uri and _uses_queue_pool(uri, options):
+        registry['default'] = PoolMetrics()
+        options['poolclass'] = instrumented_pool_class(registry['default'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    binds = {}
+    for key, value in (app.config.get('SQLALCHEMY_BINDS') or {}).items():
+        options = dict(value) if isinstance(value, dict) else {'url': value}
+        if _uses_queue_pool(options['url'], options):
+            registry[key] = PoolMetrics()
+            options['poolclass'] = instrumented_pool_class(registry[key])
+        binds[key] = options
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+    app.extensions['pool_metrics'] = registry
+
+def pool_stats():
+    """Metrics and current state of every instrumented pool of the current app"""
+    engines = db.engines
+    return {
+        name: metrics.snapshot(engines[None if name == 'default' else name].pool)
+        for name, metrics in current_app.extensions.get('pool_metrics', {}).items()
+    }
@@ -0,0 +1,96 @@
+"""
+Read-replica routing
+
+Replicas are configured as SQLALCHEMY_BINDS listed in SQLALCHEMY_READ_REPLICAS.
+For GET and HEAD requests one replica is picked, and SELECT statements run
+there. Everything else goes to the primary database:
+
+- requests with other methods, and all work outside a request (CLI, jobs);
+- any statement that is not a SELECT, and every statement after the first
+  write within a request, so a request reads its own writes;
+- requests from a user who wrote within the last REPLICA_STICKY_SECONDS,
+  so users read their own writes even while the replicas lag behind. Users
+  are recognised by their JWT identity, which bearer-token clients send on
+  every request (a cookie would not survive the cross-origin SPA). The
+  marks are kept per process (REPLICA_STICKY_BACKEND=memory) or in Redis
+  (redis), which is needed to cover every worker of a multi-process server.
+
+With no replicas configured every statement goes to the primary.
+"""
+
+import random
+
+from flask import current_app, g, has_app_context, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_sqlalchemy.session import Session
+
+from ai_cache import MemoryCacheBackend, RedisCacheBackend
+
+READ_METHODS = ('GET', 'HEAD')
+
+class RoutingSession(Session):
+    """Session that runs the SELECTs of read-only requests on a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        replica = g.get('db_replica') if has_app_context() else None
+        if replica is None or bind is not None or engine is not self._db.engines.get(None):
+            return engine
+
+        if self._flushing or not getattr(clause, 'is_select', False):
+            # Stay on the primary for the rest of the request
+            g.db_replica = None
+            return engine
+        return self._db.engines[replica]
+
+def _identity():
+    """JWT identity of the request, or None without a valid token"""
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        # Invalid tokens are rejected by the view's own jwt_required
+        return None
+
+def _sticky():
+    return current_app.extensions['replica_sticky']
+
+def set_writer_identity(identity):
+    """Name the user a request without a token wrote for (register, login)
+
+    mark_writer uses it when the request has no JWT identity of its own, so
+    the token just handed out reads from the primary too.
+    """
+    g.db_writer_identity = identity
+
+def choose_replica():
+    """Pick the replica this request reads from, if it may use one"""
+    g.db_replica = None
+    replicas = current_app.config.get('SQLALCHEMY_READ_REPLICAS')
+    if not replicas or request.method not in READ_METHODS:
+        return
+    identity = _identity()
+    if identity is None or _sticky().get(str(identity)) is None:
+        g.db_replica = random.choice(replicas)
+
+def mark_writer(response):
+    """Send a user who just wrote to the primary for a few seconds"""
+    if (current_app.config.get('SQLALCHEMY_READ_REPLICAS') and request.method not in READ_METHODS
+            and response.status_code < 400):
+        identity = _identity()
+        if identity is None:
+            identity = g.get('db_writer_identity')
+        if identity is not None:
+            _sticky().set(str(identity), '1', current_app.config.get('REPLICA_STICKY_SECONDS', 5))
+    return response
+
+def init_app(app):
+    """Route reads to replicas for this app's requests"""
+    if app.config.get('REPLICA_STICKY_BACKEND', 'memory') == 'redis':
+        sticky = RedisCacheBackend(app.config['REPLICA_STICKY_REDIS_URL'], prefix='nutripulse:read-primary:',
+                                   setting='REPLICA_STICKY_BACKEND')
+    else:
+        sticky = MemoryCacheBackend(max_entries=100000)
+    app.extensions['replica_sticky'] = sticky
+    app.before_request(choose_replica)
+    app.after_request(mark_writer)
@@ -0,0 +1,127 @@
+"""
+Streaming exports of patient data for analytics
+
+Health records, nutrition plans and chat history are read oldest first
+through a server-side cursor (yield_per) and written out as NDJSON or CSV a
+chunk at a time, so memory use stays flat however many rows are exported.
+
+Each export covers rows created in [since, until), and ``until`` is handed
+back as the watermark to pass as ``since`` next time. created_at is stamped
+by the app before the row is committed, so a row can become visible after
+an export that started later than its timestamp. ``until`` therefore
+defaults to ``lag`` (EXPORT_SAFETY_LAG_SECONDS) before the export started:
+rows younger than that wait for the next export, and a row is only missed
+if its transaction took longer than the lag to commit.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import db, HealthRecord, NutritionPlan, ChatHistory
+
+EXPORT_MODELS = {
+    'health_records': HealthRecord,
+    'nutrition_plans': NutritionPlan,
+    'chat_history': ChatHistory,
+}
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+DEFAULT_SAFETY_LAG = timedelta(minutes=5)
+
+def parse_watermark(value):
+    """Parse an ISO 8601 timestamp, or return None for an empty value
+
+    Raises ValueError if the timestamp is malformed.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid timestamp, expected ISO 8601') from e
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+class Export:
+    """One export of a table in a given format and time window"""
+
+    def __init__(self, table, export_format='ndjson', since=None, until=None, batch_size=1000,
+                 lag=DEFAULT_SAFETY_LAG):
+        if table not in EXPORT_MODELS:
+            raise ValueError(f'Unknown export table: {table}')
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'Unknown export format: {export_format}')
+
+        self.table = table
+        self.format = export_format
+        self.since = since
+        self.until = until or datetime.utcnow() - lag
+        self.batch_size = batch_size
+        self.rows = 0
+
+    @property
+    def columns(self):
+        return [column.name for column in EXPORT_MODELS[self.table].__table__.columns]
+
+    @property
+    def content_type(self):
+        return EXPORT_FORMATS[self.format]
+
+    @property
+    def filename(self):
+        return f"{self.table}-{self.until.strftime('%Y%m%dT%H%M%S')}.{self.format}"
+
+    @property
+    def watermark(self):
+        """Pass as ``since`` to the next export to continue where this one ends"""
+        return self.until.isoformat()
+
+    def _query(self):
+        table = EXPORT_MODELS[self.table].__table__
+        query = select(table).where(table.c.created_at < self.until)
+        if self.since is not None:
+            query = query.where(table.c.created_at >= self.since)
+        return query.order_by(table.c.created_at, table.c.id)\
+            .execution_options(yield_per=self.batch_size)
+
+    def _rows(self):
+        result = db.session.execute(self._query())
+        try:
+            for row in result:
+                self.rows += 1
+                yield row
+        finally:
+            result.close()
+
+    def chunks(self, chunk_size=64 * 1024):
+        """Yield the export as text chunks of roughly chunk_size characters"""
+        buffer = io.StringIO()
+        columns = self.columns
+
+        if self.format == 'csv':
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            write = lambda row: writer.writerow([_plain(value) for value in row])
+        else:
+            write = lambda row: buffer.write(
+                json.dumps({column: _plain(value) for column, value in zip(columns, row)}) + '\n'
+            )
+
+        for row in self._rows():
+            write(row)
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue()
@@ -0,0 +1,63 @@
+"""
+Deep health check
+
+/health?deep=1 runs SELECT 1 against the primary database and every bind
+(read replicas). The result is cached for HEALTH_CHECK_CACHE_SECONDS, so
+frequent probes from load balancers cost at most one round trip per
+database per interval, and concurrent probes wait for a single check.
+The endpoint is public, so failures are logged here and reported only as
+an error status.
+"""
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import text
+
+from models import db
+
+class DatabaseCheck:
+    """Cached reachability check of the app's database engines"""
+
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._result = None
+
+    def _run(self):
+        databases = {}
+        for name, engine in db.engines.items():
+            started = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text('SELECT 1'))
+                databases[name or 'default'] = {
+                    'status': 'ok', 'latency_ms': round((time.perf_counter() - started) * 1000, 3)
+                }
+            except Exception:
+                current_app.logger.exception('Health check of database %s failed', name or 'default')
+                databases[name or 'default'] = {'status': 'error'}
+        return databases
+
+    def result(self):
+        """(healthy, per-database results, age of the result in seconds)"""
+        with self._lock:
+            now = self.clock()
+            if self._checked_at is None or now - self._checked_at >= self.ttl:
+                self._result = self._run()
+                self._checked_at = now = self.clock()
+            databases = self._result
+            age = now - self._checked_at
+        healthy = all(database['status'] == 'ok' for database in databases.values())
+        return healthy, databases, round(age, 3)
+
+def init_app(app):
+    """Create the cached database check for this app"""
+    app.extensions['database_check'] = DatabaseCheck(app.config.get('HEALTH_CHECK_CACHE_SECONDS', 10))
+
+def database_check():
+    """The database check of the current app"""
+    return current_app.extensions['database_check']
@@ -0,0 +1,87 @@
+"""
+JSON provider
+
+Responses are encoded with orjson when it is installed, falling back to the
+stdlib json module otherwise (JSON_ENCODER=auto), or with the one named by
+JSON_ENCODER=orjson or stdlib. orjson encodes datetimes itself, and both
+providers write dates and datetimes as ISO 8601, so Model.serialize() can
+leave them to the encoder and produce the same JSON as to_dict().
+
+Both keep Flask's defaults of sorted keys and compact output outside debug
+mode. orjson writes non-ASCII characters as UTF-8 rather than \\u escapes,
+which decodes to the same values.
+"""
+
+import dataclasses
+import decimal
+import uuid
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+def _iso_default(o):
+    """Flask's conversions for types JSON lacks, with dates as ISO 8601"""
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's provider, writing dates as ISO 8601 instead of HTTP dates"""
+
+    default = staticmethod(_iso_default)
+
+class OrjsonProvider(StdlibJSONProvider):
+    """Encodes with orjson, bytes straight into the response"""
+
+    def _options(self, pretty=False, sort_keys=None):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        # Arguments only the stdlib understands (cls, separators, ...) go to it
+        if set(kwargs) - {'default', 'indent', 'sort_keys'}:
+            return super().dumps(obj, **kwargs)
+        option = self._options(bool(kwargs.get('indent')), kwargs.get('sort_keys'))
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(pretty))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+PROVIDERS = {'stdlib': StdlibJSONProvider, 'orjson': OrjsonProvider}
+
+def provider_class(name):
+    """The provider class for a JSON_ENCODER setting"""
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown JSON_ENCODER {name!r}, expected auto, orjson or stdlib")
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_ENCODER=orjson requires the orjson package')
+    return PROVIDERS[name]
+
+def init_app(app):
+    """Install the JSON provider chosen by JSON_ENCODER on this app"""
+    app.json = provider_class(app.config.get('JSON_ENCODER', 'auto'))(app)
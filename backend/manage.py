@@ -6,9 +6,13 @@ Handles database migrations and other administrative tasks
 
 import os
 import sys
+from datetime import timedelta
+import click
 from flask.cli import FlaskGroup
+from sqlalchemy import func
 from app import create_app
 from models import db
+from export import Export, EXPORT_MODELS, EXPORT_FORMATS, parse_watermark
 
 # Create Flask CLI group
 cli = FlaskGroup(create_app=create_app)
@@ -97,6 +101,8 @@ def create_sample_data():
         db.session.add(nutrition_plan)
         db.session.commit()
         
+        rebuild_patient_stats()
+        
         print("✅ Sample data created successfully!")
         print(f"   Nurse: {nurse_user.email} (password: password123)")
         print(f"   Patient: {patient_user.email} (password: password123)")
@@ -106,5 +112,234 @@ def create_sample_data():
         print(f"❌ Error creating sample data: {e}")
         sys.exit(1)
 
+@cli.command()
+@click.option('--patients', type=click.IntRange(min=1), required=True, help='Patients to create')
+@click.option('--nurses', type=click.IntRange(min=1), default=None, help='Nurses to create [default: one per 50 patients]')
+@click.option('--records-per-patient', type=click.IntRange(min=0), default=10, show_default=True)
+@click.option('--plans-per-patient', type=click.IntRange(min=0), default=3, show_default=True)
+@click.option('--chats-per-patient', type=click.IntRange(min=0), default=20, show_default=True,
+              help='Chat messages per patient, written as question and reply pairs')
+@click.option('--days', type=click.IntRange(min=1), default=730, show_default=True, help='How far back the data goes')
+@click.option('--seed', 'random_seed', default=42, show_default=True, help='Random seed; the same seed gives the same data')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=5000, show_default=True, help='Rows per insert and commit')
+@click.option('--password', default='password123', show_default=True, help='Password of every seeded account')
+def seed(patients, nurses, records_per_patient, plans_per_patient, chats_per_patient, days, random_seed,
+         chunk_size, password):
+    """Bulk insert synthetic patients, nurses, records, plans and chats for load testing"""
+    from seed import seed as seed_database
+    
+    try:
+        counts = seed_database(patients, nurses=nurses, records_per_patient=records_per_patient,
+                               plans_per_patient=plans_per_patient, chats_per_patient=chats_per_patient,
+                               days=days, seed=random_seed, chunk_size=chunk_size, password=password)
+        seconds = counts.pop('seconds')
+        print(f"✅ Seeded {sum(counts.values()):,} rows in {seconds}s!")
+        for table, count in counts.items():
+            print(f"   {table}: {count:,}")
+        print(f"   Accounts log in as <role><user id>@seed.local (password: {password})")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error seeding data: {e}")
+        sys.exit(1)
+
+def rebuild_patient_stats(batch_size=1000):
+    """Recompute every patient_stats row from the raw tables"""
+    from models import Patient, HealthRecord, NutritionPlan, ChatHistory, ChatHistoryArchive, PatientStats
+    from topics import message_topics
+    
+    stats = {
+        patient_id: {'patient_id': patient_id, 'version': 1, 'last_checkup_at': None, 'last_plan_at': None,
+                     'last_chat_at': None, **{name: 0 for name in PatientStats.COUNTERS}}
+        for (patient_id,) in db.session.query(Patient.id)
+    }
+    
+    # Counts and latest timestamps with one grouped aggregate per table
+    for patient_id, count, latest in db.session.query(
+        HealthRecord.patient_id, func.count(HealthRecord.id), func.max(HealthRecord.created_at)
+    ).group_by(HealthRecord.patient_id):
+        stats[patient_id].update(health_records_count=count, last_checkup_at=latest)
+    
+    for patient_id, count, latest in db.session.query(
+        NutritionPlan.patient_id, func.count(NutritionPlan.id), func.max(NutritionPlan.created_at)
+    ).group_by(NutritionPlan.patient_id):
+        stats[patient_id].update(nutrition_plans_count=count, last_plan_at=latest)
+    
+    # Chat counters cover live and archived messages
+    for chats in (ChatHistory, ChatHistoryArchive):
+        for patient_id, count, latest in db.session.query(
+            Patient.id, func.count(chats.id), func.max(chats.created_at)
+        ).join(chats, chats.user_id == Patient.user_id).group_by(Patient.id):
+            previous = stats[patient_id]['last_chat_at']
+            stats[patient_id]['chat_messages_count'] += count
+            stats[patient_id]['last_chat_at'] = max(latest, previous) if previous else latest
+        
+        # Topic counters use the same classifier as inserts, streamed in batches
+        user_messages = db.session.query(Patient.id, chats.message)\
+            .join(chats, chats.user_id == Patient.user_id)\
+            .filter(chats.role == 'user')\
+            .execution_options(yield_per=batch_size)
+        for patient_id, message in user_messages:
+            for counter in PatientStats.topic_counters(message_topics(message)):
+                stats[patient_id][counter] += 1
+    
+    # Bump versions so clients holding ETags from before the rebuild refetch
+    for patient_id, version in db.session.query(PatientStats.patient_id, PatientStats.version):
+        if patient_id in stats:
+            stats[patient_id]['version'] = version + 1
+    
+    PatientStats.query.delete()
+    rows = list(stats.values())
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(PatientStats.__table__.insert(), rows[start:start + batch_size])
+    db.session.commit()
+    return len(rows)
+
+@cli.command()
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per insert and per streamed fetch')
+def backfill_patient_stats(batch_size):
+    """Rebuild the patient_stats table from health records, plans and chats"""
+    try:
+        count = rebuild_patient_stats(batch_size)
+        print(f"✅ Patient statistics rebuilt for {count} patients!")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error rebuilding patient statistics: {e}")
+        sys.exit(1)
+
+@cli.command()
+@click.option('--batch-size', default=1000, show_default=True, help='Messages classified per transaction')
+@click.option('--all', 'reclassify_all', is_flag=True, help='Reclassify every user message, not just unclassified ones')
+def classify_chats(batch_size, reclassify_all):
+    """Store topics for user chat messages saved before classification existed"""
+    from models import ChatHistory
+    from topics import message_topics, encode_topics
+    from sqlalchemy import bindparam
+    
+    try:
+        update = ChatHistory.__table__.update()\
+            .where(ChatHistory.__table__.c.id == bindparam('chat_id'))\
+            .values(topics=bindparam('chat_topics'))
+        
+        classified = 0
+        last_id = 0
+        while True:
+            query = db.session.query(ChatHistory.id, ChatHistory.message)\
+                .filter(ChatHistory.role == 'user', ChatHistory.id > last_id)
+            if not reclassify_all:
+                query = query.filter(ChatHistory.topics.is_(None))
+            batch = query.order_by(ChatHistory.id).limit(batch_size).all()
+            if not batch:
+                break
+            
+            db.session.execute(update, [
+                {'chat_id': chat_id, 'chat_topics': encode_topics(message_topics(message))}
+                for chat_id, message in batch
+            ])
+            db.session.commit()
+            classified += len(batch)
+            last_id = batch[-1].id
+        
+        print(f"✅ Classified {classified} chat messages!")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error classifying chat messages: {e}")
+        sys.exit(1)
+
+def pair_legacy_chat_turns(batch_size=1000):
+    """Give chat messages saved before turn ids existed a turn_id
+
+    Each user message starts a turn, and an assistant reply that directly
+    follows a user message joins that message's turn. Returns the number of
+    messages updated.
+    """
+    from models import ChatHistory
+    from sqlalchemy import bindparam, tuple_
+    
+    update = ChatHistory.__table__.update()\
+        .where(ChatHistory.__table__.c.id == bindparam('chat_id'))\
+        .values(turn_id=bindparam('chat_turn_id'))
+    position = ChatHistory.user_id, ChatHistory.created_at, ChatHistory.id
+    
+    paired = 0
+    last = None
+    previous = None  # (user_id, role, turn_id) of the message before
+    while True:
+        query = db.session.query(*position, ChatHistory.role, ChatHistory.turn_id)
+        if last is not None:
+            query = query.filter(tuple_(*position) > tuple_(*last))
+        batch = query.order_by(*position).limit(batch_size).all()
+        if not batch:
+            break
+        
+        updates = []
+        for user_id, created_at, chat_id, role, turn_id in batch:
+            if turn_id is None:
+                answers_question = role == 'assistant' and previous and previous[:2] == (user_id, 'user')
+                turn_id = previous[2] if answers_question else f'legacy-{chat_id}'
+                updates.append({'chat_id': chat_id, 'chat_turn_id': turn_id})
+            previous = (user_id, role, turn_id)
+        
+        if updates:
+            db.session.execute(update, updates)
+        db.session.commit()
+        paired += len(updates)
+        last = tuple(batch[-1][:3])
+    return paired
+
+@cli.command()
+@click.option('--batch-size', default=1000, show_default=True, help='Messages read and updated per transaction')
+def pair_chat_turns(batch_size):
+    """Group chat messages saved before turn ids existed into turns"""
+    try:
+        paired = pair_legacy_chat_turns(batch_size)
+        print(f"✅ Assigned turns to {paired} chat messages!")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error pairing chat turns: {e}")
+        sys.exit(1)
+
+@cli.command()
+@click.option('--days', type=click.IntRange(min=31), default=None,
+              help='Archive messages older than this many days [default: CHAT_RETENTION_DAYS]')
+@click.option('--batch-size', default=1000, show_default=True, help='Messages moved per transaction')
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between batches')
+def archive_chats(days, batch_size, pause):
+    """Move old chat messages from chat_history to chat_history_archive"""
+    from flask import current_app
+    from retention import archive_chats as archive_old_chats
+    
+    try:
+        days = days or current_app.config['CHAT_RETENTION_DAYS']
+        moved = archive_old_chats(days, batch_size=batch_size, pause=pause)
+        print(f"✅ Archived {moved} chat messages older than {days} days!")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error archiving chat messages: {e}")
+        sys.exit(1)
+
+@cli.command()
+@click.argument('table', type=click.Choice(list(EXPORT_MODELS)))
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson', show_default=True)
+@click.option('--since', help="Only rows created at or after this ISO timestamp (a previous export's watermark)")
+@click.option('--output', '-o', type=click.File('w'), default='-', help='File to write to (default: stdout)')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched per round trip')
+def export(table, export_format, since, output, batch_size):
+    """Stream a table as NDJSON or CSV for analytics"""
+    from flask import current_app
+    try:
+        lag = timedelta(seconds=current_app.config['EXPORT_SAFETY_LAG_SECONDS'])
+        data_export = Export(table, export_format, since=parse_watermark(since), batch_size=batch_size, lag=lag)
+        for chunk in data_export.chunks():
+            output.write(chunk)
+        output.flush()
+        
+        # Status goes to stderr so the export itself can be piped
+        click.echo(f"✅ Exported {data_export.rows} {table} rows!", err=True)
+        click.echo(f"   Next incremental export: --since {data_export.watermark}", err=True)
+    except Exception as e:
+        db.session.rollback()
+        click.echo(f"❌ Error exporting {table}: {e}", err=True)
+        sys.exit(1)
+
 if __name__ == '__main__':
     cli()
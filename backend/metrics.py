@@ -0,0 +1,199 @@
+"""
+Request metrics in Prometheus text format
+
+Every request is timed from before_request until its context is torn down
+(the end of the body for streamed responses) and recorded per blueprint and
+route rule, together with its status, the number of SQL statements it ran
+and the time they took. Calls to the AI provider are timed per attempt.
+Recording a request takes one lock and a bisect per histogram, and nothing
+is formatted until /metrics is scraped.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, current_app, g, has_request_context, request
+
+import db_events
+from models import db
+
+# Upper bounds in seconds; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AI_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values; not locked itself"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """(le, cumulative count) pairs ending with +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield ('+Inf' if bound == float('inf') else repr(bound)), total
+
+class RequestMetrics:
+    """Thread-safe request, database and AI provider metrics of one app"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}      # (method, blueprint, route, status) -> count
+        self.latency = {}       # (blueprint, route) -> Histogram
+        self.in_flight = {}     # blueprint -> requests being served
+        self.db_queries = {}    # (blueprint, route) -> statements
+        self.db_seconds = {}    # (blueprint, route) -> seconds spent in statements
+        self.ai_latency = {}    # outcome -> Histogram
+
+    def request_started(self, blueprint):
+        with self._lock:
+            self.in_flight[blueprint] = self.in_flight.get(blueprint, 0) + 1
+
+    def request_finished(self, method, blueprint, route, status, seconds, queries, query_seconds):
+        key = (blueprint, route)
+        with self._lock:
+            self.in_flight[blueprint] -= 1
+            request_key = (method, blueprint, route, status)
+            self.requests[request_key] = self.requests.get(request_key, 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.latency[key].observe(seconds)
+            self.db_queries[key] = self.db_queries.get(key, 0) + queries
+            self.db_seconds[key] = self.db_seconds.get(key, 0.0) + query_seconds
+
+    def observe_ai(self, seconds, outcome):
+        """Record one attempt to call the AI provider; outcome is a status code or 'error'"""
+        with self._lock:
+            if outcome not in self.ai_latency:
+                self.ai_latency[outcome] = Histogram(AI_LATENCY_BUCKETS)
+            self.ai_latency[outcome].observe(seconds)
+
+    def render(self, pools=None):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, labels, hist):
+            for le, count in hist.samples():
+                lines.append(f'{name}_bucket{_labels(labels, le=le)} {count}')
+            lines.append(f'{name}_sum{_labels(labels)} {hist.sum!r}')
+            lines.append(f'{name}_count{_labels(labels)} {hist.count}')
+
+        with self._lock:
+            family('http_requests_total', 'counter', 'Requests served, by route and status')
+            for (method, blueprint, route, status), count in sorted(self.requests.items()):
+                labels = {'method': method, 'blueprint': blueprint, 'route': route, 'status': status}
+                lines.append(f'http_requests_total{_labels(labels)} {count}')
+
+            family('http_request_duration_seconds', 'histogram', 'Time to serve a request, including a streamed body')
+            for (blueprint, route), hist in sorted(self.latency.items()):
+                histogram('http_request_duration_seconds', {'blueprint': blueprint, 'route': route}, hist)
+
+            family('http_requests_in_flight', 'gauge', 'Requests being served')
+            for blueprint, count in sorted(self.in_flight.items()):
+                lines.append(f'http_requests_in_flight{_labels({"blueprint": blueprint})} {count}')
+
+            family('db_queries_total', 'counter', 'SQL statements run while serving requests')
+            for (blueprint, route), count in sorted(self.db_queries.items()):
+                lines.append(f'db_queries_total{_labels({"blueprint": blueprint, "route": route})} {count}')
+
+            family('db_query_duration_seconds_total', 'counter', 'Time spent running SQL statements for requests')
+            for (blueprint, route), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'db_query_duration_seconds_total{_labels({"blueprint": blueprint, "route": route})} '
+                             f'{seconds!r}')
+
+            family('ai_upstream_duration_seconds', 'histogram', 'Time to the AI provider response, per attempt')
+            for outcome, hist in sorted(self.ai_latency.items()):
+                histogram('ai_upstream_duration_seconds', {'outcome': outcome}, hist)
+
+        if pools:
+            gauges = (('db_pool_checked_out', 'gauge', 'checked_out', 'Connections in use'),
+                      ('db_pool_overflow', 'gauge', 'overflow', 'Connections open beyond pool_size'),
+                      ('db_pool_checkouts_total', 'counter', 'checkouts', 'Connections handed out'),
+                      ('db_pool_timeouts_total', 'counter', 'timeouts', 'Checkouts that timed out'))
+            for name, kind, key, help_text in gauges:
+                family(name, kind, help_text)
+                for pool, stats in sorted(pools.items()):
+                    if key in stats:
+                        lines.append(f'{name}{_labels({"pool": pool})} {stats[key]}')
+
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+def _request_labels():
+    blueprint = request.blueprint or 'app'
+    # Unmatched URLs share one label so scanners cannot blow up the series count
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    return blueprint, route
+
+def _record_statement(statement, seconds):
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_queries += 1
+        g.metrics_query_seconds += seconds
+
+def start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_seconds = 0.0
+    g.metrics_status = 500
+    current_app.extensions['metrics'].request_started(_request_labels()[0])
+
+def record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+def finish_request(error=None):
+    if 'metrics_started' not in g:
+        return
+    blueprint, route = _request_labels()
+    current_app.extensions['metrics'].request_finished(
+        request.method, blueprint, route, str(g.metrics_status), time.perf_counter() - g.metrics_started,
+        g.metrics_queries, g.metrics_query_seconds
+    )
+    g.pop('metrics_started')
+
+def get_metrics():
+    """The metrics registry of the current app"""
+    return current_app.extensions['metrics']
+
+def init_app(app):
+    """Record request metrics for this app; call after db.init_app and ai_client.init_app"""
+    registry = RequestMetrics()
+    app.extensions['metrics'] = registry
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    app.before_request(start_request)
+    app.after_request(record_status)
+    app.teardown_request(finish_request)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            db_events.on_statement(engine, _record_statement)
+
+    client = app.extensions.get('ai_client')
+    if client is not None:
+        client.latency_observer = registry.observe_ai
+
+def metrics_response(pools=None):
+    """The current app's metrics as a Prometheus scrape response"""
+    return Response(get_metrics().render(pools), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,12 +1,53 @@
 from datetime import datetime
+from operator import attrgetter, itemgetter
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, inspect, or_
+from sqlalchemy.orm import joinedload
 from werkzeug.security import generate_password_hash, check_password_hash
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-class User(db.Model):
+class SerializerMixin:
+    """Column-driven serialization for the JSON provider (see json_provider.py)
+
+    serialize() gives the same keys as to_dict(): the mapped columns, less
+    SERIALIZE_EXCLUDE, plus each relationship in SERIALIZE_NESTED serialized
+    in turn. Loaded values are read from the instance dict in one itemgetter
+    call instead of through the attribute descriptors, falling back to them
+    when a column is expired or deferred, and datetimes are left for the JSON
+    provider to encode.
+    """
+    SERIALIZE_EXCLUDE = ()
+    SERIALIZE_NESTED = ()
+    
+    @classmethod
+    def _column_readers(cls):
+        readers = cls.__dict__.get('_serialize_readers')
+        if readers is None:
+            keys = tuple(column.key for column in inspect(cls).column_attrs
+                         if column.key not in cls.SERIALIZE_EXCLUDE)
+            readers = cls._serialize_readers = (keys, itemgetter(*keys), attrgetter(*keys))
+        return readers
+    
+    def serialize(self):
+        """Convert to a dictionary of plain values and datetimes for the JSON provider"""
+        keys, read_loaded, read_attributes = self._column_readers()
+        state = self.__dict__
+        try:
+            values = read_loaded(state)
+        except KeyError:
+            values = read_attributes(self)
+        data = dict(zip(keys, values))
+        for name in self.SERIALIZE_NESTED:
+            related = state[name] if name in state else getattr(self, name)
+            data[name] = related.serialize() if related is not None else None
+        return data
+
+class User(SerializerMixin, db.Model):
     """User model for authentication and role management"""
     __tablename__ = 'users'
+    SERIALIZE_EXCLUDE = ('password_hash',)
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -38,9 +79,10 @@ class User(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-class Patient(db.Model):
+class Patient(SerializerMixin, db.Model):
     """Patient model with health and nutrition information"""
     __tablename__ = 'patients'
+    SERIALIZE_NESTED = ('user',)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
@@ -52,6 +94,7 @@ class Patient(db.Model):
     # Relationships
     health_records = db.relationship('HealthRecord', backref='patient', lazy='dynamic')
     nutrition_plans = db.relationship('NutritionPlan', backref='patient', lazy='dynamic')
+    stats = db.relationship('PatientStats', backref='patient', uselist=False, cascade='all, delete-orphan')
     
     def to_dict(self):
         """Convert to dictionary for JSON serialization"""
@@ -65,9 +108,10 @@ class Patient(db.Model):
             'user': self.user.to_dict() if self.user else None
         }
 
-class Nurse(db.Model):
+class Nurse(SerializerMixin, db.Model):
     """Nurse model with specialization and hospital information"""
     __tablename__ = 'nurses'
+    SERIALIZE_NESTED = ('user',)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
@@ -88,9 +132,14 @@ class Nurse(db.Model):
             'user': self.user.to_dict() if self.user else None
         }
 
-class HealthRecord(db.Model):
+class HealthRecord(SerializerMixin, db.Model):
     """Health records model for patient checkups and prescriptions"""
     __tablename__ = 'health_records'
+    __table_args__ = (
+        db.Index('ix_health_records_patient_id_created_at', 'patient_id', 'created_at'),
+        db.Index('ix_health_records_created_at', 'created_at'),
+    )
+    SERIALIZE_NESTED = ('nurse',)
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
@@ -99,6 +148,11 @@ class HealthRecord(db.Model):
     prescriptions = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @classmethod
+    def with_nurse(cls):
+        """Loader option that fetches the nurse and nurse's user in the same query as the rows"""
+        return joinedload(cls.nurse).joinedload(Nurse.user)
+    
     def to_dict(self):
         """Convert to dictionary for JSON serialization"""
         return {
@@ -111,9 +165,14 @@ class HealthRecord(db.Model):
             'nurse': self.nurse.to_dict() if self.nurse else None
         }
 
-class NutritionPlan(db.Model):
+class NutritionPlan(SerializerMixin, db.Model):
     """Nutrition plans model for patient diet recommendations"""
     __tablename__ = 'nutrition_plans'
+    __table_args__ = (
+        db.Index('ix_nutrition_plans_patient_id_created_at', 'patient_id', 'created_at'),
+        db.Index('ix_nutrition_plans_created_at', 'created_at'),
+    )
+    SERIALIZE_NESTED = ('nurse',)
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
@@ -121,6 +180,11 @@ class NutritionPlan(db.Model):
     diet_plan = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @classmethod
+    def with_nurse(cls):
+        """Loader option that fetches the nurse and nurse's user in the same query as the rows"""
+        return joinedload(cls.nurse).joinedload(Nurse.user)
+    
     def to_dict(self):
         """Convert to dictionary for JSON serialization"""
         return {
@@ -132,14 +196,23 @@ class NutritionPlan(db.Model):
             'nurse': self.nurse.to_dict() if self.nurse else None
         }
 
-class ChatHistory(db.Model):
+class ChatHistory(SerializerMixin, db.Model):
     """Chat history model for AI chatbot conversations"""
     __tablename__ = 'chat_history'
+    __table_args__ = (
+        db.Index('ix_chat_history_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_chat_history_created_at', 'created_at'),
+    )
+    SERIALIZE_EXCLUDE = ('topics',)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     role = db.Column(db.Enum('user', 'assistant'), nullable=False)
     message = db.Column(db.Text, nullable=False)
+    # Topics of a user message, classified once on insert (see topics.py)
+    topics = db.Column(db.String(255))
+    # Shared by a user message and the assistant reply to it, set on insert
+    turn_id = db.Column(db.String(32))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
@@ -149,5 +222,105 @@ class ChatHistory(db.Model):
             'user_id': self.user_id,
             'role': self.role,
             'message': self.message,
+            'turn_id': self.turn_id,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+class ChatHistoryArchive(SerializerMixin, db.Model):
+    """Chat messages moved out of chat_history by the retention job (see retention.py)"""
+    __tablename__ = 'chat_history_archive'
+    __table_args__ = (
+        db.Index('ix_chat_history_archive_user_id_created_at', 'user_id', 'created_at'),
+    )
+    SERIALIZE_EXCLUDE = ('topics',)
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    role = db.Column(db.Enum('user', 'assistant'), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    topics = db.Column(db.String(255))
+    turn_id = db.Column(db.String(32))
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert to dictionary for JSON serialization"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'role': self.role,
+            'message': self.message,
+            'turn_id': self.turn_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'archived_at': self.archived_at.isoformat() if self.archived_at else None
+        }
+
+class PatientStats(SerializerMixin, db.Model):
+    """Per-patient counters and timestamps, updated in the same transaction as each write"""
+    __tablename__ = 'patient_stats'
+    __table_args__ = (
+        # Nurse worklist order: most overdue checkup first
+        db.Index('ix_patient_stats_last_checkup_at_patient_id', 'last_checkup_at', 'patient_id'),
+    )
+    SERIALIZE_EXCLUDE = ('version', 'updated_at')
+    
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), primary_key=True)
+    last_checkup_at = db.Column(db.DateTime)
+    last_plan_at = db.Column(db.DateTime)
+    last_chat_at = db.Column(db.DateTime)
+    health_records_count = db.Column(db.Integer, nullable=False, default=0)
+    nutrition_plans_count = db.Column(db.Integer, nullable=False, default=0)
+    chat_messages_count = db.Column(db.Integer, nullable=False, default=0)
+    health_chat_count = db.Column(db.Integer, nullable=False, default=0)
+    nutrition_chat_count = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped by every write to the patient; with updated_at it is the ETag of
+    # the patient's resources (see conditional.py)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    COUNTERS = ('health_records_count', 'nutrition_plans_count', 'chat_messages_count',
+                'health_chat_count', 'nutrition_chat_count')
+    
+    @classmethod
+    def topic_counters(cls, topics):
+        """Names of the counters to bump for a message's topics"""
+        return [f'{topic}_chat_count' for topic in sorted(topics) if f'{topic}_chat_count' in cls.COUNTERS]
+    
+    @classmethod
+    def bump(cls, patient_id, counters=(), **values):
+        """Add to the named counters, set the given columns and bump the version
+
+        counters is a list of names to add one to, or a {name: amount} dict.
+        Uses an atomic UPDATE so concurrent writers do not lose increments.
+        The last_*_at timestamps only move forward, so a writer committing
+        after a newer one keeps the newer time; pass None to clear one.
+        Creates the row if the patient has none yet. Does not commit.
+        """
+        amounts = counters if isinstance(counters, dict) else {name: 1 for name in counters}
+        changes = {getattr(cls, name): getattr(cls, name) + amount for name, amount in amounts.items()}
+        for name, value in values.items():
+            column = getattr(cls, name)
+            if name.startswith('last_') and value is not None:
+                value = case((or_(column.is_(None), column < value), value), else_=column)
+            changes[column] = value
+        changes[cls.version] = cls.version + 1
+        changes[cls.updated_at] = datetime.utcnow()
+        
+        updated = cls.query.filter(cls.patient_id == patient_id)\
+            .update(changes, synchronize_session=False)
+        if not updated:
+            db.session.add(cls(patient_id=patient_id, version=1, **amounts, **values))
+    
+    def to_dict(self):
+        """Convert to dictionary for JSON serialization"""
+        return {
+            'patient_id': self.patient_id,
+            'last_checkup_at': self.last_checkup_at.isoformat() if self.last_checkup_at else None,
+            'last_plan_at': self.last_plan_at.isoformat() if self.last_plan_at else None,
+            'last_chat_at': self.last_chat_at.isoformat() if self.last_chat_at else None,
+            'health_records_count': self.health_records_count,
+            'nutrition_plans_count': self.nutrition_plans_count,
+            'chat_messages_count': self.chat_messages_count,
+            'health_chat_count': self.health_chat_count,
+            'nutrition_chat_count': self.nutrition_chat_count
+        }
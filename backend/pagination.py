@@ -0,0 +1,72 @@
+"""
+Keyset (cursor) pagination helpers
+
+Pages are ordered newest first on (created_at, id). The cursor handed back to
+clients encodes the last row of a page, so fetching the next page is a single
+index range scan no matter how deep the client has scrolled.
+"""
+
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 200
+
+def encode_cursor(created_at, row_id):
+    """Encode the position of a row as an opaque cursor string"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a cursor string into a (created_at, id) tuple
+
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, row_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def parse_page_args(args, cursor_param='cursor', default_limit=DEFAULT_PAGE_LIMIT, max_limit=MAX_PAGE_LIMIT):
+    """Read limit and cursor from request args
+
+    Returns a (limit, position) tuple where position is None for the first
+    page. Raises ValueError for a bad limit or cursor.
+    """
+    limit = args.get('limit', default_limit)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid limit') from e
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    limit = min(limit, max_limit)
+
+    cursor = args.get(cursor_param)
+    position = decode_cursor(cursor) if cursor else None
+    return limit, position
+
+def keyset_page(query, model, limit, position=None):
+    """Fetch one page of ``query`` ordered by (created_at, id) descending
+
+    Returns a (rows, next_cursor) tuple. next_cursor is None on the last page.
+    """
+    if position is not None:
+        created_at, row_id = position
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return rows, next_cursor
@@ -0,0 +1,73 @@
+"""
+Chat history retention
+
+Keeps the hot chat_history table small. Old messages are moved to
+chat_history_archive, and a user's history is cleared, in batches of a few
+hundred rows with a commit after each batch, so no statement holds row locks
+for long and other requests keep writing chat messages in between.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import literal, select
+
+from models import db, ChatHistory, ChatHistoryArchive
+
+def _ids_batch(model, condition, batch_size):
+    # Oldest first, which follows the created_at indexes and stops after one batch
+    return [row_id for (row_id,) in db.session.query(model.id).filter(condition)
+            .order_by(model.created_at, model.id).limit(batch_size)]
+
+def archive_chats(older_than_days, batch_size=1000, pause=0.0):
+    """Move messages older than older_than_days to the archive, one batch per transaction
+
+    pause is the number of seconds to sleep between batches, to leave room
+    for replication and for other writers. Returns the number of messages moved.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    chat = ChatHistory.__table__
+    archive = ChatHistoryArchive.__table__
+    columns = ['id', 'user_id', 'role', 'message', 'topics', 'turn_id', 'created_at']
+
+    moved = 0
+    while True:
+        ids = _ids_batch(ChatHistory, ChatHistory.created_at < cutoff, batch_size)
+        if not ids:
+            break
+
+        copied = select(*(chat.c[name] for name in columns), literal(datetime.utcnow()))\
+            .where(chat.c.id.in_(ids))
+        db.session.execute(archive.insert().from_select(columns + ['archived_at'], copied))
+        db.session.execute(chat.delete().where(chat.c.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+
+        if pause:
+            time.sleep(pause)
+    return moved
+
+def delete_user_chats(user_id, batch_size=500, finish=None):
+    """Delete a user's messages, live and archived, in batches with a commit between
+
+    The last batch of each table is left for the next transaction, so a
+    transaction deletes at most two batches. finish, if given, is called in
+    the transaction that deletes the very last batch and is committed with
+    it. Returns the number of messages deleted.
+    """
+    deleted = 0
+    for model in (ChatHistory, ChatHistoryArchive):
+        table = model.__table__
+        while True:
+            # One id past the batch tells whether another batch follows
+            ids = _ids_batch(model, model.user_id == user_id, batch_size + 1)
+            if ids[:batch_size]:
+                db.session.execute(table.delete().where(table.c.id.in_(ids[:batch_size])))
+                deleted += len(ids[:batch_size])
+            if len(ids) <= batch_size:
+                break
+            db.session.commit()
+    if finish is not None:
+        finish()
+    db.session.commit()
+    return deleted
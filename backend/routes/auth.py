@@ -2,7 +2,9 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash
 from marshmallow import Schema, fields, ValidationError
-from models import db, User, Patient, Nurse
+from models import db, User, Patient, Nurse, PatientStats
+from routes.decorators import get_current_user
+from db_routing import set_writer_identity
 import re
 
 auth_bp = Blueprint('auth', __name__)
@@ -59,7 +61,8 @@ def register():
                 age=data['age'],
                 gender=data['gender'],
                 medical_history=data.get('medical_history', ''),
-                nutrition_needs=data.get('nutrition_needs', '')
+                nutrition_needs=data.get('nutrition_needs', ''),
+                stats=PatientStats()
             )
             db.session.add(patient)
         else:  # nurse
@@ -74,6 +77,7 @@ def register():
             db.session.add(nurse)
         
         db.session.commit()
+        set_writer_identity(user.id)
         
         # Generate JWT token
         access_token = create_access_token(identity=user.id)
@@ -104,6 +108,9 @@ def login():
         if not user or not user.check_password(data['password']):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # A login right after registering must not read a replica without the account
+        set_writer_identity(user.id)
+        
         # Generate JWT token
         access_token = create_access_token(identity=user.id)
         
@@ -124,7 +131,7 @@ def get_profile():
     """Get current user profile"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
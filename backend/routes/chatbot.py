@@ -1,114 +1,229 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import Schema, fields, ValidationError
-from models import db, User, ChatHistory
+from models import db, ChatHistory, PatientStats
+from topics import message_topics, encode_topics
+from retention import delete_user_chats
+from pagination import parse_page_args, keyset_page
+from routes.decorators import get_current_user, nurse_required
+from ai_client import get_ai_client, AIProviderError, AIProviderUnavailable
+from ai_cache import get_ai_cache
 import requests
-import os
 import json
+import uuid
+from functools import partial
 
 chatbot_bp = Blueprint('chatbot', __name__)
 
+# Canned replies used when the AI provider cannot answer
+AI_UNAVAILABLE_MESSAGE = "I'm sorry, the AI service is currently unavailable. Please contact your healthcare provider for assistance."
+AI_ERROR_MESSAGE = "I'm sorry, I'm having trouble processing your request. Please try again later."
+AI_CONNECTION_MESSAGE = "I'm sorry, I'm currently unable to connect to my knowledge base. Please try again later."
+AI_FAILURE_MESSAGE = "I'm sorry, an error occurred while processing your request. Please try again later."
+
+# Generation options sent with every chat completion
+AI_OPTIONS = {'max_tokens': 500, 'temperature': 0.7}
+
+class AIStreamInterrupted(Exception):
+    """The AI provider failed after part of the reply had been streamed"""
+
 class ChatMessageSchema(Schema):
     """Schema for chat message validation"""
     message = fields.Str(required=True, validate=lambda x: len(x.strip()) > 0)
+    # Set to false for personalised questions that must not be answered from the cache
+    use_cache = fields.Bool(required=False, load_default=True)
+
+def save_chat_message(user_id, role, message, patient_id=None, turn_id=None):
+    """Persist a single chat message and commit straight away
+
+    Each message gets its own short transaction so no connection is held
+    open across the call to the AI provider. Messages from patients also
+    update the patient's chat statistics in the same transaction.
+
+    A user message starts a new turn unless turn_id is given; pass the
+    user message's turn_id when saving the reply to it.
+    """
+    topics = message_topics(message) if role == 'user' else frozenset()
+    if turn_id is None and role == 'user':
+        turn_id = uuid.uuid4().hex
+    chat = ChatHistory(
+        user_id=user_id,
+        role=role,
+        message=message,
+        topics=encode_topics(topics) if role == 'user' else None,
+        turn_id=turn_id
+    )
+    db.session.add(chat)
+    
+    if patient_id is not None:
+        db.session.flush()
+        counters = ['chat_messages_count'] + PatientStats.topic_counters(topics)
+        PatientStats.bump(patient_id, counters=counters, last_chat_at=chat.created_at)
+    
+    db.session.commit()
+    return chat
 
-def get_ai_response(user_message, user_role):
-    """Get AI response from external API"""
+def start_chat_turn():
+    """Validate a chat request, save the user's message and release the connection
+
+    Returns the message, its options and the ids needed to save the reply,
+    or None when the user no longer exists. Raises ValidationError for
+    invalid input. The pooled connection is released before returning, as
+    the caller goes on to wait on the AI provider.
+    """
+    data = ChatMessageSchema().load(request.get_json())
+    user = get_current_user()
+    
+    if not user:
+        return None
+    
+    patient_id = user.patient.id if user.patient else None
+    
+    # Store user message in its own short transaction
+    user_chat = save_chat_message(user.id, 'user', data['message'], patient_id)
+    turn = {
+        'user_id': user.id,
+        'user_role': user.role,
+        'patient_id': patient_id,
+        'message': data['message'],
+        'use_cache': data['use_cache'],
+        'turn_id': user_chat.turn_id,
+        'timestamp': user_chat.created_at.isoformat()
+    }
+    
+    # Release the pooled connection while we wait on the AI provider
+    db.session.close()
+    return turn
+
+def build_ai_messages(user_message, user_role):
+    """Build the chat messages sent to the AI provider"""
+    # Create system prompt for health and nutrition context
+    system_prompt = f"""You are a helpful AI assistant for a Nurse-Patient Health & Nutrition Interaction System. 
+    You are speaking with a {user_role}. 
+    
+    IMPORTANT GUIDELINES:
+    - Provide general health awareness and nutrition advice
+    - Give preventive care recommendations
+    - DO NOT provide medical diagnosis or treatment
+    - Always recommend consulting healthcare professionals for medical concerns
+    - Focus on SDG 2 (Zero Hunger) and SDG 3 (Good Health and Well-being)
+    - Be supportive and educational
+    - Keep responses concise but informative
+    
+    Your role is to provide health education and nutrition guidance, not medical treatment."""
+    
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': user_message}
+    ]
+
+def cached_ai_response(user_message, user_role, use_cache):
+    """Return (cache, key, cached reply) for a message
+
+    cache and key are None when caching is disabled or bypassed; the cached
+    reply is None on a miss.
+    """
+    cache = get_ai_cache()
+    if cache is None:
+        return None, None, None
+    if not use_cache:
+        cache.record_bypass()
+        return None, None, None
+    
+    key = cache.key(user_message, user_role, get_ai_client().model)
+    return cache, key, cache.get(key)
+
+def get_ai_response(user_message, user_role, use_cache=True):
+    """Get AI response from external API, or from the response cache"""
     try:
-        api_key = os.environ.get('AI_API_KEY')
-        api_url = os.environ.get('AI_API_URL')
-        model = os.environ.get('AI_MODEL', 'gpt-3.5-turbo')
-        
-        if not api_key:
-            return "I'm sorry, the AI service is currently unavailable. Please contact your healthcare provider for assistance."
-        
-        # Create system prompt for health and nutrition context
-        system_prompt = f"""You are a helpful AI assistant for a Nurse-Patient Health & Nutrition Interaction System. 
-        You are speaking with a {user_role}. 
-        
-        IMPORTANT GUIDELINES:
-        - Provide general health awareness and nutrition advice
-        - Give preventive care recommendations
-        - DO NOT provide medical diagnosis or treatment
-        - Always recommend consulting healthcare professionals for medical concerns
-        - Focus on SDG 2 (Zero Hunger) and SDG 3 (Good Health and Well-being)
-        - Be supportive and educational
-        - Keep responses concise but informative
-        
-        Your role is to provide health education and nutrition guidance, not medical treatment."""
-        
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
-        
-        data = {
-            'model': model,
-            'messages': [
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_message}
-            ],
-            'max_tokens': 500,
-            'temperature': 0.7
-        }
-        
-        response = requests.post(api_url, headers=headers, json=data, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            ai_message = result['choices'][0]['message']['content']
-            return ai_message
-        else:
-            return "I'm sorry, I'm having trouble processing your request. Please try again later."
-            
-    except requests.exceptions.RequestException:
-        return "I'm sorry, I'm currently unable to connect to my knowledge base. Please try again later."
+        client = get_ai_client()
+        
+        if not client.configured:
+            return AI_UNAVAILABLE_MESSAGE
+        
+        cache, key, cached = cached_ai_response(user_message, user_role, use_cache)
+        if cached is not None:
+            return cached
+        
+        ai_message = client.complete(build_ai_messages(user_message, user_role), **AI_OPTIONS)
+        
+        # Only real answers are cached, never the canned fallbacks
+        if cache is not None:
+            cache.set(key, ai_message)
+        return ai_message
+        
+    except AIProviderUnavailable:
+        return AI_CONNECTION_MESSAGE
+    except AIProviderError as e:
+        if isinstance(e.__cause__, requests.exceptions.RequestException):
+            return AI_CONNECTION_MESSAGE
+        return AI_ERROR_MESSAGE
     except Exception as e:
-        return "I'm sorry, an error occurred while processing your request. Please try again later."
+        return AI_FAILURE_MESSAGE
+
+def stream_ai_response(user_message, user_role, use_cache=True):
+    """Yield the AI response in chunks as the provider generates it
+
+    A cached reply is sent as a single chunk. Falls back to the same canned
+    messages as get_ai_response when nothing could be streamed, and raises
+    AIStreamInterrupted when the provider fails part way through a reply.
+    """
+    client = get_ai_client()
+    
+    if not client.configured:
+        yield AI_UNAVAILABLE_MESSAGE
+        return
+    
+    cache, key, cached = cached_ai_response(user_message, user_role, use_cache)
+    if cached is not None:
+        yield cached
+        return
+    
+    chunks = []
+    try:
+        for chunk in client.stream(build_ai_messages(user_message, user_role), **AI_OPTIONS):
+            chunks.append(chunk)
+            yield chunk
+    except AIProviderUnavailable:
+        yield AI_CONNECTION_MESSAGE
+        return
+    except AIProviderError as e:
+        if chunks:
+            raise AIStreamInterrupted(str(e)) from e
+        if isinstance(e.__cause__, requests.exceptions.RequestException):
+            yield AI_CONNECTION_MESSAGE
+        else:
+            yield AI_ERROR_MESSAGE
+        return
+    
+    if cache is not None and chunks:
+        cache.set(key, ''.join(chunks))
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @chatbot_bp.route('/chat', methods=['POST'])
 @jwt_required()
 def chat():
     """Send a message to the AI chatbot and get response"""
     try:
-        # Validate input data
-        schema = ChatMessageSchema()
-        data = schema.load(request.get_json())
-        
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        turn = start_chat_turn()
         
-        if not user:
+        if turn is None:
             return jsonify({'error': 'User not found'}), 404
         
-        user_message = data['message']
-        
-        # Store user message
-        user_chat = ChatHistory(
-            user_id=user_id,
-            role='user',
-            message=user_message
-        )
-        db.session.add(user_chat)
-        db.session.flush()
-        
         # Get AI response
-        ai_response = get_ai_response(user_message, user.role)
+        ai_response = get_ai_response(turn['message'], turn['user_role'], use_cache=turn['use_cache'])
         
         # Store AI response
-        ai_chat = ChatHistory(
-            user_id=user_id,
-            role='assistant',
-            message=ai_response
-        )
-        db.session.add(ai_chat)
-        db.session.commit()
+        save_chat_message(turn['user_id'], 'assistant', ai_response, turn['patient_id'], turn_id=turn['turn_id'])
         
         return jsonify({
             'message': 'Chat response generated successfully',
-            'user_message': user_message,
+            'user_message': turn['message'],
             'ai_response': ai_response,
-            'timestamp': user_chat.created_at.isoformat()
+            'timestamp': turn['timestamp']
         }), 200
         
     except ValidationError as e:
@@ -117,38 +232,106 @@ def chat():
         db.session.rollback()
         return jsonify({'error': 'Chat failed', 'details': str(e)}), 500
 
+@chatbot_bp.route('/chat/stream', methods=['POST'])
+@jwt_required()
+def chat_stream():
+    """Send a message to the AI chatbot and stream the response as server-sent events
+
+    Emits "token" events as text arrives, then a single "done" event once the
+    full reply has been saved to chat history. If the provider fails part way
+    through, an "error" event follows the tokens instead and the canned error
+    reply is saved in place of the cut-off text.
+    """
+    try:
+        turn = start_chat_turn()
+        
+        if turn is None:
+            return jsonify({'error': 'User not found'}), 404
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Validation error', 'details': e.messages}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Chat failed', 'details': str(e)}), 500
+    
+    def generate():
+        chunks = []
+        try:
+            for chunk in stream_ai_response(turn['message'], turn['user_role'], use_cache=turn['use_cache']):
+                chunks.append(chunk)
+                yield sse_event('token', {'token': chunk})
+            interrupted = None
+        except AIStreamInterrupted as e:
+            interrupted = e
+        
+        # Never keep a cut-off answer as the reply to this turn
+        ai_response = AI_ERROR_MESSAGE if interrupted else ''.join(chunks)
+        try:
+            save_chat_message(turn['user_id'], 'assistant', ai_response, turn['patient_id'], turn_id=turn['turn_id'])
+        except Exception as e:
+            db.session.rollback()
+            yield sse_event('error', {'error': 'Failed to save response', 'details': str(e)})
+            return
+        
+        if interrupted:
+            yield sse_event('error', {
+                'error': 'AI response interrupted',
+                'ai_response': ai_response,
+                'timestamp': turn['timestamp']
+            })
+            return
+        
+        yield sse_event('done', {
+            'user_message': turn['message'],
+            'ai_response': ai_response,
+            'timestamp': turn['timestamp']
+        })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @chatbot_bp.route('/history', methods=['GET'])
 @jwt_required()
 def get_chat_history():
-    """Get chat history for the current user"""
+    """Get chat history for the current user, newest first, one page at a time
+
+    Query parameters: limit (default 50, max 200) and before, the
+    next_cursor of the previous page. Each page is returned as conversations
+    in chronological order, grouped by turn_id. A turn can straddle two
+    pages; clients merge its messages by turn_id.
+    """
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get recent chat history (last 50 messages)
-        chat_history = ChatHistory.query.filter_by(user_id=user_id)\
-            .order_by(ChatHistory.created_at.desc())\
-            .limit(50)\
-            .all()
+        try:
+            limit, position = parse_page_args(request.args, cursor_param='before')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Group messages by conversation (pair user and assistant messages)
-        conversations = []
-        current_conversation = []
+        chat_history, next_cursor = keyset_page(
+            ChatHistory.query.filter(ChatHistory.user_id == user_id),
+            ChatHistory, limit, position
+        )
         
+        # Group messages by the turn they were saved under; messages saved
+        # before turns existed (no turn_id) stand on their own
+        conversations = {}
         for chat in reversed(chat_history):  # Reverse to get chronological order
-            current_conversation.append(chat.to_dict())
-            
-            # If we have a pair (user + assistant) or it's the last message
-            if len(current_conversation) == 2 or chat == chat_history[-1]:
-                conversations.append(current_conversation)
-                current_conversation = []
+            key = chat.turn_id or f'message-{chat.id}'
+            conversations.setdefault(key, []).append(chat.serialize())
         
         return jsonify({
             'user_id': user_id,
-            'conversations': conversations
+            'conversations': list(conversations.values()),
+            'limit': limit,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -160,19 +343,40 @@ def clear_chat_history():
     """Clear chat history for the current user"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = get_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Delete all chat history for the user
-        ChatHistory.query.filter_by(user_id=user_id).delete()
-        db.session.commit()
+        patient_id = user.patient.id if user.patient else None
+        
+        # Zero the chat stats in the same transaction as the last deleted batch
+        reset_stats = None
+        if patient_id is not None:
+            reset_stats = partial(PatientStats.bump, patient_id, chat_messages_count=0, health_chat_count=0,
+                                  nutrition_chat_count=0, last_chat_at=None)
+        
+        # Delete all chat history for the user, live and archived, in short batches
+        deleted = delete_user_chats(user_id, current_app.config.get('CHAT_DELETE_BATCH_SIZE', 500),
+                                    finish=reset_stats)
         
         return jsonify({
-            'message': 'Chat history cleared successfully'
+            'message': 'Chat history cleared successfully',
+            'deleted': deleted
         }), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to clear chat history', 'details': str(e)}), 500
+
+@chatbot_bp.route('/cache-stats', methods=['GET'])
+@jwt_required()
+@nurse_required
+def get_cache_stats():
+    """Get hit and miss counters of the AI response cache (nurses only)"""
+    cache = get_ai_cache()
+    
+    if cache is None:
+        return jsonify({'enabled': False}), 200
+    
+    return jsonify({'enabled': True, **cache.stats()}), 200
@@ -0,0 +1,52 @@
+from flask import g, jsonify
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.orm import joinedload
+from models import User, Patient
+from functools import wraps
+
+def get_current_user():
+    """Get the authenticated user with their patient (and its stats) or nurse profile
+
+    Loaded with a single query the first time it is needed in a request and
+    kept on flask.g, so decorators and handlers share one lookup.
+    """
+    if 'current_user' not in g:
+        user_id = get_jwt_identity()
+        g.current_user = User.query.options(
+            joinedload(User.patient).joinedload(Patient.stats),
+            joinedload(User.nurse)
+        ).filter(User.id == user_id).first() if user_id is not None else None
+    return g.current_user
+
+def reset_current_user():
+    """Forget the cached user at the start of each request"""
+    g.pop('current_user', None)
+
+def nurse_required(f):
+    """Decorator to ensure user is a nurse"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user = get_current_user()
+
+        if not user or user.role != 'nurse':
+            return jsonify({'error': 'Nurse access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+def patient_access_required(f):
+    """Decorator to ensure user can access patient data"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user = get_current_user()
+
+        if not user:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        # Nurses can access any patient, patients can only access their own data
+        if user.role == 'patient':
+            patient_id = kwargs.get('id')
+            if not user.patient or user.patient.id != int(patient_id):
+                return jsonify({'error': 'Access denied'}), 403
+
+        return f(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,47 @@
+from datetime import timedelta
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required
+from export import Export, EXPORT_MODELS, EXPORT_FORMATS, parse_watermark
+from routes.decorators import nurse_required
+
+exports_bp = Blueprint('exports', __name__)
+
+@exports_bp.route('/<table>', methods=['GET'])
+@jwt_required()
+@nurse_required
+def export_table(table):
+    """Stream every row of a table as NDJSON or CSV (nurses only)
+
+    Query parameters: format (ndjson or csv) and since, an ISO timestamp.
+    The X-Export-Watermark header holds the value to pass as since next time
+    to fetch only rows added after this export; rows from the last
+    EXPORT_SAFETY_LAG_SECONDS are left for that next export.
+    """
+    try:
+        if table not in EXPORT_MODELS:
+            return jsonify({'error': f"Unknown export table, expected one of: {', '.join(EXPORT_MODELS)}"}), 404
+        
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f"Unknown format, expected one of: {', '.join(EXPORT_FORMATS)}"}), 400
+        
+        try:
+            since = parse_watermark(request.args.get('since'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        lag = timedelta(seconds=current_app.config['EXPORT_SAFETY_LAG_SECONDS'])
+        export = Export(table, export_format, since=since, lag=lag)
+        
+    except Exception as e:
+        return jsonify({'error': 'Export failed', 'details': str(e)}), 500
+    
+    return Response(
+        stream_with_context(export.chunks()),
+        mimetype=export.content_type,
+        headers={
+            'Content-Disposition': f'attachment; filename="{export.filename}"',
+            'X-Export-Watermark': export.watermark,
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -0,0 +1,13 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required
+from db_pool import pool_stats
+from routes.decorators import nurse_required
+
+internal_bp = Blueprint('internal', __name__)
+
+@internal_bp.route('/pool-stats', methods=['GET'])
+@jwt_required()
+@nurse_required
+def get_pool_stats():
+    """Get checkout, wait, overflow and invalidation counters of the database pools"""
+    return jsonify({'pools': pool_stats()}), 200
@@ -1,42 +1,16 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from marshmallow import Schema, fields, ValidationError
-from models import db, User, Patient, Nurse, HealthRecord, NutritionPlan
-from functools import wraps
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import jwt_required
+from marshmallow import Schema, fields, validate, ValidationError, EXCLUDE
+from datetime import datetime, timedelta
+from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import joinedload
+from models import db, User, Patient, Nurse, HealthRecord, NutritionPlan, ChatHistory, PatientStats
+from pagination import parse_page_args, keyset_page, encode_cursor
+from conditional import patient_state, make_etag, is_not_modified, add_validators, not_modified
+from routes.decorators import get_current_user, nurse_required, patient_access_required
 
 patients_bp = Blueprint('patients', __name__)
 
-def nurse_required(f):
-    """Decorator to ensure user is a nurse"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user or user.role != 'nurse':
-            return jsonify({'error': 'Nurse access required'}), 403
-        return f(*args, **kwargs)
-    return decorated_function
-
-def patient_access_required(f):
-    """Decorator to ensure user can access patient data"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({'error': 'Authentication required'}), 401
-        
-        # Nurses can access any patient, patients can only access their own data
-        if user.role == 'patient':
-            patient_id = kwargs.get('id')
-            if not user.patient or user.patient.id != int(patient_id):
-                return jsonify({'error': 'Access denied'}), 403
-        
-        return f(*args, **kwargs)
-    return decorated_function
-
 class HealthRecordSchema(Schema):
     """Schema for health record validation"""
     checkup_notes = fields.Str(required=True, validate=lambda x: len(x.strip()) > 0)
@@ -46,18 +20,156 @@ class NutritionPlanSchema(Schema):
     """Schema for nutrition plan validation"""
     diet_plan = fields.Str(required=True, validate=lambda x: len(x.strip()) > 0)
 
+class BatchItemSchema(Schema):
+    """Schema for the type and patient of one item in a batch upload"""
+    class Meta:
+        unknown = EXCLUDE
+    
+    type = fields.Str(required=True, validate=validate.OneOf(['health_record', 'nutrition_plan']))
+    patient_id = fields.Int(required=True)
+
+# Item type -> (model, body schema, stats counter, stats timestamp column)
+BATCH_ITEM_TYPES = {
+    'health_record': (HealthRecord, HealthRecordSchema, 'health_records_count', 'last_checkup_at'),
+    'nutrition_plan': (NutritionPlan, NutritionPlanSchema, 'nutrition_plans_count', 'last_plan_at'),
+}
+
+# Stands in for "never checked up" in worklist cursors; never-seen patients
+# sort as the most overdue
+NEVER_CHECKED = datetime(1970, 1, 1)
+
+def _after_checkup(position, order):
+    """Keyset condition for the worklist rows after (last_checkup_at, patient_id)
+
+    Pages on the raw columns so ix_patient_stats_last_checkup_at_patient_id
+    serves the order. NULLs (never checked) sort first ascending and last
+    descending, as MySQL and SQLite order them, and get their own branch.
+    """
+    checked_at, patient_id = position
+    checked_at = None if checked_at == NEVER_CHECKED else checked_at
+    column, key = PatientStats.last_checkup_at, PatientStats.patient_id
+    if order == 'asc':
+        if checked_at is None:
+            return or_(and_(column.is_(None), key > patient_id), column.isnot(None))
+        return or_(column > checked_at, and_(column == checked_at, key > patient_id))
+    if checked_at is None:
+        return and_(column.is_(None), key < patient_id)
+    return or_(column < checked_at, and_(column == checked_at, key < patient_id), column.is_(None))
+
+def _treated_at_hospital(hospital):
+    """SQL condition: a nurse from hospital wrote a record or plan for the patient"""
+    return or_(
+        HealthRecord.query.join(Nurse).filter(
+            HealthRecord.patient_id == Patient.id, Nurse.hospital == hospital
+        ).exists(),
+        NutritionPlan.query.join(Nurse).filter(
+            NutritionPlan.patient_id == Patient.id, Nurse.hospital == hospital
+        ).exists()
+    )
+
+@patients_bp.route('', methods=['GET'])
+@jwt_required()
+@nurse_required
+def list_patients():
+    """Nurse worklist: every patient with their summary, one page at a time
+
+    Query parameters: hospital (patients seen by that hospital's nurses),
+    stale_days (no checkup in that many days), order (asc: most overdue
+    first, the default; desc: most recently checked first), limit, cursor.
+    """
+    try:
+        try:
+            limit, position = parse_page_args(request.args, default_limit=100)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        stale_days = request.args.get('stale_days')
+        if stale_days is not None:
+            if not stale_days.isdigit():
+                return jsonify({'error': 'Invalid stale_days'}), 400
+            stale_days = int(stale_days)
+        
+        order = request.args.get('order', 'asc')
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': 'Invalid order, expected asc or desc'}), 400
+        
+        # Driven from patient_stats (every patient has a row: register, seed
+        # and backfill-patient-stats create them) so its index serves the order
+        last_checkup = PatientStats.last_checkup_at
+        query = db.session.query(
+            Patient.id, Patient.user_id, Patient.age, Patient.gender, User.name,
+            last_checkup.label('last_checkup'), PatientStats.last_plan_at
+        ).select_from(PatientStats)\
+            .join(Patient, Patient.id == PatientStats.patient_id)\
+            .join(User, User.id == Patient.user_id)
+        
+        hospital = request.args.get('hospital')
+        if hospital:
+            query = query.filter(_treated_at_hospital(hospital))
+        if stale_days is not None:
+            query = query.filter(or_(last_checkup.is_(None),
+                                     last_checkup < datetime.utcnow() - timedelta(days=stale_days)))
+        
+        if position is not None:
+            query = query.filter(_after_checkup(position, order))
+        
+        key = PatientStats.patient_id
+        ordering = (last_checkup, key) if order == 'asc' else (last_checkup.desc(), key.desc())
+        rows = query.order_by(*ordering).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].last_checkup or NEVER_CHECKED, rows[-1].id)
+        
+        # This week's chat counts for the whole page with one grouped query
+        chats_this_week = dict(db.session.query(ChatHistory.user_id, func.count(ChatHistory.id)).filter(
+            ChatHistory.user_id.in_([row.user_id for row in rows]),
+            ChatHistory.created_at >= datetime.utcnow() - timedelta(days=7)
+        ).group_by(ChatHistory.user_id).all()) if rows else {}
+        
+        patients = []
+        for row in rows:
+            checked_at = row.last_checkup
+            patients.append({
+                'id': row.id,
+                'name': row.name,
+                'age': row.age,
+                'gender': row.gender,
+                'last_health_checkup': checked_at.isoformat() if checked_at else None,
+                'last_nutrition_plan': row.last_plan_at.isoformat() if row.last_plan_at else None,
+                'chat_interactions_this_week': chats_this_week.get(row.user_id, 0)
+            })
+        
+        return jsonify({
+            'patients': patients,
+            'limit': limit,
+            'next_cursor': next_cursor
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to list patients', 'details': str(e)}), 500
+
 @patients_bp.route('/<int:id>', methods=['GET'])
 @jwt_required()
 @patient_access_required
 def get_patient(id):
-    """Get patient profile by ID"""
+    """Get patient profile by ID
+
+    Supports If-None-Match and If-Modified-Since; unchanged profiles get 304.
+    """
     try:
-        patient = Patient.query.get(id)
+        patient = Patient.query.options(joinedload(Patient.stats)).get(id)
         
         if not patient:
             return jsonify({'error': 'Patient not found'}), 404
         
-        return jsonify(patient.to_dict()), 200
+        version, updated_at = patient_state(patient)
+        etag = make_etag('patient', id, version, updated_at)
+        if is_not_modified(etag, updated_at):
+            return not_modified(etag, updated_at)
+        
+        return add_validators(jsonify(patient.serialize()), etag, updated_at), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get patient', 'details': str(e)}), 500
@@ -66,19 +178,38 @@ def get_patient(id):
 @jwt_required()
 @patient_access_required
 def get_patient_records(id):
-    """Get health records for a patient"""
+    """Get health records for a patient, newest first, one page at a time
+
+    Supports If-None-Match and If-Modified-Since; unchanged pages get 304.
+    """
     try:
-        patient = Patient.query.get(id)
+        try:
+            limit, position = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        patient = Patient.query.options(joinedload(Patient.stats)).get(id)
         
         if not patient:
             return jsonify({'error': 'Patient not found'}), 404
         
-        records = patient.health_records.order_by(HealthRecord.created_at.desc()).all()
+        # Each page is its own URL, so one patient version covers them all
+        version, updated_at = patient_state(patient)
+        etag = make_etag('records', id, version, updated_at)
+        if is_not_modified(etag, updated_at):
+            return not_modified(etag, updated_at)
         
-        return jsonify({
+        records, next_cursor = keyset_page(
+            patient.health_records.options(HealthRecord.with_nurse()),
+            HealthRecord, limit, position
+        )
+        
+        return add_validators(jsonify({
             'patient_id': id,
-            'records': [record.to_dict() for record in records]
-        }), 200
+            'records': [record.serialize() for record in records],
+            'limit': limit,
+            'next_cursor': next_cursor
+        }), etag, updated_at), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get records', 'details': str(e)}), 500
@@ -98,9 +229,8 @@ def add_health_record(id):
         if not patient:
             return jsonify({'error': 'Patient not found'}), 404
         
-        # Get current nurse
-        user_id = get_jwt_identity()
-        nurse = Nurse.query.filter_by(user_id=user_id).first()
+        # Get current nurse (loaded along with the user by nurse_required)
+        nurse = get_current_user().nurse
         
         if not nurse:
             return jsonify({'error': 'Nurse profile not found'}), 404
@@ -114,6 +244,8 @@ def add_health_record(id):
         )
         
         db.session.add(record)
+        db.session.flush()
+        PatientStats.bump(id, counters=['health_records_count'], last_checkup_at=record.created_at)
         db.session.commit()
         
         return jsonify({
@@ -127,23 +259,128 @@ def add_health_record(id):
         db.session.rollback()
         return jsonify({'error': 'Failed to add record', 'details': str(e)}), 500
 
+@patients_bp.route('/records:batch', methods=['POST'])
+@jwt_required()
+@nurse_required
+def add_records_batch():
+    """Add many health records and nutrition plans, for any patients, in one transaction (nurses only)
+
+    Each item is validated on its own. Valid items are inserted together and
+    invalid ones are reported back by index without blocking the rest.
+    """
+    try:
+        data = request.get_json()
+        items = data.get('items') if isinstance(data, dict) else None
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Validation error', 'details': {'items': ['A non-empty list is required.']}}), 400
+        
+        max_items = current_app.config.get('BATCH_MAX_ITEMS', 500)
+        if len(items) > max_items:
+            return jsonify({'error': f'Batch too large, at most {max_items} items allowed'}), 400
+        
+        nurse = get_current_user().nurse
+        if not nurse:
+            return jsonify({'error': 'Nurse profile not found'}), 404
+        
+        # Validate every item first
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValidationError({'_schema': ['Item must be an object.']})
+                header = BatchItemSchema().load(item)
+                model, schema, counter, timestamp = BATCH_ITEM_TYPES[header['type']]
+                body = schema().load({k: v for k, v in item.items() if k not in ('type', 'patient_id')})
+                valid.append((index, header, body))
+            except ValidationError as e:
+                results[index] = {'index': index, 'status': 'error', 'errors': e.messages}
+        
+        # One query to check that every referenced patient exists
+        patient_ids = {header['patient_id'] for _, header, _ in valid}
+        existing = {patient_id for (patient_id,) in db.session.query(Patient.id).filter(Patient.id.in_(patient_ids))} \
+            if patient_ids else set()
+        
+        now = datetime.utcnow()
+        created = []
+        stats = {}
+        for index, header, body in valid:
+            patient_id = header['patient_id']
+            if patient_id not in existing:
+                results[index] = {'index': index, 'status': 'error', 'errors': {'patient_id': ['Patient not found.']}}
+                continue
+            
+            model, schema, counter, timestamp = BATCH_ITEM_TYPES[header['type']]
+            row = model(patient_id=patient_id, nurse_id=nurse.id, created_at=now, **body)
+            if model is HealthRecord:
+                row.prescriptions = body.get('prescriptions', '')
+            created.append((index, header['type'], row))
+            
+            patient_stats = stats.setdefault(patient_id, {'counters': {}, 'values': {}})
+            patient_stats['counters'][counter] = patient_stats['counters'].get(counter, 0) + 1
+            patient_stats['values'][timestamp] = now
+        
+        if created:
+            db.session.add_all([row for _, _, row in created])
+            db.session.flush()
+            for patient_id, patient_stats in stats.items():
+                PatientStats.bump(patient_id, counters=patient_stats['counters'], **patient_stats['values'])
+            
+            for index, item_type, row in created:
+                results[index] = {'index': index, 'status': 'created', 'type': item_type, 'id': row.id}
+            db.session.commit()
+        
+        failed = sum(1 for result in results if result['status'] == 'error')
+        status_code = 201 if not failed else 207 if created else 400
+        
+        return jsonify({
+            'message': f'{len(created)} items added, {failed} failed',
+            'created': len(created),
+            'failed': failed,
+            'results': results
+        }), status_code
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to add batch', 'details': str(e)}), 500
+
 @patients_bp.route('/<int:id>/nutrition', methods=['GET'])
 @jwt_required()
 @patient_access_required
 def get_nutrition_plans(id):
-    """Get nutrition plans for a patient"""
+    """Get nutrition plans for a patient, newest first, one page at a time
+
+    Supports If-None-Match and If-Modified-Since; unchanged pages get 304.
+    """
     try:
-        patient = Patient.query.get(id)
+        try:
+            limit, position = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        patient = Patient.query.options(joinedload(Patient.stats)).get(id)
         
         if not patient:
             return jsonify({'error': 'Patient not found'}), 404
         
-        plans = patient.nutrition_plans.order_by(NutritionPlan.created_at.desc()).all()
+        # Each page is its own URL, so one patient version covers them all
+        version, updated_at = patient_state(patient)
+        etag = make_etag('nutrition', id, version, updated_at)
+        if is_not_modified(etag, updated_at):
+            return not_modified(etag, updated_at)
         
-        return jsonify({
+        plans, next_cursor = keyset_page(
+            patient.nutrition_plans.options(NutritionPlan.with_nurse()),
+            NutritionPlan, limit, position
+        )
+        
+        return add_validators(jsonify({
             'patient_id': id,
-            'plans': [plan.to_dict() for plan in plans]
-        }), 200
+            'plans': [plan.serialize() for plan in plans],
+            'limit': limit,
+            'next_cursor': next_cursor
+        }), etag, updated_at), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get nutrition plans', 'details': str(e)}), 500
@@ -163,9 +400,8 @@ def add_nutrition_plan(id):
         if not patient:
             return jsonify({'error': 'Patient not found'}), 404
         
-        # Get current nurse
-        user_id = get_jwt_identity()
-        nurse = Nurse.query.filter_by(user_id=user_id).first()
+        # Get current nurse (loaded along with the user by nurse_required)
+        nurse = get_current_user().nurse
         
         if not nurse:
             return jsonify({'error': 'Nurse profile not found'}), 404
@@ -178,6 +414,8 @@ def add_nutrition_plan(id):
         )
         
         db.session.add(plan)
+        db.session.flush()
+        PatientStats.bump(id, counters=['nutrition_plans_count'], last_plan_at=plan.created_at)
         db.session.commit()
         
         return jsonify({
@@ -214,6 +452,8 @@ def update_patient(id):
         if 'nutrition_needs' in data:
             patient.nutrition_needs = data['nutrition_needs']
         
+        # New version for the profile's ETag
+        PatientStats.bump(id)
         db.session.commit()
         
         return jsonify({
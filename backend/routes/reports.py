@@ -1,42 +1,18 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, Patient, Nurse, HealthRecord, NutritionPlan, ChatHistory
-from functools import wraps
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required
+from models import db, Patient, HealthRecord, NutritionPlan, ChatHistory
+from topics import get_classifier, has_topic
+from conditional import patient_state, make_etag, is_not_modified, add_validators, not_modified
+from routes.decorators import patient_access_required
 from datetime import datetime, timedelta
-import json
+from sqlalchemy import func, case, and_
+from sqlalchemy.orm import joinedload
 
 reports_bp = Blueprint('reports', __name__)
 
-def nurse_required(f):
-    """Decorator to ensure user is a nurse"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user or user.role != 'nurse':
-            return jsonify({'error': 'Nurse access required'}), 403
-        return f(*args, **kwargs)
-    return decorated_function
-
-def patient_access_required(f):
-    """Decorator to ensure user can access patient data"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({'error': 'Authentication required'}), 401
-        
-        # Nurses can access any patient, patients can only access their own data
-        if user.role == 'patient':
-            patient_id = kwargs.get('id')
-            if not user.patient or user.patient.id != int(patient_id):
-                return jsonify({'error': 'Access denied'}), 403
-        
-        return f(*args, **kwargs)
-    return decorated_function
+def _count_user_messages_about(topic):
+    """SQL expression counting user messages classified under a topic"""
+    return func.sum(case((and_(ChatHistory.role == 'user', has_topic(ChatHistory.topics, topic)), 1), else_=0))
 
 @reports_bp.route('/<int:id>', methods=['GET'])
 @jwt_required()
@@ -49,28 +25,36 @@ def generate_patient_report(id):
         if not patient:
             return jsonify({'error': 'Patient not found'}), 404
         
-        # Get recent health records (last 6 months)
+        # Recent health records (last 6 months): count in SQL, fetch only the 5 we serialize
         six_months_ago = datetime.utcnow() - timedelta(days=180)
-        recent_records = patient.health_records.filter(
-            HealthRecord.created_at >= six_months_ago
-        ).order_by(HealthRecord.created_at.desc()).all()
-        
-        # Get recent nutrition plans (last 6 months)
-        recent_plans = patient.nutrition_plans.filter(
-            NutritionPlan.created_at >= six_months_ago
-        ).order_by(NutritionPlan.created_at.desc()).all()
-        
-        # Get recent chat interactions (last 30 days)
+        records_query = patient.health_records.filter(HealthRecord.created_at >= six_months_ago)
+        total_records = records_query.with_entities(func.count(HealthRecord.id)).scalar()
+        recent_records = records_query.options(HealthRecord.with_nurse())\
+            .order_by(HealthRecord.created_at.desc(), HealthRecord.id.desc())\
+            .limit(5)\
+            .all()
+        
+        # Recent nutrition plans (last 6 months)
+        plans_query = patient.nutrition_plans.filter(NutritionPlan.created_at >= six_months_ago)
+        total_plans = plans_query.with_entities(func.count(NutritionPlan.id)).scalar()
+        recent_plans = plans_query.options(NutritionPlan.with_nurse())\
+            .order_by(NutritionPlan.created_at.desc(), NutritionPlan.id.desc())\
+            .limit(5)\
+            .all()
+        
+        # Recent chat interactions (last 30 days), with topic counts over user messages
         thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        recent_chats = ChatHistory.query.filter(
+        chat_topics = get_classifier().topics
+        total_chat_interactions, *topic_counts = db.session.query(
+            func.count(ChatHistory.id),
+            *[_count_user_messages_about(topic) for topic in chat_topics]
+        ).filter(
             ChatHistory.user_id == patient.user_id,
             ChatHistory.created_at >= thirty_days_ago
-        ).order_by(ChatHistory.created_at.desc()).all()
-        
-        # Calculate statistics
-        total_records = len(recent_records)
-        total_plans = len(recent_plans)
-        total_chat_interactions = len(recent_chats)
+        ).one()
+        topic_counts = {topic: count or 0 for topic, count in zip(chat_topics, topic_counts)}
+        health_chat_count = topic_counts['health']
+        nutrition_chat_count = topic_counts['nutrition']
         
         # Get latest health record
         latest_record = recent_records[0] if recent_records else None
@@ -78,21 +62,6 @@ def generate_patient_report(id):
         # Get latest nutrition plan
         latest_plan = recent_plans[0] if recent_plans else None
         
-        # Analyze chat topics (simple keyword analysis)
-        health_keywords = ['health', 'symptom', 'pain', 'medicine', 'treatment', 'doctor']
-        nutrition_keywords = ['diet', 'food', 'nutrition', 'vitamin', 'meal', 'eating']
-        
-        health_chat_count = 0
-        nutrition_chat_count = 0
-        
-        for chat in recent_chats:
-            if chat.role == 'user':
-                message_lower = chat.message.lower()
-                if any(keyword in message_lower for keyword in health_keywords):
-                    health_chat_count += 1
-                if any(keyword in message_lower for keyword in nutrition_keywords):
-                    nutrition_chat_count += 1
-        
         # Generate report
         report = {
             'patient_info': {
@@ -116,14 +85,15 @@ def generate_patient_report(id):
                 'health_related_chats': health_chat_count,
                 'nutrition_related_chats': nutrition_chat_count
             },
-            'latest_health_record': latest_record.to_dict() if latest_record else None,
-            'latest_nutrition_plan': latest_plan.to_dict() if latest_plan else None,
-            'recent_health_records': [record.to_dict() for record in recent_records[:5]],  # Last 5 records
-            'recent_nutrition_plans': [plan.to_dict() for plan in recent_plans[:5]],  # Last 5 plans
+            'latest_health_record': latest_record.serialize() if latest_record else None,
+            'latest_nutrition_plan': latest_plan.serialize() if latest_plan else None,
+            'recent_health_records': [record.serialize() for record in recent_records[:5]],  # Last 5 records
+            'recent_nutrition_plans': [plan.serialize() for plan in recent_plans[:5]],  # Last 5 plans
             'recent_chat_summary': {
                 'total_messages': total_chat_interactions,
                 'health_queries': health_chat_count,
                 'nutrition_queries': nutrition_chat_count,
+                'topics': topic_counts,
                 'engagement_level': 'High' if total_chat_interactions > 10 else 'Medium' if total_chat_interactions > 5 else 'Low'
             },
             'recommendations': {
@@ -158,43 +128,63 @@ def generate_patient_report(id):
 @jwt_required()
 @patient_access_required
 def get_patient_summary(id):
-    """Get a brief summary of patient's health and nutrition status"""
+    """Get a brief summary of patient's health and nutrition status
+
+    Supports If-None-Match; unchanged summaries get 304. There is no
+    Last-Modified because the weekly chat count changes as messages age out.
+    """
     try:
-        patient = Patient.query.get(id)
+        # One statement: patient and user, the patient_stats row, and the
+        # week's chat count as an index-only subquery
+        chats_this_week = db.session.query(func.count(ChatHistory.id)).filter(
+            ChatHistory.user_id == Patient.user_id,
+            ChatHistory.created_at >= datetime.utcnow() - timedelta(days=7)
+        ).correlate(Patient).scalar_subquery()
         
-        if not patient:
+        row = db.session.query(Patient, chats_this_week)\
+            .options(joinedload(Patient.user), joinedload(Patient.stats))\
+            .filter(Patient.id == id)\
+            .first()
+        
+        if not row:
             return jsonify({'error': 'Patient not found'}), 404
         
-        # Get latest health record
-        latest_record = patient.health_records.order_by(HealthRecord.created_at.desc()).first()
+        patient, recent_chats = row
         
-        # Get latest nutrition plan
-        latest_plan = patient.nutrition_plans.order_by(NutritionPlan.created_at.desc()).first()
+        # The ETag covers the patient's version and the weekly count
+        etag = make_etag('summary', id, *patient_state(patient), recent_chats)
+        if is_not_modified(etag):
+            return not_modified(etag)
         
-        # Get recent chat activity
-        recent_chats = ChatHistory.query.filter(
-            ChatHistory.user_id == patient.user_id,
-            ChatHistory.created_at >= datetime.utcnow() - timedelta(days=7)
-        ).count()
+        stats = patient.stats
+        last_checkup = stats.last_checkup_at if stats else None
+        last_plan = stats.last_plan_at if stats else None
         
         summary = {
             'patient_name': patient.user.name,
             'age': patient.age,
             'gender': patient.gender,
-            'last_health_checkup': latest_record.created_at.isoformat() if latest_record else None,
-            'last_nutrition_plan': latest_plan.created_at.isoformat() if latest_plan else None,
+            'last_health_checkup': last_checkup.isoformat() if last_checkup else None,
+            'last_nutrition_plan': last_plan.isoformat() if last_plan else None,
             'recent_activity': {
                 'chat_interactions_this_week': recent_chats,
                 'engagement_status': 'Active' if recent_chats > 0 else 'Inactive'
             },
-            'health_status': 'Under care' if latest_record else 'No recent records',
-            'nutrition_status': 'Has plan' if latest_plan else 'No nutrition plan'
+            'health_status': 'Under care' if last_checkup else 'No recent records',
+            'nutrition_status': 'Has plan' if last_plan else 'No nutrition plan',
+            'totals': {
+                'health_records': stats.health_records_count if stats else 0,
+                'nutrition_plans': stats.nutrition_plans_count if stats else 0,
+                'chat_messages': stats.chat_messages_count if stats else 0,
+                'health_chats': stats.health_chat_count if stats else 0,
+                'nutrition_chats': stats.nutrition_chat_count if stats else 0
+            }
         }
         
-        return jsonify({
+        return add_validators(jsonify({
             'message': 'Patient summary retrieved successfully',
             'summary': summary
-        }), 200
+        }), etag), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get patient summary', 'details': str(e)}), 500
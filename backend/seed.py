@@ -0,0 +1,232 @@
+"""
+Synthetic data for load testing
+
+Generates nurses, patients and each patient's health records, nutrition
+plans and chat history, and writes them with executemany inserts of
+chunk_size rows, committing after every chunk. Ids are assigned up front
+(after the current maximum), so no row has to be read back, the one
+password hash is computed once and shared by every account, and each
+patient's patient_stats row is built from the rows generated for it rather
+than recomputed from the tables afterwards.
+
+The same seed gives the same data set, relative to the time of the run:
+accounts skew towards recent sign-ups, checkups and plans fall on weekdays
+during clinic hours, and chats come in short sessions peaking in the evening.
+Run it against an otherwise idle database; concurrent inserts could take
+the ids it picked.
+"""
+
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from werkzeug.security import generate_password_hash
+
+from models import db, User, Nurse, Patient, HealthRecord, NutritionPlan, ChatHistory, PatientStats
+from topics import message_topics, encode_topics
+
+DEFAULT_PASSWORD = 'password123'
+
+HOSPITALS = ['City General Hospital', 'St. Mary Medical Center', 'Riverside Clinic', 'Hilltop Hospital',
+             'Lakeside Health Center']
+SPECIALIZATIONS = ['General Practice', 'Nutrition and Dietetics', 'Pediatrics', 'Diabetes Care', 'Cardiology']
+FIRST_NAMES = ['Amina', 'John', 'Grace', 'Peter', 'Fatima', 'David', 'Mary', 'Samuel', 'Joy', 'Daniel']
+LAST_NAMES = ['Otieno', 'Smith', 'Wanjiru', 'Okafor', 'Mensah', 'Kamau', 'Johnson', 'Achieng', 'Mutua', 'Bello']
+CHECKUP_NOTES = [
+    'Routine checkup. Blood pressure normal.',
+    'Reports mild fatigue; advised more rest and fluids.',
+    'Weight stable. Blood sugar slightly elevated.',
+    'Follow-up visit, symptoms improving.',
+    'Annual physical, no concerns.',
+]
+PRESCRIPTIONS = [None, 'Multivitamin supplement', 'Iron supplement', 'Vitamin D 1000 IU daily', 'Metformin 500 mg']
+DIET_PLANS = [
+    'High protein diet with lean meats, fish and legumes.',
+    'Low salt diet with plenty of vegetables and whole grains.',
+    'Balanced diet; limit sugary drinks and snacks.',
+    'Iron rich foods: beans, leafy greens and eggs.',
+]
+QUESTIONS = [
+    'How much protein should I eat every day?',
+    'Is it safe to exercise after my morning medication?',
+    'What vitamins help with tiredness?',
+    'How can I sleep better?',
+    'Which snacks are good for my blood sugar?',
+    'Should I drink more water during the day?',
+    'What should I eat before my checkup?',
+    'My blood pressure feels high, what should I do?',
+]
+REPLIES = [
+    'A balanced diet with vegetables, whole grains and lean protein is a good start. Ask your nurse for specifics.',
+    'Light exercise is usually fine, but check with your healthcare provider about your medication.',
+    'Staying hydrated, sleeping regularly and eating iron rich foods can help. See your nurse if it continues.',
+]
+
+def insert_chunked(conn, table, rows, chunk_size):
+    """executemany in fixed size chunks, committing each, so memory stays flat"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            conn.execute(table.insert(), chunk)
+            conn.commit()
+            chunk = []
+    if chunk:
+        conn.execute(table.insert(), chunk)
+        conn.commit()
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+def _sign_up_time(rng, now, days):
+    # Squaring skews sign-ups towards the recent end of the window
+    return now - timedelta(days=days * rng.random() ** 2)
+
+def _clinic_time(rng, start, end):
+    """A weekday between start and end, during clinic hours
+
+    Moving a draw onto a weekday and into clinic hours can take it out of the
+    window, so out of range draws are retried rather than clamped (clamping
+    could land on a weekend again). A window without any clinic hours, such
+    as an account created on a Saturday evening, gets any time within it.
+    """
+    for _ in range(20):
+        moment = start + (end - start) * rng.random()
+        if moment.weekday() >= 5:
+            moment -= timedelta(days=moment.weekday() - 4)
+        hour = min(17, max(8, int(rng.gauss(12, 2.5))))
+        moment = moment.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60))
+        if start <= moment <= end:
+            return moment
+    return start + (end - start) * rng.random()
+
+def _chat_session_start(rng, start, end):
+    """A moment between start and end, most likely in the evening"""
+    moment = start + (end - start) * rng.random()
+    hour = int(rng.triangular(6, 24, 20)) % 24
+    moment = moment.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60))
+    return min(max(moment, start), end)
+
+def seed(patients, nurses=None, records_per_patient=10, plans_per_patient=3, chats_per_patient=20, days=730,
+         seed=42, chunk_size=5000, password=DEFAULT_PASSWORD, email_domain='seed.local'):
+    """Insert a synthetic data set and return the number of rows written per table
+
+    nurses defaults to one per 50 patients. chats_per_patient counts messages;
+    they are written as question and reply pairs. Every account gets password.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    nurses = nurses if nurses is not None else max(1, patients // 50)
+    password_hash = generate_password_hash(password)
+    chat_topics = {question: message_topics(question) for question in QUESTIONS}
+    encoded_topics = {question: encode_topics(topics) for question, topics in chat_topics.items()}
+
+    first_user, first_nurse, first_patient = _next_id(User), _next_id(Nurse), _next_id(Patient)
+    nurse_ids = range(first_nurse, first_nurse + nurses)
+    counts = dict.fromkeys(['users', 'nurses', 'patients', 'health_records', 'nutrition_plans',
+                            'chat_history', 'patient_stats'], 0)
+
+    def name():
+        return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+    signed_up = []
+
+    def users():
+        for offset in range(nurses + patients):
+            counts['users'] += 1
+            user_id = first_user + offset
+            role = 'nurse' if offset < nurses else 'patient'
+            created_at = _sign_up_time(rng, now, days)
+            if role == 'patient':
+                # Bounds the patient's activity
+                signed_up.append(created_at)
+            yield {'id': user_id, 'name': name(), 'email': f'{role}{user_id}@{email_domain}',
+                   'password_hash': password_hash, 'role': role, 'created_at': created_at}
+
+    def nurse_rows():
+        for offset in range(nurses):
+            counts['nurses'] += 1
+            yield {'id': first_nurse + offset, 'user_id': first_user + offset,
+                   'specialization': rng.choice(SPECIALIZATIONS), 'hospital': rng.choice(HOSPITALS)}
+
+    def patient_rows():
+        for offset in range(patients):
+            counts['patients'] += 1
+            yield {'id': first_patient + offset, 'user_id': first_user + nurses + offset,
+                   'age': max(1, min(99, int(rng.gauss(45, 18)))), 'gender': rng.choice(['male', 'female', 'other']),
+                   'medical_history': rng.choice([None, 'Hypertension', 'Type 2 diabetes', 'Asthma', 'None reported']),
+                   'nutrition_needs': rng.choice([None, 'Low salt', 'High protein', 'Low sugar'])}
+
+    started = time.perf_counter()
+    with db.engine.connect() as conn:
+        insert_chunked(conn, User.__table__, users(), chunk_size)
+        insert_chunked(conn, Nurse.__table__, nurse_rows(), chunk_size)
+        insert_chunked(conn, Patient.__table__, patient_rows(), chunk_size)
+
+        # Activity is generated a patient at a time and buffered per table
+        tables = {name: model.__table__ for name, model in (
+            ('health_records', HealthRecord), ('nutrition_plans', NutritionPlan),
+            ('chat_history', ChatHistory), ('patient_stats', PatientStats))}
+        buffers = {name: [] for name in tables}
+
+        def add(name, row):
+            buffers[name].append(row)
+            if len(buffers[name]) >= chunk_size:
+                flush(name)
+
+        def flush(name):
+            if buffers[name]:
+                conn.execute(tables[name].insert(), buffers[name])
+                conn.commit()
+                counts[name] += len(buffers[name])
+                buffers[name] = []
+
+        for offset in range(patients):
+            patient_id, user_id = first_patient + offset, first_user + nurses + offset
+            since = signed_up[offset]
+            stats = {'patient_id': patient_id, 'version': 1, 'updated_at': now, 'last_checkup_at': None,
+                     'last_plan_at': None, 'last_chat_at': None, **dict.fromkeys(PatientStats.COUNTERS, 0)}
+
+            for _ in range(records_per_patient):
+                created_at = _clinic_time(rng, since, now)
+                add('health_records', {'patient_id': patient_id, 'nurse_id': rng.choice(nurse_ids),
+                                       'checkup_notes': rng.choice(CHECKUP_NOTES),
+                                       'prescriptions': rng.choice(PRESCRIPTIONS), 'created_at': created_at})
+                stats['last_checkup_at'] = max(created_at, stats['last_checkup_at'] or created_at)
+            stats['health_records_count'] = records_per_patient
+
+            for _ in range(plans_per_patient):
+                created_at = _clinic_time(rng, since, now)
+                add('nutrition_plans', {'patient_id': patient_id, 'nurse_id': rng.choice(nurse_ids),
+                                        'diet_plan': rng.choice(DIET_PLANS), 'created_at': created_at})
+                stats['last_plan_at'] = max(created_at, stats['last_plan_at'] or created_at)
+            stats['nutrition_plans_count'] = plans_per_patient
+
+            # Sessions of one to four questions, a minute or two apart
+            turns, turn = chats_per_patient // 2, 0
+            while turn < turns:
+                asked_at = _chat_session_start(rng, since, now)
+                for _ in range(min(rng.randint(1, 4), turns - turn)):
+                    question = rng.choice(QUESTIONS)
+                    turn_id = f'seed-{user_id}-{turn}'
+                    answered_at = asked_at + timedelta(seconds=rng.uniform(2, 8))
+                    add('chat_history', {'user_id': user_id, 'role': 'user', 'message': question,
+                                         'topics': encoded_topics[question], 'turn_id': turn_id,
+                                         'created_at': asked_at})
+                    add('chat_history', {'user_id': user_id, 'role': 'assistant', 'message': rng.choice(REPLIES),
+                                         'topics': None, 'turn_id': turn_id, 'created_at': answered_at})
+                    for counter in PatientStats.topic_counters(chat_topics[question]):
+                        stats[counter] += 1
+                    stats['last_chat_at'] = max(answered_at, stats['last_chat_at'] or answered_at)
+                    asked_at = answered_at + timedelta(seconds=rng.uniform(30, 180))
+                    turn += 1
+            stats['chat_messages_count'] = turns * 2
+
+            add('patient_stats', stats)
+
+        for name in tables:
+            flush(name)
+
+    counts['seconds'] = round(time.perf_counter() - started, 1)
+    return counts
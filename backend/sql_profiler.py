@@ -0,0 +1,139 @@
+"""
+Per-request SQL profiler
+
+When profiling is on for a request, every statement it runs is counted and
+timed. Statements slower than SQL_SLOW_QUERY_MS are logged with their route,
+and statements of the same shape (the same SQL with different parameters)
+run SQL_N_PLUS_ONE_THRESHOLD times or more are reported as a likely N+1,
+typically a to_dict() reaching through a lazy relationship in a loop.
+
+Profiling is on for every request with SQL_PROFILING, or for requests that
+send an X-SQL-Profile header when SQL_PROFILING_HEADER allows it; those
+requests (and every request in debug mode) get the summary back in an
+X-SQL-Profile response header. Tests collect profiles with capture().
+"""
+
+import threading
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+
+import db_events
+from models import db
+
+PROFILE_HEADER = 'X-SQL-Profile'
+
+class RequestProfile:
+    """Statements run by one request, with their durations in seconds"""
+
+    def __init__(self, method, path, route):
+        self.method = method
+        self.path = path
+        self.route = route
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.statements.append((statement, seconds))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total_seconds(self):
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated(self, threshold=3):
+        """{statement: times run} for statement shapes run at least threshold times"""
+        counts = {}
+        for statement, _ in self.statements:
+            counts[statement] = counts.get(statement, 0) + 1
+        return {statement: count for statement, count in counts.items() if count >= threshold}
+
+    def header(self, threshold=3):
+        """Summary for the X-SQL-Profile response header"""
+        repeated = self.repeated(threshold)
+        return (f'queries={self.count}; time_ms={self.total_seconds * 1000:.1f}; '
+                f'repeated={len(repeated)}; max_repeat={max(repeated.values(), default=0)}')
+
+class SQLProfiler:
+    """Profiling settings and test captures of one app"""
+
+    def __init__(self, app):
+        self.always = app.config.get('SQL_PROFILING', False)
+        self.allow_header = app.config.get('SQL_PROFILING_HEADER', False)
+        self.slow_seconds = app.config.get('SQL_SLOW_QUERY_MS', 200) / 1000
+        self.threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 3)
+        self._lock = threading.Lock()
+        self._captures = []
+
+    @property
+    def capturing(self):
+        return bool(self._captures)
+
+    @contextmanager
+    def capture(self):
+        """Profile every request in the block and collect their profiles in a list"""
+        profiles = []
+        with self._lock:
+            self._captures.append(profiles)
+        try:
+            yield profiles
+        finally:
+            with self._lock:
+                self._captures.remove(profiles)
+
+    def collect(self, profile):
+        with self._lock:
+            for profiles in self._captures:
+                profiles.append(profile)
+
+def _profiler():
+    return current_app.extensions['sql_profiler']
+
+def _record_statement(statement, seconds):
+    profile = g.get('sql_profile') if has_request_context() else None
+    if profile is None:
+        return
+    profile.record(statement, seconds)
+    if seconds >= _profiler().slow_seconds:
+        current_app.logger.warning('Slow SQL (%.1f ms) in %s %s: %s', seconds * 1000, profile.method,
+                                   profile.route, ' '.join(statement.split()))
+
+def start_request():
+    profiler = _profiler()
+    g.sql_profile_requested = profiler.allow_header and bool(request.headers.get(PROFILE_HEADER))
+    if profiler.always or profiler.capturing or g.sql_profile_requested:
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        g.sql_profile = RequestProfile(request.method, request.path, route)
+
+def add_profile_header(response):
+    profile = g.get('sql_profile')
+    if profile is not None and (g.get('sql_profile_requested') or current_app.debug):
+        response.headers[PROFILE_HEADER] = profile.header(_profiler().threshold)
+    return response
+
+def finish_request(error=None):
+    profile = g.pop('sql_profile', None)
+    if profile is None:
+        return
+    profiler = _profiler()
+    for statement, count in profile.repeated(profiler.threshold).items():
+        current_app.logger.warning('Possible N+1 in %s %s: statement run %d times: %s', profile.method,
+                                   profile.route, count, ' '.join(statement.split()))
+    profiler.collect(profile)
+
+def init_app(app):
+    """Hook the profiler into this app's requests and engines; call after db.init_app"""
+    app.extensions['sql_profiler'] = SQLProfiler(app)
+    app.before_request(start_request)
+    app.after_request(add_profile_header)
+    app.teardown_request(finish_request)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            db_events.on_statement(engine, _record_statement)
+
+def capture(app=None):
+    """Context manager collecting the RequestProfile of every request served inside it"""
+    return (app or current_app).extensions['sql_profiler'].capture()
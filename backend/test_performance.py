@@ -0,0 +1,1329 @@
+"""
+Regression tests for the performance work on the NutriPulse backend
+Runs in-process against create_app('testing'); no server or MySQL needed.
+
+    python -m pytest test_performance.py -q
+"""
+
+import json
+import shutil
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+import routes.chatbot
+from ai_cache import MemoryCacheBackend, ResponseCache
+from ai_client import AIClient, AIProviderError, CircuitBreaker
+from app import create_app
+from config import config, TestingConfig
+from export import Export, parse_watermark
+import json_provider
+from manage import rebuild_patient_stats, pair_legacy_chat_turns
+from metrics import RequestMetrics
+import sql_profiler
+from topics import build_classifier, parse_extra_topics
+from models import db, User, Patient, Nurse, HealthRecord, NutritionPlan, ChatHistory, ChatHistoryArchive, PatientStats
+from retention import archive_chats
+from seed import seed
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def people(app):
+    """One nurse and one patient, with tokens for both"""
+    nurse_user = User(name='Nurse Joy', email='joy@hospital.com', role='nurse', password_hash='x')
+    patient_user = User(name='Pat Doe', email='pat@email.com', role='patient', password_hash='x')
+    db.session.add_all([nurse_user, patient_user])
+    db.session.flush()
+
+    nurse = Nurse(user_id=nurse_user.id, specialization='Dietetics', hospital='City General')
+    patient = Patient(user_id=patient_user.id, age=40, gender='female', stats=PatientStats())
+    db.session.add_all([nurse, patient])
+    db.session.commit()
+
+    return {
+        'nurse': nurse,
+        'patient': patient,
+        'nurse_headers': {'Authorization': f'Bearer {create_access_token(identity=nurse_user.id)}'},
+        'patient_headers': {'Authorization': f'Bearer {create_access_token(identity=patient_user.id)}'},
+    }
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement executed inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def seed_records(patient, nurse, count, same_timestamp=False, base=datetime(2024, 1, 1)):
+    for i in range(count):
+        created_at = base if same_timestamp else base + timedelta(minutes=i)
+        db.session.add(HealthRecord(
+            patient_id=patient.id, nurse_id=nurse.id,
+            checkup_notes=f'checkup {i}', created_at=created_at
+        ))
+        db.session.add(NutritionPlan(
+            patient_id=patient.id, nurse_id=nurse.id,
+            diet_plan=f'plan {i}', created_at=created_at
+        ))
+    db.session.commit()
+
+
+# Keyset pagination
+
+@pytest.mark.parametrize('same_timestamp', [False, True])
+def test_records_keyset_pagination_walks_every_row_once(client, people, same_timestamp):
+    seed_records(people['patient'], people['nurse'], 23, same_timestamp=same_timestamp)
+    url = f"/patients/{people['patient'].id}/records"
+
+    seen = []
+    cursor = None
+    while True:
+        params = {'limit': 10}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get(url, query_string=params, headers=people['nurse_headers'])
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body['limit'] == 10
+        seen.extend(record['id'] for record in body['records'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+
+    assert len(seen) == 23
+    assert len(set(seen)) == 23
+
+
+def test_nutrition_pagination_is_newest_first(client, people):
+    seed_records(people['patient'], people['nurse'], 5)
+    response = client.get(
+        f"/patients/{people['patient'].id}/nutrition",
+        query_string={'limit': 2}, headers=people['patient_headers']
+    )
+    body = response.get_json()
+    assert [plan['diet_plan'] for plan in body['plans']] == ['plan 4', 'plan 3']
+    assert body['next_cursor'] is not None
+
+
+def test_bad_cursor_is_rejected(client, people):
+    response = client.get(
+        f"/patients/{people['patient'].id}/records",
+        query_string={'cursor': 'not-a-cursor'}, headers=people['nurse_headers']
+    )
+    assert response.status_code == 400
+
+
+# N+1 regression
+
+def seed_records_from_many_nurses(patient_id, count, prefix):
+    """One record and plan per distinct nurse, the worst case for lazy loading"""
+    for i in range(count):
+        user = User(name=f'Nurse {prefix}{i}', email=f'{prefix}{i}@hospital.com', role='nurse', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        nurse = Nurse(user_id=user.id, specialization='General', hospital='City General')
+        db.session.add(nurse)
+        db.session.flush()
+        db.session.add(HealthRecord(patient_id=patient_id, nurse_id=nurse.id, checkup_notes=f'checkup {i}'))
+        db.session.add(NutritionPlan(patient_id=patient_id, nurse_id=nurse.id, diet_plan=f'plan {i}'))
+    db.session.commit()
+    # Start each request from a cold identity map, as a real request would
+    db.session.expunge_all()
+
+
+@pytest.mark.parametrize('url', [
+    '/patients/{id}/records',
+    '/patients/{id}/nutrition',
+    '/reports/{id}',
+])
+def test_query_count_does_not_grow_with_rows(client, people, url):
+    patient_id = people['patient'].id
+    url = url.format(id=patient_id)
+    headers = people['nurse_headers']
+
+    seed_records_from_many_nurses(patient_id, 2, prefix='few')
+    with count_queries() as few:
+        assert client.get(url, headers=headers).status_code == 200
+
+    seed_records_from_many_nurses(patient_id, 20, prefix='many')
+    with count_queries() as many:
+        assert client.get(url, headers=headers).status_code == 200
+
+    assert len(many) == len(few)
+
+
+# Report aggregation
+
+def test_report_statistics_are_computed_in_sql(client, people):
+    patient = people['patient']
+    seed_records(patient, people['nurse'], 7, base=datetime.utcnow() - timedelta(days=1))
+    seed_records(patient, people['nurse'], 3, base=datetime.utcnow() - timedelta(days=365))
+    for role, message in [
+        ('user', 'Which FOOD helps with joint pain?'),
+        ('assistant', 'Food rich in omega-3 may help with pain.'),
+        ('user', 'Should I see a doctor?'),
+        ('user', 'Thanks!'),
+    ]:
+        routes.chatbot.save_chat_message(patient.user_id, role, message, patient.id)
+
+    report = client.get(f'/reports/{patient.id}', headers=people['nurse_headers']).get_json()['report']
+
+    assert report['statistics'] == {
+        'total_health_records': 7,
+        'total_nutrition_plans': 7,
+        'total_chat_interactions': 4,
+        'health_related_chats': 2,
+        'nutrition_related_chats': 1,
+    }
+    assert len(report['recent_health_records']) == 5
+    assert len(report['recent_nutrition_plans']) == 5
+
+
+# Chat must not hold a pooled connection across the AI call
+
+def test_slow_ai_calls_do_not_exhaust_the_pool(tmp_path, monkeypatch):
+    class PooledTestingConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'chat.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': 2,
+            'max_overflow': 0,
+            'pool_timeout': 2,
+            'connect_args': {'check_same_thread': False, 'timeout': 10},
+        }
+
+    monkeypatch.setitem(config, 'pooled-testing', PooledTestingConfig)
+    app = create_app('pooled-testing')
+    with app.app_context():
+        db.create_all()
+        user = User(name='Pat Doe', email='pat@email.com', role='patient', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+        db.session.remove()
+
+    holding_connection_during_ai_call = []
+
+    def slow_ai_response(user_message, user_role, use_cache=True):
+        holding_connection_during_ai_call.append(db.session().in_transaction())
+        time.sleep(1)
+        return 'Eat your greens.'
+
+    monkeypatch.setattr(routes.chatbot, 'get_ai_response', slow_ai_response)
+
+    client = app.test_client()
+    statuses = []
+
+    def send():
+        response = client.post('/chatbot/chat', json={'message': 'What should I eat?'}, headers=headers)
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=send) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Ten overlapping one-second AI calls against a two-connection pool
+    assert statuses == [200] * 10
+    assert not any(holding_connection_during_ai_call)
+    with app.app_context():
+        assert ChatHistory.query.count() == 20
+
+
+# Streaming chat
+
+def test_chat_stream_sends_tokens_and_saves_full_reply(client, people, monkeypatch):
+    def fake_stream(user_message, user_role, use_cache=True):
+        yield 'Eat '
+        yield 'more '
+        yield 'greens.'
+
+    monkeypatch.setattr(routes.chatbot, 'stream_ai_response', fake_stream)
+
+    response = client.post('/chatbot/chat/stream', json={'message': 'What should I eat?'},
+                           headers=people['patient_headers'])
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    events = [block.split('\n') for block in response.get_data(as_text=True).strip().split('\n\n')]
+    assert [lines[0] for lines in events] == ['event: token'] * 3 + ['event: done']
+    assert '"ai_response": "Eat more greens."' in events[-1][1]
+
+    saved = ChatHistory.query.order_by(ChatHistory.id).all()
+    assert [(chat.role, chat.message) for chat in saved] == [
+        ('user', 'What should I eat?'),
+        ('assistant', 'Eat more greens.'),
+    ]
+    assert saved[0].turn_id is not None and saved[0].turn_id == saved[1].turn_id
+
+
+def test_chat_stream_reports_provider_failure_after_partial_reply(client, people, monkeypatch):
+    class FailingClient:
+        configured = True
+
+        def stream(self, messages, **options):
+            yield 'Eat '
+            raise AIProviderError('AI provider stream ended unexpectedly')
+
+    monkeypatch.setattr(routes.chatbot, 'get_ai_client', FailingClient)
+
+    response = client.post('/chatbot/chat/stream', json={'message': 'What should I eat?', 'use_cache': False},
+                           headers=people['patient_headers'])
+    assert response.status_code == 200
+
+    events = [block.split('\n') for block in response.get_data(as_text=True).strip().split('\n\n')]
+    assert [lines[0] for lines in events] == ['event: token', 'event: error']
+    assert '"error": "AI response interrupted"' in events[-1][1]
+
+    saved = ChatHistory.query.order_by(ChatHistory.id).all()
+    assert [(chat.role, chat.message) for chat in saved] == [
+        ('user', 'What should I eat?'),
+        ('assistant', routes.chatbot.AI_ERROR_MESSAGE),
+    ]
+
+
+# AI provider client
+
+class StubAIProvider:
+    """Local OpenAI-style endpoint that replies with a scripted list of statuses"""
+
+    def __init__(self, statuses, body=None, delay=0):
+        self.statuses = list(statuses)
+        self.hits = 0
+        self.client_ports = set()
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                provider.hits += 1
+                provider.client_ports.add(self.client_address[1])
+                time.sleep(delay)
+                status = provider.statuses.pop(0) if provider.statuses else 200
+                reply = body if body is not None else json.dumps({'choices': [{'message': {'content': 'Stub reply'}}]})
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(reply.encode())))
+                self.end_headers()
+                self.wfile.write(reply.encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/v1/chat/completions'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_provider():
+    providers = []
+
+    def start(statuses=(), body=None, delay=0):
+        provider = StubAIProvider(statuses, body, delay)
+        providers.append(provider)
+        return provider
+
+    yield start
+    for provider in providers:
+        provider.close()
+
+
+def make_client(url, **kwargs):
+    options = dict(max_retries=2, backoff=0.001, backoff_max=0.01)
+    options.update(kwargs)
+    return AIClient(api_key='test-key', api_url=url, model='test-model', **options)
+
+
+def test_ai_client_reuses_one_keep_alive_connection(stub_provider):
+    provider = stub_provider()
+    client = make_client(provider.url)
+
+    for _ in range(5):
+        assert client.complete([{'role': 'user', 'content': 'hi'}]) == 'Stub reply'
+
+    assert provider.hits == 5
+    assert len(provider.client_ports) == 1
+
+
+def test_ai_client_retries_transient_failures(stub_provider):
+    provider = stub_provider([503, 502])
+    client = make_client(provider.url)
+
+    assert client.complete([{'role': 'user', 'content': 'hi'}]) == 'Stub reply'
+    assert provider.hits == 3
+
+
+def test_ai_client_does_not_retry_read_timeouts(stub_provider):
+    provider = stub_provider(delay=0.5)
+    client = make_client(provider.url, read_timeout=0.1)
+
+    with pytest.raises(AIProviderError):
+        client.complete([{'role': 'user', 'content': 'hi'}])
+    assert provider.hits == 1
+
+
+def test_ai_client_does_not_retry_client_errors(stub_provider):
+    provider = stub_provider([400])
+    client = make_client(provider.url)
+
+    with pytest.raises(AIProviderError):
+        client.complete([{'role': 'user', 'content': 'hi'}])
+    assert provider.hits == 1
+
+
+def test_circuit_breaker_fails_fast_to_fallback_text(app, stub_provider):
+    provider = stub_provider([500] * 6)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    app.extensions['ai_client'] = make_client(provider.url, breaker=breaker)
+
+    for _ in range(2):
+        assert routes.chatbot.get_ai_response('hi', 'patient') == routes.chatbot.AI_ERROR_MESSAGE
+    assert provider.hits == 6
+    assert breaker.state == 'open'
+
+    # Open circuit: canned reply without touching the provider
+    assert routes.chatbot.get_ai_response('hi', 'patient') == routes.chatbot.AI_CONNECTION_MESSAGE
+    assert provider.hits == 6
+
+
+def test_circuit_breaker_half_open_trial_closes_on_success():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    now[0] = 11
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # only one trial call at a time
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_trial_is_released_by_a_closed_stream_or_a_malformed_reply(stub_provider):
+    now = [0.0]
+    chunks = ''.join(f"data: {json.dumps({'choices': [{'delta': {'content': word}}]})}\n\n"
+                     for word in ('Eat', ' well')) + 'data: [DONE]\n\n'
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    client = make_client(stub_provider(body=chunks).url, breaker=breaker)
+    breaker.record_failure()
+    now[0] = 11
+
+    # The SSE client disconnects after the first chunk
+    stream = client.stream([{'role': 'user', 'content': 'hi'}])
+    assert next(stream) == 'Eat'
+    stream.close()
+    assert breaker.state == 'half-open'
+    assert ''.join(client.stream([{'role': 'user', 'content': 'hi'}])) == 'Eat well'
+    assert breaker.state == 'closed'
+
+    # "choices": null is a failure of the trial, not a stuck one
+    client = make_client(stub_provider(body=json.dumps({'choices': None})).url, breaker=breaker)
+    breaker.record_failure()
+    now[0] = 22
+    with pytest.raises(AIProviderError):
+        client.complete([{'role': 'user', 'content': 'hi'}])
+    assert breaker.state == 'open'
+    now[0] = 33
+    assert breaker.allow_request()
+
+
+# AI response cache
+
+def test_memory_cache_expires_and_evicts_least_recently_used():
+    now = [0.0]
+    backend = MemoryCacheBackend(max_entries=2, clock=lambda: now[0])
+
+    backend.set('a', 'A', ttl=10)
+    backend.set('b', 'B', ttl=10)
+    assert backend.get('a') == 'A'  # 'a' is now most recently used
+    backend.set('c', 'C', ttl=10)
+    assert backend.get('b') is None
+    assert backend.get('a') == 'A'
+
+    now[0] = 11
+    assert backend.get('a') is None
+
+
+def test_repeated_questions_are_answered_from_cache(app, stub_provider):
+    provider = stub_provider()
+    app.extensions['ai_client'] = make_client(provider.url)
+    app.extensions['ai_cache'] = ResponseCache(MemoryCacheBackend(), ttl=60)
+
+    assert routes.chatbot.get_ai_response('How much protein should I eat?', 'patient') == 'Stub reply'
+    assert routes.chatbot.get_ai_response('  how much PROTEIN should i eat ', 'patient') == 'Stub reply'
+    assert provider.hits == 1
+
+    # Different role, and an explicit bypass, both go upstream
+    routes.chatbot.get_ai_response('How much protein should I eat?', 'nurse')
+    routes.chatbot.get_ai_response('How much protein should I eat?', 'patient', use_cache=False)
+    assert provider.hits == 3
+
+    stats = app.extensions['ai_cache'].stats()
+    assert (stats['hits'], stats['misses'], stats['bypassed']) == (1, 2, 1)
+
+
+def test_cache_stats_are_for_nurses_only(client, people):
+    assert client.get('/chatbot/cache-stats', headers=people['patient_headers']).status_code == 403
+    response = client.get('/chatbot/cache-stats', headers=people['nurse_headers'])
+    assert response.status_code == 200 and response.get_json()['enabled']
+
+
+def test_fallback_replies_are_not_cached(app, stub_provider):
+    provider = stub_provider([400])
+    app.extensions['ai_client'] = make_client(provider.url)
+    app.extensions['ai_cache'] = ResponseCache(MemoryCacheBackend(), ttl=60)
+
+    assert routes.chatbot.get_ai_response('hi', 'patient') == routes.chatbot.AI_ERROR_MESSAGE
+    assert routes.chatbot.get_ai_response('hi', 'patient') == 'Stub reply'
+
+
+# Request-scoped current user
+
+def test_patient_reading_own_profile_costs_one_query(client, people):
+    patient_id = people['patient'].id
+    db.session.expunge_all()
+
+    with count_queries() as statements:
+        response = client.get(f'/patients/{patient_id}', headers=people['patient_headers'])
+
+    assert response.status_code == 200
+    assert response.get_json()['user']['name'] == 'Pat Doe'
+    assert len(statements) == 1
+
+
+def test_nurse_is_loaded_once_when_adding_a_record(client, people):
+    patient_id = people['patient'].id
+    db.session.expunge_all()
+
+    with count_queries() as statements:
+        response = client.post(f'/patients/{patient_id}/records', json={'checkup_notes': 'All good'},
+                               headers=people['nurse_headers'])
+
+    assert response.status_code == 201
+    # Before the insert: one user+profile lookup and the patient check, nothing else
+    before_insert = statements[:next(i for i, sql in enumerate(statements) if sql.startswith('INSERT'))]
+    assert len(before_insert) == 2
+    assert 'JOIN nurses' in before_insert[0]
+
+
+# Incremental patient statistics
+
+def test_patient_stats_are_maintained_on_write(client, people, monkeypatch):
+    monkeypatch.setattr(routes.chatbot, 'get_ai_response',
+                        lambda user_message, user_role, use_cache=True: 'Drink water.')
+    patient_id = people['patient'].id
+    nurse_headers = people['nurse_headers']
+
+    client.post(f'/patients/{patient_id}/records', json={'checkup_notes': 'Fine'}, headers=nurse_headers)
+    client.post(f'/patients/{patient_id}/records', json={'checkup_notes': 'Still fine'}, headers=nurse_headers)
+    client.post(f'/patients/{patient_id}/nutrition', json={'diet_plan': 'Greens'}, headers=nurse_headers)
+    client.post('/chatbot/chat', json={'message': 'Is my diet OK for my back pain?'},
+                headers=people['patient_headers'])
+
+    stats = PatientStats.query.get(patient_id)
+    assert (stats.health_records_count, stats.nutrition_plans_count, stats.chat_messages_count) == (2, 1, 2)
+    assert (stats.health_chat_count, stats.nutrition_chat_count) == (1, 1)
+
+    db.session.expunge_all()
+    with count_queries() as statements:
+        summary = client.get(f'/reports/{patient_id}/summary', headers=nurse_headers).get_json()['summary']
+
+    # current user lookup + a single summary statement
+    assert len(statements) == 2
+    assert summary['last_health_checkup'] is not None
+    assert summary['recent_activity']['chat_interactions_this_week'] == 2
+    assert summary['totals']['health_records'] == 2
+
+
+def test_backfill_rebuilds_the_same_stats(client, people, monkeypatch):
+    monkeypatch.setattr(routes.chatbot, 'get_ai_response',
+                        lambda user_message, user_role, use_cache=True: 'Eat well.')
+    patient_id = people['patient'].id
+    client.post(f'/patients/{patient_id}/records', json={'checkup_notes': 'Fine'}, headers=people['nurse_headers'])
+    client.post('/chatbot/chat', json={'message': 'Vitamin D?'}, headers=people['patient_headers'])
+    incremental = PatientStats.query.get(patient_id).to_dict()
+
+    assert rebuild_patient_stats(batch_size=2) == 1
+    db.session.expire_all()
+    assert PatientStats.query.get(patient_id).to_dict() == incremental
+
+
+def test_patient_stats_timestamps_never_move_backwards(client, people):
+    patient_id = people['patient'].id
+    newer, older = datetime(2024, 1, 2), datetime(2024, 1, 1)
+    # A write committing after a newer one keeps the newer time
+    PatientStats.bump(patient_id, counters=['health_records_count'], last_checkup_at=newer)
+    PatientStats.bump(patient_id, counters=['health_records_count'], last_checkup_at=older)
+    db.session.commit()
+    stats = PatientStats.query.get(patient_id)
+    assert (stats.health_records_count, stats.last_checkup_at) == (2, newer)
+
+    PatientStats.bump(patient_id, last_checkup_at=None)
+    db.session.commit()
+    db.session.expire_all()
+    assert PatientStats.query.get(patient_id).last_checkup_at is None
+
+
+# Topic classifier
+
+def test_topic_classifier_matches_at_word_starts():
+    classifier = build_classifier(parse_extra_topics('exercise: walk, blood pressure; care:dietitian'))
+
+    assert classifier.classify('Are my SYMPTOMS normal?') == {'health'}
+    assert classifier.classify('We went to Spain for a week') == set()
+    assert classifier.classify('Is oatmeal okay?') == set()
+    assert classifier.classify('My dietitian suggested a walk') == {'care', 'nutrition', 'exercise'}
+    assert classifier.classify('Blood pressure after food') == {'exercise', 'nutrition'}
+
+
+def test_report_counts_extra_topics(client, people, monkeypatch):
+    monkeypatch.setitem(client.application.extensions, 'topic_classifier',
+                        build_classifier({'exercise': ['walk', 'run']}))
+    patient = people['patient']
+    for message in ['Can I walk after a meal?', 'How far should I run?', 'Hello']:
+        routes.chatbot.save_chat_message(patient.user_id, 'user', message, patient.id)
+
+    report = client.get(f'/reports/{patient.id}', headers=people['nurse_headers']).get_json()['report']
+
+    assert report['recent_chat_summary']['topics'] == {'health': 0, 'nutrition': 1, 'exercise': 2}
+
+
+# Bulk record upload
+
+def make_patients(count):
+    patients = []
+    for i in range(count):
+        user = User(name=f'Batch {i}', email=f'batch{i}@email.com', role='patient', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        patients.append(Patient(user_id=user.id, age=30, gender='male', stats=PatientStats()))
+    db.session.add_all(patients)
+    db.session.commit()
+    return [patient.id for patient in patients]
+
+
+def test_batch_reports_per_item_results_and_updates_stats(client, people):
+    first, second = make_patients(2)
+    items = [
+        {'type': 'health_record', 'patient_id': first, 'checkup_notes': 'Stable'},
+        {'type': 'nutrition_plan', 'patient_id': second, 'diet_plan': 'Low sodium'},
+        {'type': 'health_record', 'patient_id': first, 'checkup_notes': '  '},
+        {'type': 'x-ray', 'patient_id': first},
+        {'type': 'nutrition_plan', 'patient_id': 999999, 'diet_plan': 'Greens'},
+        {'type': 'health_record', 'patient_id': first, 'checkup_notes': 'Follow-up', 'prescriptions': 'Rest'},
+    ]
+
+    response = client.post('/patients/records:batch', json={'items': items}, headers=people['nurse_headers'])
+
+    assert response.status_code == 207
+    body = response.get_json()
+    assert (body['created'], body['failed']) == (3, 3)
+    assert [result['status'] for result in body['results']] == \
+        ['created', 'created', 'error', 'error', 'error', 'created']
+    assert 'checkup_notes' in body['results'][2]['errors']
+    assert 'type' in body['results'][3]['errors']
+    assert body['results'][4]['errors'] == {'patient_id': ['Patient not found.']}
+    assert HealthRecord.query.get(body['results'][5]['id']).prescriptions == 'Rest'
+
+    stats = PatientStats.query.get(first)
+    assert (stats.health_records_count, stats.nutrition_plans_count) == (2, 0)
+    assert stats.last_checkup_at is not None
+    assert PatientStats.query.get(second).nutrition_plans_count == 1
+
+
+def test_batch_is_rejected_when_nothing_is_valid(client, people):
+    response = client.post('/patients/records:batch', json={'items': [{'type': 'health_record'}]},
+                           headers=people['nurse_headers'])
+    assert response.status_code == 400
+    assert client.post('/patients/records:batch', json={'items': []},
+                       headers=people['nurse_headers']).status_code == 400
+    assert client.post('/patients/records:batch', json={'items': []},
+                       headers=people['patient_headers']).status_code == 403
+
+
+@pytest.mark.parametrize('size', [4, 40])
+def test_batch_statement_count_does_not_grow_with_items(client, people, size):
+    patient_ids = make_patients(4)
+    items = [
+        {'type': 'health_record', 'patient_id': patient_ids[i % 4], 'checkup_notes': f'note {i}'} if i % 2 else
+        {'type': 'nutrition_plan', 'patient_id': patient_ids[i % 4], 'diet_plan': f'plan {i}'}
+        for i in range(size)
+    ]
+
+    with count_queries() as statements:
+        response = client.post('/patients/records:batch', json={'items': items}, headers=people['nurse_headers'])
+
+    assert response.status_code == 201
+    assert response.get_json()['created'] == size
+    # To hand back each new id, SQLAlchemy inserts row by row on SQLite and
+    # MySQL (all in the one transaction). Everything else is fixed: user
+    # lookup, one patient check and one stats update per patient.
+    other = [sql for sql in statements if not sql.startswith('INSERT INTO health_records')
+             and not sql.startswith('INSERT INTO nutrition_plans')]
+    assert len(other) <= 2 + 4 * 2
+    assert sum(1 for sql in other if 'FROM patients' in sql) == 1
+
+
+# Streaming exports
+
+def test_export_streams_rows_and_continues_from_watermark(client, people, monkeypatch):
+    seed_records(people['patient'], people['nurse'], 5)
+    headers = people['nurse_headers']
+    monkeypatch.setitem(client.application.config, 'EXPORT_SAFETY_LAG_SECONDS', 0)
+
+    response = client.get('/exports/health_records', headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['checkup_notes'] for row in rows] == [f'checkup {i}' for i in range(5)]
+    watermark = response.headers['X-Export-Watermark']
+
+    for i in range(2):
+        db.session.add(NutritionPlan(patient_id=people['patient'].id, nurse_id=people['nurse'].id,
+                                     diet_plan=f'new plan {i}', created_at=datetime.utcnow()))
+    db.session.commit()
+    response = client.get('/exports/nutrition_plans', query_string={'since': watermark, 'format': 'csv'},
+                          headers=headers)
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'id,patient_id,nurse_id,diet_plan,created_at'
+    assert [line.split(',')[3] for line in lines[1:]] == ['new plan 0', 'new plan 1']
+
+    assert client.get('/exports/users', headers=headers).status_code == 404
+    assert client.get('/exports/chat_history', query_string={'since': 'yesterday'},
+                      headers=headers).status_code == 400
+    assert client.get('/exports/chat_history', headers=people['patient_headers']).status_code == 403
+
+
+def test_export_watermark_leaves_room_for_rows_committed_late(app, people):
+    # Stamped before the first export starts, committed after it has read
+    stamped = datetime.utcnow()
+    first = Export('nutrition_plans', lag=timedelta(minutes=5))
+    assert ''.join(first.chunks()) == ''
+    db.session.add(NutritionPlan(patient_id=people['patient'].id, nurse_id=people['nurse'].id,
+                                 diet_plan='late plan', created_at=stamped))
+    db.session.commit()
+
+    assert first.until < stamped
+    second = Export('nutrition_plans', since=parse_watermark(first.watermark), lag=timedelta(0))
+    assert 'late plan' in ''.join(second.chunks())
+
+
+def export_peak_memory(rows):
+    chat = ChatHistory.__table__
+    db.session.execute(chat.delete())
+    db.session.execute(chat.insert(), [
+        {'user_id': 1, 'role': 'user', 'message': f'message number {i} ' * 4,
+         'created_at': datetime(2024, 1, 1) + timedelta(seconds=i)}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+    data_export = Export('chat_history', 'csv', batch_size=500)
+    tracemalloc.start()
+    for chunk in data_export.chunks(chunk_size=16 * 1024):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert data_export.rows == rows
+    return peak
+
+
+def test_export_memory_does_not_grow_with_rows(app):
+    small = export_peak_memory(2000)
+    large = export_peak_memory(20000)
+    assert large < small * 2
+
+
+# Nurse worklist
+
+def test_worklist_orders_by_last_checkup_and_pages(client, people):
+    own_id = people['patient'].id
+    patient_ids = make_patients(5)
+    now = datetime.utcnow()
+    for days, patient_id in zip([3, 40, 10], patient_ids):
+        PatientStats.bump(patient_id, last_checkup_at=now - timedelta(days=days))
+    db.session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        response = client.get('/patients', query_string={'limit': 2, **({'cursor': cursor} if cursor else {})},
+                              headers=people['nurse_headers'])
+        assert response.status_code == 200
+        body = response.get_json()
+        seen.extend(body['patients'])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+
+    # Never checked (by id) first, then the most overdue
+    ids = [patient['id'] for patient in seen]
+    assert ids == [own_id, patient_ids[3], patient_ids[4],
+                   patient_ids[1], patient_ids[2], patient_ids[0]]
+    assert seen[0]['last_health_checkup'] is None and seen[0]['name'] == 'Pat Doe'
+
+    stale = client.get('/patients', query_string={'stale_days': 7, 'order': 'desc'},
+                       headers=people['nurse_headers']).get_json()['patients']
+    assert [patient['id'] for patient in stale][:2] == [patient_ids[2], patient_ids[1]]
+    assert len(stale) == 5
+
+    assert client.get('/patients', headers=people['patient_headers']).status_code == 403
+    assert client.get('/patients', query_string={'stale_days': 'x'},
+                      headers=people['nurse_headers']).status_code == 400
+
+
+def test_worklist_filters_by_hospital_in_a_few_queries(client, people, monkeypatch):
+    monkeypatch.setattr(routes.chatbot, 'get_ai_response',
+                        lambda user_message, user_role, use_cache=True: 'Rest.')
+    own_id = people['patient'].id
+    patient_ids = make_patients(100)
+    other_user = User(name='Nurse Mercy', email='mercy@hospital.com', role='nurse', password_hash='x')
+    db.session.add(other_user)
+    db.session.flush()
+    other_nurse = Nurse(user_id=other_user.id, specialization='General', hospital='Mercy')
+    db.session.add(other_nurse)
+    db.session.flush()
+    db.session.add(HealthRecord(patient_id=patient_ids[0], nurse_id=other_nurse.id, checkup_notes='Fine'))
+    db.session.add(NutritionPlan(patient_id=patient_ids[1], nurse_id=people['nurse'].id, diet_plan='Greens'))
+    db.session.add(HealthRecord(patient_id=people['patient'].id, nurse_id=people['nurse'].id,
+                                checkup_notes='Fine'))
+    db.session.commit()
+    client.post('/chatbot/chat', json={'message': 'Hello'}, headers=people['patient_headers'])
+
+    response = client.get('/patients', query_string={'hospital': 'City General'},
+                          headers=people['nurse_headers'])
+    patients = response.get_json()['patients']
+    assert sorted(patient['id'] for patient in patients) == sorted([own_id, patient_ids[1]])
+    assert {patient['id']: patient['chat_interactions_this_week'] for patient in patients}[own_id] == 2
+
+    db.session.expunge_all()
+    with count_queries() as statements:
+        response = client.get('/patients', query_string={'limit': 100}, headers=people['nurse_headers'])
+    assert len(response.get_json()['patients']) == 100
+    # current user, the page, and the page's chat counts
+    assert len(statements) == 3
+
+
+# Conditional GETs
+
+@pytest.mark.parametrize('path', ['/patients/{id}', '/patients/{id}/records', '/patients/{id}/nutrition',
+                                  '/reports/{id}/summary'])
+def test_unchanged_resources_get_304_until_the_patient_changes(client, people, path):
+    patient_id = people['patient'].id
+    url = path.format(id=patient_id)
+    headers = people['nurse_headers']
+
+    first = client.get(url, headers=headers)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+
+    db.session.expunge_all()
+    with count_queries() as statements:
+        cached = client.get(url, headers={**headers, 'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+    # current user and the patient with its version, nothing else
+    assert len(statements) == 2
+
+    client.post(f'/patients/{patient_id}/records', json={'checkup_notes': 'New'}, headers=headers)
+    changed = client.get(url, headers={**headers, 'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+
+def test_last_modified_and_profile_updates(client, people):
+    patient_id = people['patient'].id
+    headers = people['patient_headers']
+    client.put(f'/patients/{patient_id}/update', json={'age': 41}, headers=people['nurse_headers'])
+
+    first = client.get(f'/patients/{patient_id}', headers=headers)
+    assert first.last_modified is not None
+    since = first.headers['Last-Modified']
+    assert client.get(f'/patients/{patient_id}', headers={**headers, 'If-Modified-Since': since}).status_code == 304
+
+    etag = first.headers['ETag']
+    client.put(f'/patients/{patient_id}/update', json={'age': 42}, headers=people['nurse_headers'])
+    response = client.get(f'/patients/{patient_id}', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200 and response.get_json()['age'] == 42
+
+
+# Database pool metrics
+
+def test_pool_metrics_track_checkouts_waits_and_invalidations(tmp_path, monkeypatch):
+    class PooledTestingConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'pool.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 1,
+                                     'pool_pre_ping': True}
+
+    monkeypatch.setitem(config, 'pooled-testing', PooledTestingConfig)
+    app = create_app('pooled-testing')
+    with app.app_context():
+        db.create_all()
+        nurse_user = User(name='Nurse Joy', email='joy@hospital.com', role='nurse', password_hash='x')
+        db.session.add(nurse_user)
+        db.session.flush()
+        db.session.add(Nurse(user_id=nurse_user.id, specialization='General', hospital='City General'))
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=nurse_user.id)}'}
+        db.session.remove()
+
+        # Hold the only connection so the next checkout times out
+        held = db.engine.connect()
+        with pytest.raises(Exception):
+            with db.engine.connect():
+                pass
+        held.invalidate()
+        held.close()
+
+    stats = app.test_client().get('/internal/pool-stats', headers=headers).get_json()['pools']['default']
+    assert stats['timeouts'] == 1
+    assert stats['wait_ms_max'] >= 1000
+    assert stats['invalidations'] == 1
+    assert stats['checkouts'] >= 3 and stats['connects'] >= 2
+    # the stats request itself holds the one connection
+    assert stats['size'] == 1 and stats['checked_out'] == 1
+
+
+
+# Read replicas
+
+def test_reads_go_to_the_replica_and_writers_read_their_writes(tmp_path, monkeypatch):
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+
+    class ReplicatedTestingConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{primary}'
+        SQLALCHEMY_BINDS = {'replica_0': f'sqlite:///{replica}'}
+        SQLALCHEMY_READ_REPLICAS = ['replica_0']
+
+    monkeypatch.setitem(config, 'replicated-testing', ReplicatedTestingConfig)
+    # db is shared by every app in this process; keep the replica bind out of later tests
+    monkeypatch.setattr(db, 'metadatas', dict(db.metadatas))
+    app = create_app('replicated-testing')
+    with app.app_context():
+        db.create_all()
+        nurse_user = User(name='Nurse Joy', email='joy@hospital.com', role='nurse', password_hash='x')
+        patient_user = User(name='Pat Doe', email='pat@email.com', role='patient', password_hash='x')
+        db.session.add_all([nurse_user, patient_user])
+        db.session.flush()
+        db.session.add(Nurse(user_id=nurse_user.id, specialization='General', hospital='City General'))
+        db.session.add(Patient(user_id=patient_user.id, age=40, gender='female'))
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=nurse_user.id)}'}
+        patient_headers = {'Authorization': f'Bearer {create_access_token(identity=patient_user.id)}'}
+        db.session.remove()
+        db.engine.dispose()
+
+    # The replica starts as a copy of the primary and then stops replicating
+    shutil.copy(primary, replica)
+
+    # Like the cross-origin SPA: bearer tokens, no cookies
+    client = app.test_client(use_cookies=False)
+    assert client.get('/patients/1/records', headers=headers).get_json()['records'] == []
+    assert client.post('/patients/1/records', json={'checkup_notes': 'Fine'}, headers=headers).status_code == 201
+
+    # The writer reads the primary; other users still read the lagging replica
+    assert len(client.get('/patients/1/records', headers=headers).get_json()['records']) == 1
+    assert client.get('/patients/1/records', headers=patient_headers).get_json()['records'] == []
+
+    # A new account has no token until register returns one; it reads its profile from the primary
+    response = client.post('/auth/register', json={'name': 'New Patient', 'email': 'new@email.com',
+                                                   'password': 'secret123', 'role': 'patient', 'age': 30,
+                                                   'gender': 'male'})
+    assert response.status_code == 201
+    token = response.get_json()['access_token']
+    assert client.get('/auth/profile', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+
+
+# Chat retention
+
+def add_chats(user_id, count, created_at):
+    db.session.execute(ChatHistory.__table__.insert(), [
+        {'user_id': user_id, 'role': 'user', 'message': f'Is my diet ok {i}?', 'topics': ',nutrition,',
+         'created_at': created_at}
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def test_old_chats_are_archived_in_batches_and_stats_survive(client, people):
+    patient = people['patient']
+    patient_id, user_id = patient.id, patient.user_id
+    add_chats(user_id, 7, datetime.utcnow() - timedelta(days=120))
+    add_chats(user_id, 2, datetime.utcnow())
+    rebuild_patient_stats()
+    before = PatientStats.query.get(patient_id).to_dict()
+
+    with count_queries() as statements:
+        assert archive_chats(90, batch_size=3) == 7
+    assert sum(1 for sql in statements if sql.startswith('DELETE')) == 3
+
+    assert ChatHistory.query.count() == 2
+    assert ChatHistoryArchive.query.count() == 7
+    rebuild_patient_stats()
+    assert PatientStats.query.get(patient_id).to_dict() == before
+
+
+def test_clear_history_deletes_in_chunks(client, people, monkeypatch):
+    patient = people['patient']
+    add_chats(patient.user_id, 5, datetime.utcnow() - timedelta(days=120))
+    archive_chats(90)
+    add_chats(patient.user_id, 7, datetime.utcnow())
+    monkeypatch.setitem(client.application.config, 'CHAT_DELETE_BATCH_SIZE', 3)
+
+    with count_queries() as statements:
+        response = client.delete('/chatbot/clear-history', headers=people['patient_headers'])
+
+    assert response.get_json()['deleted'] == 12
+    assert ChatHistory.query.count() == 0 and ChatHistoryArchive.query.count() == 0
+    # 7 live rows in batches of 3, then 5 archived ones
+    assert sum(1 for sql in statements if sql.startswith('DELETE')) == 3 + 2
+
+
+def test_clear_history_resets_stats_with_the_last_batch(client, people, monkeypatch):
+    patient = people['patient']
+    add_chats(patient.user_id, 4, datetime.utcnow())
+    rebuild_patient_stats()
+    monkeypatch.setitem(client.application.config, 'CHAT_DELETE_BATCH_SIZE', 3)
+
+    with count_queries() as statements:
+        def commit(conn):
+            statements.append('COMMIT')
+
+        event.listen(db.engine, 'commit', commit)
+        try:
+            response = client.delete('/chatbot/clear-history', headers=people['patient_headers'])
+        finally:
+            event.remove(db.engine, 'commit', commit)
+    assert response.status_code == 200
+
+    # The stats reset is committed with the deletion of the last batch, not after it
+    writes = [sql.split()[0] for sql in statements if sql.split()[0] in ('DELETE', 'UPDATE', 'COMMIT')]
+    assert writes[-3:] == ['DELETE', 'UPDATE', 'COMMIT']
+    assert writes.count('UPDATE') == 1
+    stats = PatientStats.query.get(patient.id)
+    assert (stats.chat_messages_count, stats.last_chat_at) == (0, None)
+
+
+# Chat history pages
+
+def add_turns(user_id, turns, base=datetime(2024, 1, 1)):
+    """Insert (turn_id, role) messages one second apart"""
+    db.session.execute(ChatHistory.__table__.insert(), [
+        {'user_id': user_id, 'role': role, 'message': f'{role} {i}', 'turn_id': turn_id,
+         'created_at': base + timedelta(seconds=i)}
+        for i, (turn_id, role) in enumerate(turns)
+    ])
+    db.session.commit()
+
+
+def test_chat_history_pages_by_cursor_and_groups_turns(client, people):
+    turns = []
+    for i in range(6):
+        turns.append((f'turn{i}', 'user'))
+        if i != 2:  # the AI call for this question failed
+            turns.append((f'turn{i}', 'assistant'))
+    turns.append((None, 'user'))
+    add_turns(people['patient'].user_id, turns)
+
+    pages, cursor = [], None
+    while True:
+        query = {'limit': 4, **({'before': cursor} if cursor else {})}
+        body = client.get('/chatbot/history', query_string=query, headers=people['patient_headers']).get_json()
+        pages.append(body['conversations'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+
+    assert len(pages) == 3
+    messages = [chat for page in reversed(pages) for conversation in page for chat in conversation]
+    assert [chat['id'] for chat in messages] == sorted(chat['id'] for chat in messages)
+    assert len(messages) == len(turns)
+
+    merged = {}
+    for chat in messages:
+        merged.setdefault(chat['turn_id'] or chat['id'], []).append(chat['role'])
+    assert merged['turn2'] == ['user']
+    assert all(merged[f'turn{i}'] == ['user', 'assistant'] for i in (0, 1, 3, 4, 5))
+
+    response = client.get('/chatbot/history', query_string={'before': 'nope'}, headers=people['patient_headers'])
+    assert response.status_code == 400
+
+
+def test_legacy_chats_are_paired_into_turns(app, people):
+    patient_user, nurse_user = people['patient'].user_id, people['nurse'].user_id
+    add_turns(patient_user, [(None, 'user'), (None, 'assistant'), (None, 'user'), (None, 'user'),
+                             (None, 'assistant'), (None, 'assistant'), ('kept', 'user'), ('kept', 'assistant')])
+    add_turns(nurse_user, [(None, 'assistant'), (None, 'user'), (None, 'assistant')])
+
+    assert pair_legacy_chat_turns(batch_size=2) == 9
+
+    def roles_by_turn(user_id):
+        chats = ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.created_at, ChatHistory.id)
+        turns = {}
+        for chat in chats:
+            turns.setdefault(chat.turn_id, []).append(chat.role)
+        return list(turns.values())
+
+    assert roles_by_turn(patient_user) == [['user', 'assistant'], ['user'], ['user', 'assistant'], ['assistant'],
+                                           ['user', 'assistant']]
+    assert roles_by_turn(nurse_user) == [['assistant'], ['user', 'assistant']]
+    assert ChatHistory.query.filter(ChatHistory.turn_id.is_(None)).count() == 0
+
+
+# Metrics and health
+
+def metric_value(text, line_start):
+    return next(float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if line.startswith(line_start))
+
+
+def test_metrics_record_latency_status_and_queries_per_route(client, people, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'METRICS_TOKEN', 'scrape-secret')
+    patient_id = people['patient'].id
+    for _ in range(3):
+        assert client.get(f'/patients/{patient_id}', headers=people['nurse_headers']).status_code == 200
+    client.get('/patients/999999', headers=people['nurse_headers'])
+    client.get('/no/such/page')
+
+    with count_queries() as statements:
+        text = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).get_data(as_text=True)
+    assert statements == []
+
+    route = 'blueprint="patients",route="/patients/<int:id>"'
+    assert metric_value(text, f'http_requests_total{{method="GET",{route},status="200"}}') == 3
+    assert metric_value(text, f'http_requests_total{{method="GET",{route},status="404"}}') == 1
+    assert metric_value(text, 'http_requests_total{method="GET",blueprint="app",route="unmatched",status="404"}') == 1
+    assert metric_value(text, f'http_request_duration_seconds_count{{{route}}}') == 4
+    assert metric_value(text, f'http_request_duration_seconds_bucket{{{route},le="+Inf"}}') == 4
+    assert metric_value(text, f'db_queries_total{{{route}}}') >= 4
+    assert metric_value(text, f'db_query_duration_seconds_total{{{route}}}') > 0
+    assert metric_value(text, 'http_requests_in_flight{blueprint="patients"}') == 0
+    # The scrape itself is in flight while it renders
+    assert metric_value(text, 'http_requests_in_flight{blueprint="app"}') == 1
+
+
+def test_metrics_token_is_required_when_configured(client, people, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'METRICS_TOKEN', 'scrape-secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers=people['nurse_headers']).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+
+
+def test_metrics_without_a_token_are_for_nurses_only(client, people):
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers=people['patient_headers']).status_code == 403
+    assert client.get('/metrics', headers=people['nurse_headers']).status_code == 200
+
+
+def test_ai_attempts_are_timed_per_outcome(stub_provider):
+    registry = RequestMetrics()
+    client = make_client(stub_provider([503]).url)
+    client.latency_observer = registry.observe_ai
+
+    client.complete([{'role': 'user', 'content': 'hi'}])
+
+    text = registry.render()
+    assert metric_value(text, 'ai_upstream_duration_seconds_count{outcome="503"}') == 1
+    assert metric_value(text, 'ai_upstream_duration_seconds_count{outcome="200"}') == 1
+
+
+def test_deep_health_check_is_cached(client, monkeypatch, caplog):
+    with count_queries() as statements:
+        assert client.get('/health').get_json().get('databases') is None
+        for _ in range(3):
+            body = client.get('/health?deep=1').get_json()
+    assert body['databases']['default']['status'] == 'ok'
+    assert statements.count('SELECT 1') == 1
+
+    def unreachable():
+        raise RuntimeError('server has gone away')
+
+    check = client.application.extensions['database_check']
+    monkeypatch.setattr(check, 'ttl', 0)
+    monkeypatch.setattr(db.engine, 'connect', unreachable)
+    response = client.get('/health?deep=1')
+    assert response.status_code == 503
+    assert response.get_json()['databases']['default'] == {'status': 'error'}
+    assert 'server has gone away' in caplog.text
+
+
+# SQL profiler
+
+@pytest.mark.parametrize('url, budget', [
+    ('/patients', 3),
+    ('/patients/{id}', 3),
+    ('/patients/{id}/records', 3),
+    ('/patients/{id}/nutrition', 3),
+    ('/reports/{id}', 8),
+    ('/reports/{id}/summary', 2),
+])
+def test_nurse_views_run_no_repeated_statements(client, people, url, budget):
+    patient_id = people['patient'].id
+    seed_records_from_many_nurses(patient_id, 10, prefix='n')
+
+    with sql_profiler.capture(client.application) as profiles:
+        assert client.get(url.format(id=patient_id), headers=people['nurse_headers']).status_code == 200
+
+    [profile] = profiles
+    assert profile.repeated() == {}
+    assert profile.count <= budget
+
+
+def test_profiler_flags_n_plus_one_and_slow_statements(app, client, people, monkeypatch, caplog):
+    @app.route('/test/lazy-records')
+    def lazy_records():
+        return {'nurses': [record.nurse.user.name for record in HealthRecord.query.all()]}
+
+    seed_records_from_many_nurses(people['patient'].id, 5, prefix='lazy')
+    profiler = app.extensions['sql_profiler']
+    monkeypatch.setattr(profiler, 'allow_header', True)
+    monkeypatch.setattr(profiler, 'slow_seconds', 0)
+
+    assert sql_profiler.PROFILE_HEADER not in client.get('/test/lazy-records').headers
+    with caplog.at_level('WARNING'):
+        response = client.get('/test/lazy-records', headers={sql_profiler.PROFILE_HEADER: '1'})
+
+    # One query for the records, then a nurse and a user query per record
+    assert response.headers[sql_profiler.PROFILE_HEADER].startswith('queries=11; ')
+    assert response.headers[sql_profiler.PROFILE_HEADER].endswith('repeated=2; max_repeat=5')
+    assert sum('Possible N+1 in GET /test/lazy-records: statement run 5 times' in message
+               for message in caplog.messages) == 2
+    assert sum(message.startswith('Slow SQL') for message in caplog.messages) == 11
+
+
+# Synthetic data
+
+def test_seed_bulk_inserts_consistent_repeatable_data(app):
+    with count_queries() as statements:
+        counts = seed(12, nurses=2, records_per_patient=4, plans_per_patient=2, chats_per_patient=6, chunk_size=25)
+    counts.pop('seconds')
+    assert counts == {'users': 14, 'nurses': 2, 'patients': 12, 'health_records': 48, 'nutrition_plans': 24,
+                      'chat_history': 72, 'patient_stats': 12}
+    # Chunks of 25 rows rather than a statement per row
+    assert sum(1 for sql in statements if sql.startswith('INSERT')) == 1 + 1 + 1 + 2 + 1 + 3 + 1
+
+    # The stats written alongside the rows match a rebuild from the tables
+    seeded = {stats.patient_id: stats.to_dict() for stats in PatientStats.query}
+    rebuild_patient_stats()
+    assert {stats.patient_id: stats.to_dict() for stats in PatientStats.query} == seeded
+
+    users = User.query.order_by(User.id).all()
+    assert len({user.password_hash for user in users}) == 1 and users[0].check_password('password123')
+
+    # Activity falls after the patient signed up, checkups on weekdays
+    for patient in Patient.query:
+        records = patient.health_records.all()
+        activity = [row.created_at for row in records + patient.nutrition_plans.all()]
+        activity += [chat.created_at for chat in patient.user.chat_messages]
+        assert min(activity) >= patient.user.created_at
+        assert all(record.created_at.weekday() < 5 for record in records)
+    assert pair_legacy_chat_turns() == 0
+
+    def content():
+        return [(chat.user_id, chat.role, chat.message, chat.turn_id) for chat in ChatHistory.query.order_by(ChatHistory.id)]
+
+    first = content()
+    db.drop_all()
+    db.create_all()
+    seed(12, nurses=2, records_per_patient=4, plans_per_patient=2, chats_per_patient=6, chunk_size=25)
+    assert content() == first
+
+    # Seeding again adds to the data set without clashing ids or emails
+    assert seed(3, records_per_patient=1, plans_per_patient=0, chats_per_patient=2)['patients'] == 3
+    assert Patient.query.count() == 15
+
+
+# JSON serialization
+
+def test_serialize_matches_to_dict_with_either_encoder(app, people):
+    seed(4, nurses=2, records_per_patient=3, plans_per_patient=2, chats_per_patient=4)
+    seed_records(people['patient'], people['nurse'], 2)
+    archive_chats(-1, batch_size=5)
+    models = [User, Patient, Nurse, HealthRecord, NutritionPlan, ChatHistoryArchive, PatientStats]
+
+    for provider in (json_provider.StdlibJSONProvider(app), json_provider.OrjsonProvider(app)):
+        for model in models:
+            rows = model.query.all()
+            assert rows
+            assert json.loads(provider.dumps([row.serialize() for row in rows])) == [row.to_dict() for row in rows]
+
+    # Expired rows are read through their attributes, which reload them
+    record = HealthRecord.query.first()
+    db.session.expire(record)
+    assert json.loads(app.json.dumps(record.serialize())) == record.to_dict()
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+def test_responses_are_the_same_with_either_encoder(app, client, people, monkeypatch):
+    patient_id = people['patient'].id
+    seed_records_from_many_nurses(patient_id, 3, prefix='json')
+    assert isinstance(app.json, json_provider.OrjsonProvider)
+
+    bodies = {}
+    for provider in (json_provider.StdlibJSONProvider, json_provider.OrjsonProvider):
+        app.json = provider(app)
+        for url in [f'/patients/{patient_id}', f'/patients/{patient_id}/records', f'/reports/{patient_id}']:
+            response = client.get(url, headers=people['nurse_headers'])
+            assert response.status_code == 200 and response.mimetype == 'application/json'
+            body = response.get_json()
+            body.get('report', {}).pop('report_generated_at', None)
+            bodies.setdefault(url, []).append(body)
+    assert all(stdlib == fast for stdlib, fast in bodies.values())
+
+    extras = {'price': Decimal('1.50'), 'id': uuid.UUID(int=1), 'day': date(2024, 1, 2), 'point': Point(1, 2)}
+    expected = {'price': '1.50', 'id': str(uuid.UUID(int=1)), 'day': '2024-01-02', 'point': {'x': 1, 'y': 2}}
+    for provider in (json_provider.StdlibJSONProvider, json_provider.OrjsonProvider):
+        assert json.loads(provider(app).dumps(extras)) == expected
+        with pytest.raises(TypeError):
+            provider(app).dumps({'value': object()})
+
+    monkeypatch.setattr(json_provider, 'orjson', None)
+    assert json_provider.provider_class('auto') is json_provider.StdlibJSONProvider
+    with pytest.raises(RuntimeError):
+        json_provider.provider_class('orjson')
@@ -0,0 +1,131 @@
+"""
+Chat topic analysis
+
+Tags patient chat messages as health related, nutrition related, or any
+extra topic configured through CHAT_TOPICS_EXTRA. All keywords of all topics
+are compiled into one trie-shaped regular expression, so a message is
+classified in a single pass no matter how long the keyword lists grow.
+
+A keyword matches at the start of a word and may carry a suffix: "symptom"
+matches "symptoms", but "pain" does not match "Spain".
+
+User messages are classified once when they are saved; the result is
+stored in ChatHistory.topics as ",health,nutrition," so reports can count
+topics in SQL.
+"""
+
+import re
+
+from flask import current_app, has_app_context
+
+HEALTH_KEYWORDS = ['health', 'symptom', 'pain', 'medicine', 'treatment', 'doctor']
+NUTRITION_KEYWORDS = ['diet', 'food', 'nutrition', 'vitamin', 'meal', 'eating']
+
+TOPIC_KEYWORDS = {
+    'health': HEALTH_KEYWORDS,
+    'nutrition': NUTRITION_KEYWORDS,
+}
+
+def _trie_pattern(words):
+    """Regex alternation for words, factored on common prefixes
+
+    Longer words win over their prefixes ("dietitian" over "diet") because
+    every optional continuation is greedy.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        group = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            return (group if len(branches) > 1 else '(?:' + group + ')') + '?'
+        return group
+
+    return build(trie)
+
+class TopicClassifier:
+    """Single-pass multi-keyword topic matcher"""
+
+    def __init__(self, topic_keywords):
+        self.topics = tuple(topic_keywords)
+        self._topics_by_keyword = {}
+        for topic, keywords in topic_keywords.items():
+            for keyword in keywords:
+                keyword = keyword.strip().lower()
+                if keyword:
+                    self._topics_by_keyword.setdefault(keyword, set()).add(topic)
+
+        # The regex reports the longest keyword at a word start; a shorter
+        # keyword that is its prefix matched that word too
+        for keyword, topics in self._topics_by_keyword.items():
+            for end in range(1, len(keyword)):
+                topics |= self._topics_by_keyword.get(keyword[:end], set())
+
+        # Messages are lowercased before matching, which is cheaper than
+        # re.IGNORECASE. The lookahead on first letters lets the regex engine
+        # skip words that cannot start a keyword.
+        self._pattern = None
+        if self._topics_by_keyword:
+            first_letters = ''.join(sorted({re.escape(keyword[0]) for keyword in self._topics_by_keyword}))
+            self._pattern = re.compile(
+                r'\b(?=[' + first_letters + r'])(' + _trie_pattern(self._topics_by_keyword) + ')'
+            )
+
+    def classify(self, message):
+        """Return the frozenset of topics a message mentions"""
+        if self._pattern is None:
+            return frozenset()
+        found = set()
+        for keyword in self._pattern.findall(message.lower()):
+            found.update(self._topics_by_keyword[keyword])
+        return frozenset(found)
+
+def parse_extra_topics(value):
+    """Parse "topic:kw1,kw2;other:kw3" into {'topic': ['kw1', 'kw2'], 'other': ['kw3']}"""
+    extra = {}
+    for entry in filter(None, (part.strip() for part in (value or '').split(';'))):
+        topic, _, keywords = entry.partition(':')
+        extra.setdefault(topic.strip().lower(), []).extend(
+            keyword.strip() for keyword in keywords.split(',') if keyword.strip()
+        )
+    return extra
+
+def build_classifier(extra_topics=None):
+    """Classifier for the built-in topics plus any extra ones"""
+    topic_keywords = {topic: list(keywords) for topic, keywords in TOPIC_KEYWORDS.items()}
+    for topic, keywords in (extra_topics or {}).items():
+        topic_keywords.setdefault(topic, []).extend(keywords)
+    return TopicClassifier(topic_keywords)
+
+_default_classifier = build_classifier()
+
+def init_app(app):
+    """Build the topic classifier for this app from CHAT_TOPICS_EXTRA"""
+    app.extensions['topic_classifier'] = build_classifier(
+        parse_extra_topics(app.config.get('CHAT_TOPICS_EXTRA'))
+    )
+
+def get_classifier():
+    """The current app's classifier, or the built-in one outside an app"""
+    if has_app_context():
+        return current_app.extensions.get('topic_classifier', _default_classifier)
+    return _default_classifier
+
+def message_topics(message):
+    """Return the set of topics a chat message mentions"""
+    return get_classifier().classify(message)
+
+def encode_topics(topics):
+    """Value stored in ChatHistory.topics for a set of topics"""
+    return ',' + ','.join(sorted(topics)) + ',' if topics else ''
+
+def has_topic(column, topic):
+    """SQL condition: the encoded topics column contains topic"""
+    return column.like(f'%,{topic},%')